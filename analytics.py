@@ -0,0 +1,371 @@
+import argparse
+import datetime
+import json
+import os
+import threading
+
+import numpy as np
+
+from event_stream import iter_events, read_total_duration
+from run_archive import ArchiveReader
+from run_index import RUN_FILE_PATTERN, sidecar_path
+
+# Performance analytics across all runs in the log folder.
+# Timings from finished runs (search times, waits, page source fetches, startup,
+# Appium command durations from driver.get_events()) are ingested into columnar
+# NumPy files in appium_logs/analytics/: samples.<column>.npy with one row per
+# timing and runs.<column>.npy with one row per run. manifest.json holds the
+# ingested run ids and the string tables, so ingesting again reads only new runs.
+# Only finished runs are ingested, a run is never read again once it is stored.
+ANALYTICS_DIR_NAME = "analytics"
+MANIFEST_NAME = "manifest.json"
+# Stored columns of another version are ingested again
+ANALYTICS_VERSION = 2
+SAMPLE_COLUMNS = {"run": np.int32, "step": np.int32, "value": np.float64}
+RUN_COLUMNS = {"device": np.int32, "platform_version": np.int32, "build": np.int32, "started": np.float64}
+STRING_FIELDS = ("step", "device", "platform_version", "build")
+GROUP_FIELDS = ("step", "device", "platform_version", "build")
+PERCENTILES = (50, 95, 99)
+# Candidate p50 this much slower than baseline p50 is a regression
+REGRESSION_THRESHOLD = 0.2
+# Differences below this are noise for sub-second timings
+MIN_REGRESSION_DELTA = 0.05
+
+
+def event_samples(event):
+    # (step, seconds) timings found in one event
+    event_type = event.get("type")
+    details = event.get("details")
+    if not isinstance(details, dict):
+        return []
+    if event_type in ("element_found", "element_located") and details.get("search_time") is not None:
+        return [(f"{event_type}:{details.get('element')}", details["search_time"])]
+    if event_type == "wait" and details.get("duration") is not None:
+        return [(f"wait:{details.get('condition')}", details["duration"])]
+    if event_type == "page_snapshot" and details.get("fetch_time") is not None:
+        return [(f"page_snapshot:{details.get('name')}", details["fetch_time"])]
+    if event_type == "startup_metrics":
+        return [(f"startup:{name}", details[name]) for name in ("time_to_first_action", "session_time")
+                if details.get(name) is not None]
+    if event_type == "appium_events":
+        commands = (details.get("events") or {}).get("commands", [])
+        return [(f"command:{command['cmd']}", (command["endTime"] - command["startTime"]) / 1000)
+                for command in commands if "cmd" in command and "startTime" in command and "endTime" in command]
+    return []
+
+
+def read_run(path, json_file=None):
+    # Run information and timings from JSONL or JSON log
+    if path.endswith(".jsonl"):
+        events = (event for _, event in iter_events(path))
+        total_duration = read_total_duration(json_file) if json_file else None
+    elif path.endswith(".arun"):
+        archive = ArchiveReader(path)
+        events = archive.iter_events()
+        total_duration = archive.summary["total_duration"]
+    else:
+        with open(path) as f:
+            data = json.load(f)
+        events = data.get("events", [])
+        total_duration = data.get("total_duration")
+
+    info = {"device": None, "platform_version": None, "build": None, "started": None}
+    samples = []
+    for event in events:
+        if info["started"] is None and event.get("timestamp"):
+            info["started"] = event["timestamp"]
+        if event.get("type") == "device_info":
+            details = event.get("details") or {}
+            capabilities = details.get("capabilities", {})
+            info["device"] = capabilities.get("deviceUDID") or capabilities.get("deviceName")
+            info["platform_version"] = details.get("platform_version")
+            info["build"] = details.get("build")
+        samples.extend(event_samples(event))
+    if total_duration is not None:
+        samples.append(("run:total_duration", total_duration))
+    return info, samples
+
+
+def run_finished(log_dir, run_id, present):
+    # Sidecar is written when the run is saved, older logs have only the finished JSON log
+    if os.path.basename(sidecar_path(log_dir, run_id)) in present or f"appium_events_{run_id}.arun" in present:
+        return True
+    try:
+        return read_total_duration(os.path.join(log_dir, f"appium_events_{run_id}.json")) is not None
+    except OSError:
+        return False
+
+
+class AnalyticsStore:
+    def __init__(self, log_dir="appium_logs"):
+        self.log_dir = log_dir
+        self.root = os.path.join(log_dir, ANALYTICS_DIR_NAME)
+        self.lock = threading.Lock()
+        self._load()
+
+    def _path(self, table, column):
+        return os.path.join(self.root, f"{table}.{column}.npy")
+
+    def _load_column(self, table, column, dtype, rows):
+        # Columns can be longer than the manifest after an interrupted ingest
+        try:
+            return np.load(self._path(table, column))[:rows]
+        except (OSError, ValueError):
+            return np.zeros(0, dtype)
+
+    def _load(self):
+        try:
+            with open(os.path.join(self.root, MANIFEST_NAME)) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = {"run_ids": [], "rows": 0, "strings": {}}
+        if manifest.get("version") != ANALYTICS_VERSION:
+            manifest = {"run_ids": [], "rows": 0, "strings": {}}
+        self.run_ids = manifest["run_ids"]
+        self.known_runs = set(self.run_ids)
+        self.strings = {field: manifest["strings"].get(field, []) for field in STRING_FIELDS}
+        self.codes = {field: {value: code for code, value in enumerate(values)} for field, values in self.strings.items()}
+        self.samples = {column: self._load_column("samples", column, dtype, manifest["rows"])
+                        for column, dtype in SAMPLE_COLUMNS.items()}
+        self.runs = {column: self._load_column("runs", column, dtype, len(self.run_ids))
+                     for column, dtype in RUN_COLUMNS.items()}
+        if any(len(values) != manifest["rows"] for values in self.samples.values()) or \
+                any(len(values) != len(self.run_ids) for values in self.runs.values()):
+            # Missing or damaged columns, everything is ingested again
+            self.run_ids, self.known_runs = [], set()
+            self.strings = {field: [] for field in STRING_FIELDS}
+            self.codes = {field: {} for field in STRING_FIELDS}
+            self.samples = {column: np.zeros(0, dtype) for column, dtype in SAMPLE_COLUMNS.items()}
+            self.runs = {column: np.zeros(0, dtype) for column, dtype in RUN_COLUMNS.items()}
+
+    def _save(self):
+        os.makedirs(self.root, exist_ok=True)
+        for table, columns in (("samples", self.samples), ("runs", self.runs)):
+            for column, values in columns.items():
+                path = self._path(table, column)
+                with open(f"{path}.tmp", 'wb') as f:
+                    np.save(f, values)
+                os.replace(f"{path}.tmp", path)
+        # Manifest is written last, it decides which rows are valid
+        manifest = {"version": ANALYTICS_VERSION, "run_ids": self.run_ids, "rows": len(self.samples["run"]),
+                    "strings": self.strings}
+        path = os.path.join(self.root, MANIFEST_NAME)
+        with open(f"{path}.tmp", 'w') as f:
+            json.dump(manifest, f)
+        os.replace(f"{path}.tmp", path)
+
+    def _code(self, field, value):
+        value = "" if value is None else str(value)
+        codes = self.codes[field]
+        if value not in codes:
+            codes[value] = len(self.strings[field])
+            self.strings[field].append(value)
+        return codes[value]
+
+    def ingest(self):
+        # Reads runs which are finished (run_finished) and not ingested yet.
+        # Returns number of new runs.
+        with self.lock:
+            try:
+                names = os.listdir(self.log_dir)
+            except OSError:
+                return 0
+            present = set(names)
+            new_runs = []
+            for name in names:
+                match = RUN_FILE_PATTERN.match(name)
+                if match and match.group(2) in ("json", "arun") and match.group(1) not in self.known_runs \
+                        and run_finished(self.log_dir, match.group(1), present):
+                    new_runs.append(match.group(1))
+            if not new_runs:
+                return 0
+
+            samples = {column: [] for column in SAMPLE_COLUMNS}
+            runs = {column: [] for column in RUN_COLUMNS}
+            for run_id in sorted(new_runs):
+                json_file = os.path.join(self.log_dir, f"appium_events_{run_id}.json")
+                # JSONL stream is read event by event, old runs have only the JSON log
+                path = json_file
+                if f"appium_events_{run_id}.jsonl" in present:
+                    path = os.path.join(self.log_dir, f"appium_events_{run_id}.jsonl")
+                elif f"appium_events_{run_id}.json" not in present:
+                    path = os.path.join(self.log_dir, f"appium_events_{run_id}.arun")
+                try:
+                    info, run_samples = read_run(path, json_file)
+                except (OSError, ValueError, KeyError, TypeError) as e:
+                    print(f"Could not ingest run {run_id}: {e}")
+                    continue
+
+                run = len(self.run_ids)
+                self.run_ids.append(run_id)
+                self.known_runs.add(run_id)
+                for field in ("device", "platform_version", "build"):
+                    runs[field].append(self._code(field, info[field]))
+                try:
+                    runs["started"].append(datetime.datetime.fromisoformat(info["started"]).timestamp())
+                except (TypeError, ValueError):
+                    runs["started"].append(np.nan)
+                for step, value in run_samples:
+                    samples["run"].append(run)
+                    samples["step"].append(self._code("step", step))
+                    samples["value"].append(value)
+
+            for column, dtype in SAMPLE_COLUMNS.items():
+                self.samples[column] = np.concatenate([self.samples[column], np.array(samples[column], dtype)])
+            for column, dtype in RUN_COLUMNS.items():
+                self.runs[column] = np.concatenate([self.runs[column], np.array(runs[column], dtype)])
+            self._save()
+            return len(runs["started"])
+
+    def _columns(self):
+        # Sample columns joined with run columns
+        with self.lock:
+            samples = dict(self.samples)
+            runs = dict(self.runs)
+        run = samples["run"]
+        return {
+            "step": samples["step"],
+            "device": runs["device"][run],
+            "platform_version": runs["platform_version"][run],
+            "build": runs["build"][run],
+            "value": samples["value"]
+        }
+
+    def percentiles(self, group_by=("step",), step=None, device=None, platform_version=None, build=None):
+        # Rows with count, mean and p50/p95/p99 for every group, step filter is a name prefix
+        columns = self._columns()
+        mask = np.ones(len(columns["value"]), bool)
+        for field, value in (("device", device), ("platform_version", platform_version), ("build", build)):
+            if value is not None:
+                mask &= columns[field] == self.codes[field].get(str(value), -1)
+        if step:
+            step_codes = [code for code, name in enumerate(self.strings["step"]) if name.startswith(step)]
+            mask &= np.isin(columns["step"], step_codes)
+        if not mask.any():
+            return []
+
+        # One integer key per group, values are sorted by it and split into groups
+        key = np.zeros(int(mask.sum()), np.int64)
+        for field in group_by:
+            key = key * max(len(self.strings[field]), 1) + columns[field][mask]
+        order = np.argsort(key, kind="stable")
+        key = key[order]
+        values = columns["value"][mask][order]
+        starts = np.concatenate([[0], np.flatnonzero(np.diff(key)) + 1])
+
+        rows = []
+        for start, end in zip(starts, np.append(starts[1:], len(key))):
+            group = values[start:end]
+            codes = []
+            remainder = int(key[start])
+            for field in reversed(group_by):
+                remainder, code = divmod(remainder, max(len(self.strings[field]), 1))
+                codes.append(code)
+            row = {field: self.strings[field][code] for field, code in zip(group_by, reversed(codes))}
+            row["count"] = int(end - start)
+            row["mean"] = round(float(group.mean()), 4)
+            for percentile, value in zip(PERCENTILES, np.percentile(group, PERCENTILES)):
+                row[f"p{percentile}"] = round(float(value), 4)
+            rows.append(row)
+        return rows
+
+    def builds(self):
+        # Build labels ordered by the first run of each build, runs without build are left out
+        with self.lock:
+            build = self.runs["build"]
+            started = self.runs["started"]
+            strings = list(self.strings["build"])
+        first = {}
+        for code in np.unique(build):
+            if not strings[code]:
+                continue
+            times = started[(build == code) & ~np.isnan(started)]
+            first[strings[code]] = float(times.min()) if len(times) else 0.0
+        return sorted(first, key=lambda name: first[name])
+
+    def regressions(self, baseline=None, candidate=None, group_by=("step",), threshold=REGRESSION_THRESHOLD,
+                    min_count=3, min_delta=MIN_REGRESSION_DELTA):
+        # Compares two builds (by default the last two), sorted from the largest slowdown
+        builds = self.builds()
+        if baseline is None or candidate is None:
+            if len(builds) < 2:
+                return None, None, []
+            baseline, candidate = baseline or builds[-2], candidate or builds[-1]
+        group_by = tuple(field for field in group_by if field != "build")
+        before = {tuple(row[field] for field in group_by): row for row in self.percentiles(group_by, build=baseline)}
+        after = {tuple(row[field] for field in group_by): row for row in self.percentiles(group_by, build=candidate)}
+
+        result = []
+        for key in sorted(before.keys() & after.keys()):
+            old, new = before[key], after[key]
+            change = new["p50"] / old["p50"] - 1 if old["p50"] else None
+            result.append({**dict(zip(group_by, key)),
+                "baseline_count": old["count"], "candidate_count": new["count"],
+                "baseline_p50": old["p50"], "candidate_p50": new["p50"],
+                "baseline_p95": old["p95"], "candidate_p95": new["p95"],
+                "change": round(change, 3) if change is not None else None,
+                "regression": bool(change is not None and change > threshold
+                                   and new["p50"] - old["p50"] > min_delta
+                                   and old["count"] >= min_count and new["count"] >= min_count)
+            })
+        result.sort(key=lambda row: row["change"] if row["change"] is not None else 0, reverse=True)
+        return baseline, candidate, result
+
+    def stats(self):
+        return {"runs": len(self.run_ids), "samples": int(len(self.samples["value"])),
+                "steps": len(self.strings["step"]), "builds": len(self.strings["build"])}
+
+
+def print_table(rows, columns):
+    widths = [max([len(column)] + [len(str(row.get(column, ""))) for row in rows]) for column in columns]
+    print("  ".join(column.ljust(width) for column, width in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(str(row.get(column, "")).ljust(width) for column, width in zip(columns, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Performance analytics across all test runs")
+    parser.add_argument("command", choices=["ingest", "stats", "regressions", "builds"])
+    parser.add_argument("--log-dir", default="appium_logs")
+    parser.add_argument("--by", default="step", help="Comma separated group fields: " + ", ".join(GROUP_FIELDS))
+    parser.add_argument("--step", help="Only steps starting with this prefix (e.g. command:, wait:)")
+    parser.add_argument("--device")
+    parser.add_argument("--platform-version")
+    parser.add_argument("--build")
+    parser.add_argument("--baseline", help="Baseline build (default: second newest)")
+    parser.add_argument("--candidate", help="Candidate build (default: newest)")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args()
+
+    store = AnalyticsStore(args.log_dir)
+    new_runs = store.ingest()
+    if args.command == "ingest":
+        print(f"Ingested {new_runs} new runs: {store.stats()}")
+        return
+    if args.command == "builds":
+        for build in store.builds():
+            print(build)
+        return
+
+    group_by = tuple(field.strip() for field in args.by.split(",") if field.strip())
+    unknown = set(group_by) - set(GROUP_FIELDS)
+    if unknown:
+        parser.error(f"Unknown group fields: {', '.join(sorted(unknown))}")
+    if args.command == "stats":
+        rows = store.percentiles(group_by, args.step, args.device, args.platform_version, args.build)
+        print_table(rows, list(group_by) + ["count", "mean"] + [f"p{p}" for p in PERCENTILES])
+        return
+
+    baseline, candidate, rows = store.regressions(args.baseline, args.candidate, group_by, args.threshold)
+    if baseline is None:
+        print("At least two builds are needed for regression detection")
+        return
+    print(f"Baseline: {baseline}, candidate: {candidate}")
+    columns = [field for field in group_by if field != "build"]
+    print_table(rows, columns + ["baseline_p50", "candidate_p50", "baseline_p95", "candidate_p95", "change", "regression"])
+    regressions = sum(1 for row in rows if row["regression"])
+    print(f"{regressions} regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,33 @@
 import http.server
-import socketserver
 import os
 import json
-import glob
 import datetime
+import base64
+import re
+import gzip
+import hashlib
+import mimetypes
+import threading
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from html import escape as html_escape
+from urllib.parse import urlsplit, parse_qs, urlencode
+
+from blob_store import BlobStore
+from instrumentation import METRICS_DIR_NAME, read_snapshots, render_openmetrics
+from live_stream import KEEPALIVE_INTERVAL, RETRY_MS, LiveHub
+from page_sources import load_page_source, node_label
+from report import render_lazy_report, EVENTS_PAGE_SIZE
+from run_archive import ArchiveBlobs, archive_path
+from run_reader import RUN_ID_PATTERN, RunReaderCache, find_run_file
+from run_index import RunIndex, RunListingCache, SORT_COLUMNS, metadata_from_reader, sidecar_path
+
+# Analytics need NumPy, without it the dashboard is not available
+try:
+    from analytics import AnalyticsStore, PERCENTILES
+except ImportError:
+    AnalyticsStore = None
 
 # Configuration of server
 PORT = 8000
@@ -13,77 +37,735 @@ DIRECTORY = "appium_logs"
 if not os.path.exists(DIRECTORY):
     os.makedirs(DIRECTORY)
 
+# Shared between requests, so repeated page loads do not rescan the run logs
+run_readers = RunReaderCache(DIRECTORY)
+blob_store = BlobStore(DIRECTORY)
+archive_blobs = ArchiveBlobs(DIRECTORY)
+run_listing = RunListingCache(RunIndex(DIRECTORY))
+analytics_store = AnalyticsStore(DIRECTORY) if AnalyticsStore is not None else None
+page_source_cache = {}
+page_source_lock = threading.Lock()
+
+
+def run_item_html(run):
+    # One entry of the run list, also sent to open index pages when a run changes
+    run_id = html_escape(run["run_id"])
+    started = (run["started"] or "")[:19].replace("T", " ")
+    return f"""<li class="log-item" data-run-id="{run_id}">
+                    <a class="log-link" href="/appium_events_{run_id}.html" target="_blank">appium_events_{run_id}.html</a>
+                    <a href="/runs/{run_id}" target="_blank">(paged view)</a>
+                    <span class="{html_escape(run["status"] or "")}">{html_escape(run["status"] or "")}</span>
+                    <div class="log-time">
+                        Created: {started} | Duration: <span class="run-duration">{run["duration"]}</span>s
+                        | Events: <span class="run-events">{run["event_count"]}</span>
+                        | Errors: <span class="run-errors">{run["error_count"]}</span> | Device: {html_escape(run["device"] or "unknown")}
+                        (Android {html_escape(run["platform_version"] or "?")})
+                    </div>
+                </li>"""
+
+
+def describe_live_run(run_id):
+    # Finished runs are described by their sidecar, running ones by their stream so far
+    try:
+        with open(sidecar_path(DIRECTORY, run_id)) as f:
+            run = json.load(f)
+    except FileNotFoundError:
+        reader = run_readers.get(run_id)
+        run = metadata_from_reader(reader) if reader is not None else {"run_id": run_id, "status": "removed"}
+    run = {field: run.get(field) for field in ("run_id", "started", "duration", "event_count", "error_count",
+                                               "status", "device", "platform_version")}
+    run["html"] = run_item_html(run)
+    return run
+
+
+# Live runs are followed by one thread each, shared by all open viewers
+live_hub = LiveHub(DIRECTORY, describe_live_run)
+# Command metrics snapshots (instrumentation.py), unchanged files are not read again
+metrics_cache = {}
+metrics_lock = threading.Lock()
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+BLOB_REF_PATTERN = re.compile(r"^blobs/[0-9a-f]{2}/[0-9a-f]{64}\.[a-z]+$")
+RUN_ROUTE = re.compile(r"^/runs/([^/]+)$")
+RUN_API_ROUTE = re.compile(r"^/api/runs/([^/]+)/(summary|events)$")
+LIVE_RUN_ROUTE = re.compile(r"^/api/runs/([^/]+)/live$")
+LEGACY_SCREENSHOT_ROUTE = re.compile(r"^/api/runs/([^/]+)/events/(\d+)/screenshot$")
+REPORT_FILE_ROUTE = re.compile(r"^/appium_events_([A-Za-z0-9_.-]+)\.html$")
+PAGE_SOURCE_REF_PATTERN = re.compile(r"^blobs/[0-9a-f]{2}/[0-9a-f]{64}\.(xml|json|txt)$")
+# Rebuilt page sources kept in memory, diffs of the same run share their bases
+PAGE_SOURCE_CACHE_SIZE = 256
+MAX_EVENTS_PAGE_SIZE = 500
+ANALYTICS_GROUPS = ("step", "step,device", "step,platform_version", "step,build", "step,device,platform_version")
+
+# Responses smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 1024
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "application/x-ndjson",
+                     "application/openmetrics-text")
+# Compressed static files are kept in memory, up to this many bytes
+GZIP_CACHE_SIZE = 64 * 1024 * 1024
+# Blobs are content-addressed, their content never changes
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+mimetypes.add_type("application/x-ndjson", ".jsonl")
+
+
+class GzipCache:
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, path, etag):
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is None or entry[0] != etag:
+                return None
+            self.entries.move_to_end(path)
+            return entry[1]
+
+    def put(self, path, etag, data):
+        if len(data) > self.max_size:
+            return
+        with self.lock:
+            old = self.entries.pop(path, None)
+            if old is not None:
+                self.size -= len(old[1])
+            self.entries[path] = (etag, data)
+            self.size += len(data)
+            while self.size > self.max_size:
+                _, (_, removed) = self.entries.popitem(last=False)
+                self.size -= len(removed)
+
+
+gzip_cache = GzipCache(GZIP_CACHE_SIZE)
+
+
+def is_compressible(content_type):
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def gzip_etag(etag):
+    # Strong ETag of the gzip representation, differs from the identity one
+    return f'{etag[:-1]}-gz"'
+
 class AppiumLogHandler(http.server.SimpleHTTPRequestHandler):
+    # Keep-alive connections, every response has Content-Length
+    protocol_version = "HTTP/1.1"
+    # Live event streams stay open, each one needs its own thread
+    live_follow = True
+    # Headers and body are sent separately, without this small responses wait for delayed ACK
+    disable_nagle_algorithm = True
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, directory=DIRECTORY, **kwargs)
     
-    def do_GET(self):
-        if self.path == '/':
-            self.send_response(200)
-            self.send_header('Content-type', 'text/html')
+    def accepts_gzip(self):
+        return "gzip" in self.headers.get("Accept-Encoding", "")
+
+    def etag_matches(self, etag):
+        if_none_match = self.headers.get("If-None-Match")
+        if not if_none_match:
+            return False
+        return if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]
+
+    def not_modified_since(self, mtime):
+        # If-None-Match has priority over If-Modified-Since
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if not if_modified_since or self.headers.get("If-None-Match"):
+            return False
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError, IndexError, OverflowError):
+            return False
+
+    def send_not_modified(self, etag, cache_control):
+        self.send_response(304)
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', cache_control)
+        self.send_header('Vary', 'Accept-Encoding')
+        self.end_headers()
+
+    def send_body(self, body, content_type, status=200, cache_control="no-cache"):
+        # Generated pages are validated by hash of their content
+        compress = len(body) >= MIN_COMPRESS_SIZE and is_compressible(content_type) and self.accepts_gzip()
+        etag = f'"{hashlib.md5(body).hexdigest()}"'
+        if compress:
+            etag = gzip_etag(etag)
+        if status == 200 and self.etag_matches(etag):
+            return self.send_not_modified(etag, cache_control)
+
+        encoding = None
+        if compress:
+            body = gzip.compress(body, compresslevel=5)
+            encoding = "gzip"
+
+        self.send_response(status)
+        self.send_header('Content-type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', cache_control)
+        self.send_header('Vary', 'Accept-Encoding')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def send_json(self, data, status=200):
+        self.send_body(json.dumps(data).encode(), 'application/json', status)
+
+    def send_html(self, html):
+        self.send_body(html.encode(), 'text/html; charset=utf-8')
+
+    def serve_file(self, path):
+        stat = os.stat(path)
+        etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+        content_type = self.guess_type(path)
+        relative_path = os.path.relpath(path, self.directory).replace(os.sep, "/")
+        cache_control = IMMUTABLE_CACHE_CONTROL if relative_path.startswith("blobs/") else "no-cache"
+
+        # Compressed and identity responses are different representations, each has its own ETag
+        compress = stat.st_size >= MIN_COMPRESS_SIZE and is_compressible(content_type) and self.accepts_gzip()
+        response_etag = gzip_etag(etag) if compress else etag
+        if self.etag_matches(response_etag) or self.not_modified_since(stat.st_mtime):
+            return self.send_not_modified(response_etag, cache_control)
+
+        # Ranges are served from the identity representation
+        range_header = self.headers.get("Range")
+        if range_header and self.headers.get("If-Range", etag) == etag:
+            return self.serve_file_range(path, stat.st_size, range_header, content_type, etag, cache_control)
+
+        body = None
+        if compress:
+            body = gzip_cache.get(path, etag)
+            if body is None:
+                with open(path, 'rb') as f:
+                    body = gzip.compress(f.read(), compresslevel=6)
+                gzip_cache.put(path, etag, body)
+
+        self.send_response(200)
+        self.send_header('Content-type', content_type)
+        self.send_header('Content-Length', str(len(body) if body is not None else stat.st_size))
+        self.send_header('ETag', response_etag)
+        self.send_header('Last-Modified', formatdate(stat.st_mtime, usegmt=True))
+        self.send_header('Cache-Control', cache_control)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Vary', 'Accept-Encoding')
+        if body is not None:
+            self.send_header('Content-Encoding', 'gzip')
+        self.end_headers()
+        if self.command == "HEAD":
+            return
+        if body is not None:
+            self.wfile.write(body)
+        else:
+            with open(path, 'rb') as f:
+                self.copyfile(f, self.wfile)
+
+    def serve_file_range(self, path, size, range_header, content_type, etag, cache_control):
+        # Only single byte ranges are supported, which is what browsers and download tools use
+        match = RANGE_PATTERN.match(range_header.strip())
+        if not match or match.groups() == ("", ""):
+            start, end = None, None
+        elif match.group(1) == "":
+            start, end = max(size - int(match.group(2)), 0), size - 1
+        else:
+            start = int(match.group(1))
+            end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+
+        if start is None or start >= size or start > end:
+            self.send_response(416)
+            self.send_header('Content-Range', f'bytes */{size}')
+            self.send_header('Content-Length', '0')
             self.end_headers()
-            
-            # Get list of all log files
-            log_files = glob.glob(os.path.join(DIRECTORY, "*.html"))
-            log_files.sort(key=os.path.getmtime, reverse=True)
-            
-            # Create HTML page with list of logs
-            html = f"""
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <title>Appium Logs Viewer</title>
-                <style>
-                    body {{ font-family: Arial, sans-serif; margin: 20px; }}
-                    h1 {{ color: #333; }}
-                    .log-list {{ list-style-type: none; padding: 0; }}
-                    .log-item {{ margin-bottom: 10px; padding: 10px; border: 1px solid #ddd; border-radius: 5px; }}
-                    .log-link {{ text-decoration: none; color: #0066cc; font-weight: bold; }}
-                    .log-time {{ color: #666; font-size: 0.9em; }}
-                    .refresh-btn {{ padding: 10px 15px; background-color: #4CAF50; color: white; border: none; 
-                                   border-radius: 5px; cursor: pointer; margin-bottom: 20px; }}
-                    .refresh-btn:hover {{ background-color: #45a049; }}
-                </style>
-            </head>
-            <body>
-                <h1>Appium Logs Viewer</h1>
-                <button class="refresh-btn" onclick="window.location.reload()">Refresh</button>
-                <p>Current time: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</p>
-                <h2>Available Logs:</h2>
-                <ul class="log-list">
-            """
-            
-            if log_files:
-                for log_file in log_files:
-                    file_name = os.path.basename(log_file)
-                    file_time = datetime.datetime.fromtimestamp(os.path.getmtime(log_file)).strftime('%Y-%m-%d %H:%M:%S')
-                    html += f"""
-                    <li class="log-item">
-                        <a class="log-link" href="/{file_name}" target="_blank">{file_name}</a>
-                        <div class="log-time">Created: {file_time}</div>
-                    </li>
-                    """
-            else:
-                html += "<li>No log files found. Run your Appium tests to generate logs.</li>"
-            
-            html += """
-                </ul>
-                <script>
-                    // Auto-refresh every 10 seconds
-                    setTimeout(function() {
-                        window.location.reload();
-                    }, 10000);
-                </script>
-            </body>
-            </html>
-            """
-            
-            self.wfile.write(html.encode())
+            return
+
+        length = end - start + 1
+        self.send_response(206)
+        self.send_header('Content-type', content_type)
+        self.send_header('Content-Length', str(length))
+        self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', cache_control)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+        if self.command == "HEAD":
+            return
+        with open(path, 'rb') as f:
+            f.seek(start)
+            while length > 0:
+                chunk = f.read(min(length, 64 * 1024))
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+                length -= len(chunk)
+
+    def handle_run_page(self, run_id):
+        reader = run_readers.get(run_id)
+        if reader is None:
+            return self.send_error(404, "Run not found")
+        self.send_html(render_lazy_report(run_id, reader.summary))
+
+    def handle_run_api(self, run_id, action, query):
+        reader = run_readers.get(run_id)
+        if reader is None:
+            return self.send_json({"error": "Run not found"}, 404)
+        if action == "summary":
+            return self.send_json(reader.summary)
+
+        try:
+            offset = max(int(query.get("offset", ["0"])[0]), 0)
+            # Negative or zero limit would read the whole run in one response
+            limit = min(max(int(query.get("limit", [str(EVENTS_PAGE_SIZE)])[0]), 1), MAX_EVENTS_PAGE_SIZE)
+        except ValueError:
+            return self.send_json({"error": "Invalid offset or limit"}, 400)
+        self.send_json({
+            "offset": offset,
+            "limit": limit,
+            "total": reader.event_count(),
+            "events": reader.events(offset, limit)
+        })
+
+    def last_event_id(self, query, name):
+        # EventSource sends the id of the last received event when it reconnects
+        value = self.headers.get("Last-Event-ID") or query.get(name, ["0"])[0]
+        try:
+            return max(int(value), 0)
+        except ValueError:
+            return 0
+
+    def handle_live_run(self, run_id, query):
+        if not RUN_ID_PATTERN.match(run_id) or (find_run_file(DIRECTORY, run_id) is None
+                                                and not os.path.exists(sidecar_path(DIRECTORY, run_id))):
+            return self.send_error(404, "Run not found")
+        self.send_event_stream(*live_hub.subscribe_run(run_id, self.last_event_id(query, "offset")))
+
+    def handle_live_runs(self):
+        self.send_event_stream(*live_hub.subscribe_runs(self.last_event_id({}, "")))
+
+    def send_event_stream(self, broadcaster, subscription, frames):
+        # Server-Sent Events: frames already available, then new ones as they are published.
+        # The single-threaded server can not keep connections open, it sends what is
+        # available and the browser asks again after RETRY_MS
+        if not self.live_follow:
+            broadcaster.unsubscribe(subscription)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        if self.command == "HEAD":
+            return broadcaster.unsubscribe(subscription)
+        try:
+            self.wfile.write(f"retry: {RETRY_MS}\n\n".encode())
+            for frame in frames:
+                self.wfile.write(frame)
+            self.wfile.flush()
+            while True:
+                frame = subscription.get(KEEPALIVE_INTERVAL)
+                if frame is None:
+                    break
+                self.wfile.write(frame)
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            broadcaster.unsubscribe(subscription)
+
+    def handle_legacy_screenshot(self, run_id, index):
+        # Screenshots embedded in old JSON logs are sent only when requested
+        reader = run_readers.get(run_id)
+        screenshot = reader.legacy_screenshot(index) if reader else None
+        if screenshot is None:
+            return self.send_error(404, "Screenshot not found")
+        self.send_body(base64.b64decode(screenshot), 'image/png', cache_control=IMMUTABLE_CACHE_CONTROL)
+
+    def blob_exists(self, ref):
+        # Blobs of archived runs are restored to blobs/ when they are missing there
+        if os.path.exists(blob_store.path_for(ref)):
+            return True
+        return archive_blobs.restore(blob_store, ref)
+
+    def handle_thumbnail(self, query):
+        ref = query.get("ref", [""])[0]
+        if not BLOB_REF_PATTERN.match(ref) or not self.blob_exists(ref):
+            return self.send_error(404, "Screenshot not found")
+        try:
+            width = min(max(int(query.get("w", ["320"])[0]), 32), 1080)
+        except ValueError:
+            width = 320
+        thumb_ref = blob_store.thumbnail(ref, width)
+        self.send_redirect(f"/{thumb_ref}")
+
+    def load_blob(self, ref):
+        if not PAGE_SOURCE_REF_PATTERN.match(ref) or not self.blob_exists(ref):
+            raise KeyError(ref)
+        return blob_store.get_bytes(ref)
+
+    def handle_page_source(self, query, as_json):
+        # Page sources are stored as diffs against the previous page (page_sources.py),
+        # the page is rebuilt from its chain of bases and changed nodes are highlighted
+        ref = query.get("ref", [""])[0]
+        try:
+            with page_source_lock:
+                if len(page_source_cache) > PAGE_SOURCE_CACHE_SIZE:
+                    page_source_cache.clear()
+                source, diff = load_page_source(self.load_blob, ref, page_source_cache)
+        except (KeyError, ValueError, ET.ParseError):
+            return self.send_error(404, "Page source not found")
+        if query.get("format", [""])[0] == "xml":
+            return self.send_body(source.encode(), "application/xml", cache_control=IMMUTABLE_CACHE_CONTROL)
+        if as_json:
+            return self.send_json({"ref": ref, "source": source, "diff": diff})
+
+        try:
+            root = ET.fromstring(source.encode())
+        except ET.ParseError:
+            root = None
+        changed = {tuple(path) for path in diff["changed"]} if diff else set()
+        added = {tuple(path) for path in diff["added"]} if diff else set()
+        lines = []
+
+        def visit(node, path):
+            css = "added" if path in added else "changed" if path in changed else ""
+            lines.append(f'<div class="{css}" style="padding-left: {len(path) * 16}px">'
+                         f'{html_escape(node_label(node))}</div>')
+            for index, child in enumerate(node):
+                visit(child, path + (index,))
+
+        if root is None:
+            lines.append(f"<pre>{html_escape(source)}</pre>")
         else:
-            return super().do_GET()
+            visit(root, ())
+        removed = "".join(f"<li>{html_escape(item['node'])}</li>" for item in diff["removed"]) if diff else ""
+        base = (f'<a href="/page_source?ref={html_escape(diff["base"])}">Previous page</a> | '
+                f'{len(changed)} changed, {len(added)} added, {len(diff["removed"])} removed nodes | ') if diff else ""
+        html = f"""
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <title>Page Source</title>
+            <style>
+                body {{ font-family: Arial, sans-serif; margin: 20px; }}
+                .tree div {{ font-family: monospace; font-size: 0.9em; white-space: nowrap; }}
+                .tree .changed {{ background-color: #fff3cd; }}
+                .tree .added {{ background-color: #d4edda; }}
+                .removed li {{ font-family: monospace; color: #dc3545; }}
+            </style>
+        </head>
+        <body>
+            <h1>Page Source</h1>
+            <p>{base}<a href="/page_source?ref={html_escape(ref)}&format=xml">Raw XML</a></p>
+            <div class="tree">{"".join(lines)}</div>
+            {f'<h2>Removed nodes</h2><ul class="removed">{removed}</ul>' if removed else ""}
+        </body>
+        </html>
+        """
+        self.send_html(html)
+
+    def send_redirect(self, location):
+        self.send_response(302)
+        self.send_header('Location', location)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+
+        match = RUN_ROUTE.match(url.path)
+        if match:
+            return self.handle_run_page(match.group(1))
+        match = RUN_API_ROUTE.match(url.path)
+        if match:
+            return self.handle_run_api(match.group(1), match.group(2), query)
+        match = LIVE_RUN_ROUTE.match(url.path)
+        if match:
+            return self.handle_live_run(match.group(1), query)
+        if url.path == '/api/live':
+            return self.handle_live_runs()
+        match = LEGACY_SCREENSHOT_ROUTE.match(url.path)
+        if match:
+            return self.handle_legacy_screenshot(match.group(1), int(match.group(2)))
+        if url.path == '/api/thumbnail':
+            return self.handle_thumbnail(query)
+        if url.path in ('/page_source', '/api/page_source'):
+            return self.handle_page_source(query, url.path.startswith('/api/'))
+
+        if url.path == '/api/runs':
+            ((runs, total), _), _, _ = self.list_runs(query)
+            return self.send_json({"total": total, "runs": runs})
+        if url.path == '/':
+            return self.handle_index(query)
+        if url.path == '/metrics':
+            return self.handle_metrics()
+        if url.path in ('/analytics', '/api/analytics'):
+            return self.handle_analytics(query, url.path.startswith('/api/'))
+
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            if BLOB_REF_PATTERN.match(url.path[1:]):
+                self.blob_exists(url.path[1:])
+            match = REPORT_FILE_ROUTE.match(url.path)
+            if match and (os.path.exists(archive_path(DIRECTORY, match.group(1)))
+                          or os.path.exists(os.path.join(DIRECTORY, f"appium_events_{match.group(1)}.jsonl"))):
+                # Archived and running runs have no static report, the paged view reads
+                # the archive or follows the live run
+                return self.send_redirect(f"/runs/{match.group(1)}")
+        if os.path.isfile(path):
+            return self.serve_file(path)
+        return super().do_GET() if self.command == "GET" else super().do_HEAD()
+
+    def do_HEAD(self):
+        # Same routing as GET, responses skip the body for HEAD requests
+        return self.do_GET()
+
+    def list_runs(self, query):
+        def param(name, default=""):
+            return query.get(name, [default])[0]
+
+        try:
+            page = max(int(param("page", "1")), 1)
+            per_page = min(max(int(param("per_page", "50")), 1), 500)
+        except ValueError:
+            page, per_page = 1, 50
+        listing = run_listing.list_runs(
+            offset=(page - 1) * per_page,
+            limit=per_page,
+            status=param("status") or None,
+            device=param("device") or None,
+            search=param("q") or None,
+            sort=param("sort", "started"),
+            descending=param("order", "desc") != "asc"
+        )
+        return listing, page, per_page
+
+    def handle_index(self, query):
+        ((runs, total), devices), page, per_page = self.list_runs(query)
+        params = {name: values[0] for name, values in query.items()}
+        pages = max((total + per_page - 1) // per_page, 1)
+
+        def page_link(number, label):
+            link_params = dict(params, page=str(number))
+            return f'<a href="/?{html_escape(urlencode(link_params))}">{label}</a>'
+
+        def option(value, label, selected):
+            is_selected = " selected" if value == selected else ""
+            return f'<option value="{html_escape(value)}"{is_selected}>{html_escape(label)}</option>'
+
+        # Create HTML page with list of logs
+        html = f"""
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <title>Appium Logs Viewer</title>
+            <style>
+                body {{ font-family: Arial, sans-serif; margin: 20px; }}
+                h1 {{ color: #333; }}
+                .log-list {{ list-style-type: none; padding: 0; }}
+                .log-item {{ margin-bottom: 10px; padding: 10px; border: 1px solid #ddd; border-radius: 5px; }}
+                .log-link {{ text-decoration: none; color: #0066cc; font-weight: bold; }}
+                .log-time {{ color: #666; font-size: 0.9em; }}
+                .passed {{ color: #28a745; }}
+                .failed {{ color: #dc3545; }}
+                .running {{ color: #17a2b8; }}
+                .filters {{ margin-bottom: 20px; }}
+                .filters select, .filters input {{ padding: 5px; margin-right: 5px; }}
+                .pagination a {{ margin-right: 10px; }}
+                .refresh-btn {{ padding: 10px 15px; background-color: #4CAF50; color: white; border: none; 
+                               border-radius: 5px; cursor: pointer; margin-bottom: 20px; }}
+                .refresh-btn:hover {{ background-color: #45a049; }}
+            </style>
+        </head>
+        <body>
+            <h1>Appium Logs Viewer</h1>
+            <button class="refresh-btn" onclick="window.location.reload()">Refresh</button>
+            <p>Current time: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')} | <a href="/analytics">Analytics</a></p>
+            <form class="filters" method="get" action="/">
+                <input type="text" name="q" placeholder="Run ID" value="{html_escape(params.get("q", ""))}">
+                <select name="status">
+                    {option("", "Any status", params.get("status", ""))}
+                    {option("passed", "Passed", params.get("status", ""))}
+                    {option("failed", "Failed", params.get("status", ""))}
+                </select>
+                <select name="device">
+                    {option("", "Any device", params.get("device", ""))}
+                    {"".join(option(device, device, params.get("device", "")) for device in devices)}
+                </select>
+                <select name="sort">
+                    {"".join(option(column, f"Sort by {column.replace('_', ' ')}", params.get("sort", "started")) for column in SORT_COLUMNS)}
+                </select>
+                <select name="order">
+                    {option("desc", "Descending", params.get("order", "desc"))}
+                    {option("asc", "Ascending", params.get("order", "desc"))}
+                </select>
+                <button type="submit">Filter</button>
+            </form>
+            <h2>Available Logs ({total}):</h2>
+            <ul class="log-list">
+        """
+
+        if runs:
+            for run in runs:
+                html += run_item_html(run)
+        else:
+            html += "<li>No log files found. Run your Appium tests to generate logs.</li>"
+
+        html += f"""
+            </ul>
+            <div class="pagination">
+                {page_link(page - 1, "&laquo; Previous") if page > 1 else ""}
+                Page {page} of {pages}
+                {page_link(page + 1, "Next &raquo;") if page < pages else ""}
+            </div>
+            <script>
+                // Runs are updated in place as they change, started runs are added on top
+                // of the default listing (first page, newest first, no filters)
+                const showNewRuns = {"true" if page == 1 and not any(params.get(name) for name in ("q", "status", "device"))
+                                     and params.get("sort", "started") == "started" and params.get("order", "desc") == "desc" else "false"};
+                const logList = document.querySelector('.log-list');
+                const runs = new EventSource('/api/live');
+                runs.addEventListener('run', message => {{
+                    const run = JSON.parse(message.data);
+                    const item = document.querySelector(`.log-item[data-run-id="${{CSS.escape(run.run_id)}}"]`);
+                    if (item) {{
+                        item.outerHTML = run.html;
+                    }} else if (showNewRuns && run.status !== 'removed') {{
+                        const empty = logList.querySelector('li:not(.log-item)');
+                        if (empty) empty.remove();
+                        logList.insertAdjacentHTML('afterbegin', run.html);
+                    }}
+                }});
+                runs.addEventListener('progress', message => {{
+                    const run = JSON.parse(message.data);
+                    const item = document.querySelector(`.log-item[data-run-id="${{CSS.escape(run.run_id)}}"]`);
+                    if (!item) return;
+                    item.querySelector('.run-duration').textContent = run.duration;
+                    item.querySelector('.run-events').textContent = run.event_count;
+                    item.querySelector('.run-errors').textContent = run.error_count;
+                }});
+            </script>
+        </body>
+        </html>
+        """
+
+        self.send_html(html)
+
+    def handle_metrics(self):
+        # WebDriver command counters of all instrumented test runs, for Prometheus
+        with metrics_lock:
+            snapshots = read_snapshots(os.path.join(DIRECTORY, METRICS_DIR_NAME), metrics_cache)
+        self.send_body(render_openmetrics(snapshots).encode(), OPENMETRICS_CONTENT_TYPE)
+
+    def handle_analytics(self, query, as_json):
+        if analytics_store is None:
+            return self.send_error(501, "Analytics need NumPy (pip install numpy)")
+
+        def param(name, default=""):
+            return query.get(name, [default])[0]
+
+        # Only runs finished since the last request are read
+        analytics_store.ingest()
+        group = param("by", "step") if param("by", "step") in ANALYTICS_GROUPS else "step"
+        group_by = tuple(group.split(","))
+        rows = analytics_store.percentiles(group_by, param("step") or None, param("device") or None,
+                                           param("platform_version") or None, param("build") or None)
+        baseline, candidate, regressions = analytics_store.regressions(
+            param("baseline") or None, param("candidate") or None, group_by)
+        if as_json:
+            return self.send_json({"stats": analytics_store.stats(), "percentiles": rows, "baseline": baseline,
+                                   "candidate": candidate, "regressions": regressions})
+
+        def option(value, label, selected):
+            is_selected = " selected" if value == selected else ""
+            return f'<option value="{html_escape(value)}"{is_selected}>{html_escape(label)}</option>'
+
+        def options(field, label, name=None):
+            selected = param(name or field)
+            return option("", label, selected) + "".join(
+                option(value, value, selected) for value in analytics_store.strings[field] if value)
+
+        def table(rows, columns, row_class=lambda row: ""):
+            header = "".join(f"<th>{html_escape(column.replace('_', ' '))}</th>" for column in columns)
+            body = "".join(
+                f'<tr class="{row_class(row)}">' + "".join(f"<td>{html_escape(str(row.get(column, '')))}</td>" for column in columns) + "</tr>"
+                for row in rows)
+            return f"<table><tr>{header}</tr>{body}</table>"
+
+        stats = analytics_store.stats()
+        percentile_columns = list(group_by) + ["count", "mean"] + [f"p{percentile}" for percentile in PERCENTILES]
+        regression_columns = [field for field in group_by if field != "build"] + [
+            "baseline_count", "candidate_count", "baseline_p50", "candidate_p50", "baseline_p95", "candidate_p95", "change"]
+        if baseline is None:
+            regressions_html = "<p>At least two builds are needed for regression detection.</p>"
+        else:
+            regressions_html = f"""
+            <p>Baseline: <b>{html_escape(baseline)}</b>, candidate: <b>{html_escape(candidate)}</b>,
+               regressions: <b class="failed">{sum(1 for row in regressions if row["regression"])}</b></p>
+            {table(regressions, regression_columns, lambda row: "failed" if row["regression"] else "")}
+            """
+
+        html = f"""
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <title>Appium Analytics</title>
+            <style>
+                body {{ font-family: Arial, sans-serif; margin: 20px; }}
+                h1 {{ color: #333; }}
+                table {{ border-collapse: collapse; margin-bottom: 20px; }}
+                th, td {{ border: 1px solid #ddd; padding: 4px 8px; text-align: left; font-size: 0.9em; }}
+                th {{ background-color: #f5f5f5; }}
+                tr.failed td {{ color: #dc3545; font-weight: bold; }}
+                .failed {{ color: #dc3545; }}
+                .filters {{ margin-bottom: 20px; }}
+                .filters select, .filters input {{ padding: 5px; margin-right: 5px; }}
+            </style>
+        </head>
+        <body>
+            <h1>Appium Analytics</h1>
+            <p><a href="/">&laquo; All runs</a> | Runs: {stats["runs"]} | Timings: {stats["samples"]} | Builds: {stats["builds"]}</p>
+            <form class="filters" method="get" action="/analytics">
+                <select name="by">
+                    {"".join(option(value, "Group by " + value.replace(",", ", "), group) for value in ANALYTICS_GROUPS)}
+                </select>
+                <input type="text" name="step" placeholder="Step prefix (e.g. command:)" value="{html_escape(param("step"))}">
+                <select name="device">{options("device", "Any device")}</select>
+                <select name="platform_version">{options("platform_version", "Any Android version")}</select>
+                <select name="build">{options("build", "Any build")}</select>
+                <select name="baseline">{options("build", "Baseline: second newest build", "baseline")}</select>
+                <select name="candidate">{options("build", "Candidate: newest build", "candidate")}</select>
+                <button type="submit">Show</button>
+            </form>
+            <h2>Timings (seconds)</h2>
+            {table(rows, percentile_columns)}
+            <h2>Regressions</h2>
+            {regressions_html}
+        </body>
+        </html>
+        """
+        self.send_html(html)
+
+class SingleConnectionLogHandler(AppiumLogHandler):
+    # Single-threaded server must close every connection,
+    # a keep-alive client would block all others
+    protocol_version = "HTTP/1.0"
+    live_follow = False
+
+def handler_class(threaded):
+    return AppiumLogHandler if threaded else SingleConnectionLogHandler
+
+def make_server(port=PORT, threaded=True):
+    # Threaded server handles every connection in its own thread,
+    # so one slow download does not block other viewers
+    server_class = http.server.ThreadingHTTPServer if threaded else http.server.HTTPServer
+    return server_class(("", port), handler_class(threaded))
 
-def run_server():
-    with socketserver.TCPServer(("", PORT), AppiumLogHandler) as httpd:
+def run_server(threaded=True):
+    with make_server(PORT, threaded) as httpd:
         print(f"Serving Appium logs at http://localhost:{PORT}")
         httpd.serve_forever()
 
@@ -0,0 +1,65 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+# Cost of instrumentation.py per WebDriver command: the same commands are sent to
+# the fake Appium server (no latency) by a plain driver and by an instrumented one.
+# With APPIUM_INSTRUMENTATION=0 the driver is not wrapped at all, like "plain" here.
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from appium import webdriver
+from appium.webdriver.common.appiumby import AppiumBy
+
+from fake_appium_server import make_fake_server
+from instrumentation import instrument
+from wifi_test import build_options
+
+
+def send_commands(driver, commands):
+    started = time.perf_counter()
+    for _ in range(commands // 2):
+        element = driver.find_element(AppiumBy.ID, "android:id/title")
+        element.get_attribute("text")
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark WebDriver command instrumentation overhead")
+    parser.add_argument("--commands", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    server = make_fake_server(0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    appium_url = f"http://localhost:{server.server_address[1]}"
+    log_dir = tempfile.mkdtemp(prefix="bench_instrumentation_")
+    try:
+        plain = webdriver.Remote(appium_url, options=build_options())
+        instrumented = webdriver.Remote(appium_url, options=build_options())
+        metrics = instrument(instrumented, log_dir, enabled=True)
+        # Rounds alternate, so both drivers see the same server state
+        times = {"plain": [], "instrumented": []}
+        for _ in range(args.rounds):
+            times["plain"].append(send_commands(plain, args.commands))
+            times["instrumented"].append(send_commands(instrumented, args.commands))
+        plain_us = min(times["plain"]) / args.commands * 1e6
+        instrumented_us = min(times["instrumented"]) / args.commands * 1e6
+        stats = metrics.run_stats()
+        print(f"plain: {plain_us:.1f} us/command, instrumented: {instrumented_us:.1f} us/command, "
+              f"overhead: {instrumented_us - plain_us:.1f} us/command ({(instrumented_us - plain_us) / plain_us:.2%})")
+        print(f"instrumented commands: {stats['commands_sent']}, client time: {stats['client_time']}s, "
+              f"HTTP time: {stats['http_time']}s")
+        plain.quit()
+        instrumented.quit()
+    finally:
+        server.shutdown()
+        shutil.rmtree(log_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+import argparse
+import http.client
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# Cost of open dashboards on appium_server.py while a test is running: viewers
+# reloading the run list every few seconds (the old auto-refresh) compared with
+# viewers loading it once and following live updates (Server-Sent Events).
+# The server runs in a child process, so its CPU time is measured alone. The "idle"
+# mode has no viewers, its CPU time is the cost of starting the server.
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from bench_log_server import prepare_log_dir
+from event_logger import EventLogger
+from run_index import RunIndex
+
+SERVER_CODE = "import appium_server; appium_server.make_server({port}).serve_forever()"
+
+
+def start_server(work_dir, port):
+    server = subprocess.Popen([sys.executable, "-c", SERVER_CODE.format(port=port)], cwd=work_dir,
+                              env=dict(os.environ, PYTHONPATH=REPO_DIR),
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            connection = http.client.HTTPConnection("localhost", port, timeout=1)
+            connection.request("GET", "/api/runs?per_page=1")
+            connection.getresponse().read()
+            return server
+        except OSError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("Log server did not start")
+
+
+def get(port, path, received):
+    connection = http.client.HTTPConnection("localhost", port, timeout=10)
+    connection.request("GET", path, headers={"Accept-Encoding": "gzip"})
+    received.append(len(connection.getresponse().read()))
+    connection.close()
+
+
+def polling_viewer(port, interval, delay, stop, received):
+    stop.wait(delay)
+    while not stop.is_set():
+        get(port, "/", received)
+        stop.wait(interval)
+
+
+def live_viewer(port, delay, stop, received, frames):
+    stop.wait(delay)
+    get(port, "/", received)
+    # Blocks until the next frame, the connection ends when the server is stopped
+    connection = http.client.HTTPConnection("localhost", port)
+    connection.request("GET", "/api/live")
+    response = connection.getresponse()
+    while True:
+        try:
+            chunk = response.read1(65536)
+        except OSError:
+            break
+        if not chunk:
+            break
+        received.append(len(chunk))
+        frames.append(chunk.count(b"\n\n"))
+    connection.close()
+
+
+def live_run(log_dir, run_id, rate, stop):
+    # Test writing events while dashboards are open
+    logger = EventLogger(log_dir, run_id)
+    index = 0
+    while not stop.is_set():
+        logger.log_event("step", {"name": f"step {index}", "duration": 0.1})
+        index += 1
+        stop.wait(1 / rate)
+    logger.save_to_file()
+    return index
+
+
+def run_benchmark(work_dir, port, mode, viewers, duration, interval, rate):
+    server = start_server(work_dir, port)
+    cpu_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    stop = threading.Event()
+    received = []
+    frames = []
+    if mode == "idle":
+        threads = []
+    elif mode == "polling":
+        threads = [threading.Thread(target=polling_viewer, args=(port, interval, index * interval / viewers, stop, received))
+                   for index in range(viewers)]
+    else:
+        threads = [threading.Thread(target=live_viewer, args=(port, index * 0.01, stop, received, frames))
+                   for index in range(viewers)]
+    writer = threading.Thread(target=live_run, args=(os.path.join(work_dir, "appium_logs"), f"bench_{mode}", rate, stop))
+    for thread in threads + [writer]:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    writer.join()
+    server.terminate()
+    server.wait()
+    for thread in threads:
+        thread.join(timeout=15)
+    cpu_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu_time = (cpu_after.ru_utime - cpu_before.ru_utime) + (cpu_after.ru_stime - cpu_before.ru_stime)
+    return {
+        "mode": mode,
+        "viewers": len(threads),
+        "server_cpu_seconds": round(cpu_time, 3),
+        "received_kb": round(sum(received) / 1024, 1),
+        "live_frames": sum(frames)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dashboards polling the log server against live updates")
+    parser.add_argument("--viewers", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--interval", type=float, default=10.0, help="Reload interval of polling dashboards")
+    parser.add_argument("--rate", type=float, default=20.0, help="Events per second of the running test")
+    parser.add_argument("--runs", type=int, default=200, help="Number of runs in the log folder")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="bench_live_updates_")
+    try:
+        prepare_log_dir(work_dir, args.runs)
+        # Runs are indexed before, so the server start costs the same in all modes
+        RunIndex(os.path.join(work_dir, "appium_logs")).sync()
+        for mode in ("idle", "polling", "live"):
+            result = run_benchmark(work_dir, args.port, mode, args.viewers, args.duration, args.interval, args.rate)
+            print(", ".join(f"{key}: {value}" for key, value in result.items()))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import argparse
+import http.client
+import os
+import shutil
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+# Load benchmark of appium_server.py: many dashboard viewers polling the run list
+# and downloading a large report, while slow clients download the report too.
+# Compares the single-threaded server with the threaded one.
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_LOGS = os.path.join(REPO_DIR, "appium_logs")
+sys.path.insert(0, REPO_DIR)
+
+
+def prepare_log_dir(work_dir, runs):
+    log_dir = os.path.join(work_dir, "appium_logs")
+    os.makedirs(log_dir)
+    samples = [name for name in os.listdir(SAMPLE_LOGS) if name.startswith("appium_events_")]
+    for index in range(runs):
+        for name in samples:
+            run_id, ext = name[len("appium_events_"):].split(".", 1)
+            shutil.copy(os.path.join(SAMPLE_LOGS, name), os.path.join(log_dir, f"appium_events_{run_id}_{index}.{ext}"))
+    return [name for name in os.listdir(log_dir) if name.endswith(".html")][0]
+
+
+def slow_download(port, path, stop):
+    # Reads the response slowly, like a viewer on a bad connection
+    while not stop.is_set():
+        sock = socket.socket()
+        # Small receive buffer, so the server has to wait for this client
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        sock.connect(("localhost", port))
+        sock.sendall(f"GET {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n".encode())
+        while not stop.is_set() and sock.recv(4096):
+            time.sleep(0.05)
+        sock.close()
+
+
+def viewer(port, report_path, stop, latencies, errors):
+    connection = http.client.HTTPConnection("localhost", port, timeout=10)
+    headers = {"Accept-Encoding": "gzip"}
+    etag = None
+    while not stop.is_set():
+        for path in ("/", "/api/runs?per_page=20", report_path):
+            request_headers = dict(headers)
+            if path == report_path and etag:
+                request_headers["If-None-Match"] = etag
+            started = time.perf_counter()
+            try:
+                connection.request("GET", path, headers=request_headers)
+                response = connection.getresponse()
+                response.read()
+                if path == report_path:
+                    etag = response.getheader("ETag")
+                if response.getheader("Connection", "").lower() == "close":
+                    connection.close()
+            except (OSError, http.client.HTTPException):
+                errors.append(path)
+                connection.close()
+                connection = http.client.HTTPConnection("localhost", port, timeout=10)
+                continue
+            latencies.append(time.perf_counter() - started)
+
+
+def run_benchmark(threaded, viewers, slow_clients, duration, report_path):
+    import appium_server
+
+    class QuietHandler(appium_server.handler_class(threaded)):
+        def log_message(self, format, *args):
+            pass
+
+    server_class = appium_server.http.server.ThreadingHTTPServer if threaded else appium_server.http.server.HTTPServer
+    server = server_class(("localhost", 0), QuietHandler)
+    port = server.server_address[1]
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    stop = threading.Event()
+    latencies = []
+    errors = []
+    threads = [threading.Thread(target=slow_download, args=(port, report_path, stop), daemon=True)
+               for _ in range(slow_clients)]
+    threads += [threading.Thread(target=viewer, args=(port, report_path, stop, latencies, errors), daemon=True)
+                for _ in range(viewers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join(timeout=15)
+    server.shutdown()
+    server.server_close()
+
+    latencies.sort()
+    return {
+        "mode": "threaded" if threaded else "single-threaded",
+        "requests": len(latencies),
+        "requests_per_second": round(len(latencies) / duration, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1) if latencies else None,
+        "p95_ms": round(latencies[int(len(latencies) * 0.95)] * 1000, 1) if latencies else None,
+        "errors": len(errors)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark appium_server.py with concurrent viewers")
+    parser.add_argument("--viewers", type=int, default=50)
+    parser.add_argument("--slow-clients", type=int, default=2)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--runs", type=int, default=200, help="Number of runs in the log folder")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="bench_log_server_")
+    try:
+        report_name = prepare_log_dir(work_dir, args.runs)
+        # appium_server serves the appium_logs folder in current directory
+        os.chdir(work_dir)
+        for threaded in (False, True):
+            result = run_benchmark(threaded, args.viewers, args.slow_clients, args.duration, f"/{report_name}")
+            print(", ".join(f"{key}: {value}" for key, value in result.items()))
+    finally:
+        os.chdir(REPO_DIR)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+# Scheduling overhead of scenario_engine.py: time the engine spends around the
+# actions (variable substitution, retries bookkeeping, step events) compared with
+# calling the same functions directly. Runs against the in-process FakeDriver,
+# so driver commands cost microseconds and the engine itself is what is measured.
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from event_logger import EventLogger
+from fake_appium_server import FakeDriver
+from locators import LocatorCache
+from scenario_engine import ScenarioEngine, action, load_scenario, scenario, step
+from screenshot_pipeline import ScreenshotPipeline
+from wifi_test import WIFI_SCENARIO
+
+
+@action("noop")
+def noop_action(context, item):
+    return item.get("value")
+
+
+def bench_noop(log_dir, steps):
+    # Empty actions: everything measured is engine and event logging cost
+    logger = EventLogger(log_dir, "noop")
+    items = [step("noop", value="${counter}", name=f"noop {index}") for index in range(steps)]
+    engine = ScenarioEngine(FakeDriver(), logger)
+    engine_scenario = scenario("noop", items, setup=[lambda context, item: context.variables.update(counter=1)])
+
+    started = time.perf_counter()
+    for item in items:
+        noop_action(None, item)
+    direct_time = time.perf_counter() - started
+
+    result = engine.run(engine_scenario)
+    return {
+        "benchmark": "noop",
+        "steps": steps,
+        "direct_us_per_step": round(direct_time / steps * 1e6, 2),
+        "engine_us_per_step": round(result["duration"] / steps * 1e6, 2),
+        "overhead_us_per_step": round((result["duration"] - direct_time) / steps * 1e6, 2)
+    }
+
+
+def bench_wifi(log_dir, runs, wifi_on):
+    # WiFi scenario many times in one session, app restarted between runs
+    driver = FakeDriver(wifi_on=wifi_on)
+    logger = EventLogger(log_dir, f"wifi_{'on' if wifi_on else 'off'}")
+    locators = LocatorCache(driver, log_dir, logger)
+    screenshots = ScreenshotPipeline(driver, logger, diff=False)
+    engine = ScenarioEngine(driver, logger, locators, screenshots)
+    wifi_scenario = load_scenario(WIFI_SCENARIO)
+
+    started = time.perf_counter()
+    results = engine.run_all([wifi_scenario] * runs)
+    wall_time = time.perf_counter() - started
+    screenshots.close()
+
+    stats = engine.stats()
+    return {
+        "benchmark": f"wifi_settings (WiFi {'on' if wifi_on else 'off'})",
+        "runs": runs,
+        "passed": sum(result["status"] == "passed" for result in results),
+        "steps": stats["steps"],
+        "wall_time": round(wall_time, 3),
+        "action_time": stats["action_time"],
+        "engine_time": stats["engine_time"],
+        "engine_us_per_step": round(stats["engine_time_per_step"] * 1e6, 2),
+        "engine_share": f"{stats['engine_time'] / wall_time:.2%}",
+        "driver_commands": driver.commands
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark scenario engine overhead with an in-process fake driver")
+    parser.add_argument("--steps", type=int, default=5000, help="Steps of the no-op scenario")
+    parser.add_argument("--runs", type=int, default=20, help="WiFi scenario runs in one session")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="bench_scenario_engine_")
+    try:
+        results = [bench_noop(work_dir, args.steps)]
+        for wifi_on in (False, True):
+            results.append(bench_wifi(work_dir, args.runs, wifi_on))
+        for result in results:
+            print(", ".join(f"{key}: {value}" for key, value in result.items()))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+# Offline benchmark suite, runs on plain Linux without a phone or Appium: the WiFi
+# test is replayed from a cassette (cassette.py) by fake_appium_server.py, so what
+# is measured is the framework. Every part is timed first and then run again under
+# tracemalloc for its peak Python memory:
+# - runner: wifi_test.main() against the replay server
+# - logger: EventLogger with page sources and screenshots from the cassette
+# - report: HTML report of the logged run
+# - log server: appium_server.py with concurrent viewers (bench_log_server.py)
+# Results are written as JSON, --baseline compares them with a previous result and
+# exits with 1 when a metric got worse by more than --tolerance (CI regression check).
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+CASSETTE = os.path.join(REPO_DIR, "benchmarks", "cassettes", "wifi_settings.json.gz")
+
+from bench_log_server import prepare_log_dir, run_benchmark
+from cassette import read_cassette
+from event_logger import EventLogger
+from fake_appium_server import make_replay_server
+from report import write_html_report
+import wifi_test
+
+
+def metric(value, unit, better):
+    return {"value": value, "unit": unit, "better": better}
+
+
+def peak_memory(function):
+    # Peak of Python allocations while function runs, in MB
+    tracemalloc.start()
+    try:
+        function()
+        return round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 2)
+    finally:
+        tracemalloc.stop()
+
+
+def recorded_values(cassette, suffix):
+    return [json.loads(interaction["response"])["value"] for interaction in cassette["interactions"]
+            if interaction["path"].endswith(suffix) and interaction["status"] == 200]
+
+
+def bench_runner(work_dir, cassette, runs, latency, timing):
+    server = make_replay_server(cassette, 0, latency, timing)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    appium_url = f"http://localhost:{server.server_address[1]}"
+    log_dir = os.path.join(work_dir, "runner_logs")
+    output = io.StringIO()
+
+    def run():
+        with contextlib.redirect_stdout(output):
+            wifi_test.main(appium_url, log_dir=log_dir, reuse_session=False, record=None)
+
+    try:
+        # First run learns the locators (locators.py), like every run after it on a device
+        run()
+        times = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - started)
+        peak = peak_memory(run)
+    finally:
+        server.shutdown()
+        server.server_close()
+    failed = output.getvalue().count("Error")
+    return {
+        "runner_seconds_per_run": metric(round(min(times), 4), "s", "lower"),
+        "runner_runs_per_second": metric(round(runs / sum(times), 2), "runs/s", "higher"),
+        "runner_peak_memory": metric(peak, "MB", "lower"),
+        "runner_errors": metric(failed, "count", "lower")
+    }
+
+
+def log_run(log_dir, run_id, events, page_sources, screenshots):
+    # Steps like the WiFi test logs them, every 10th with a page source, every 50th with a screenshot
+    logger = EventLogger(log_dir, run_id)
+    started = time.perf_counter()
+    for index in range(events):
+        details = {"name": f"step {index}", "action": "click", "target": "wifi_switch", "duration": 0.05}
+        if page_sources and index % 10 == 0:
+            details["page_source"] = page_sources[index // 10 % len(page_sources)]
+        screenshot = screenshots[index // 50 % len(screenshots)] if screenshots and index % 50 == 0 else None
+        logger.log_event("step", details, screenshot=screenshot)
+    log_time = time.perf_counter() - started
+    started = time.perf_counter()
+    log_file, _ = logger.save_to_file()
+    return log_file, log_time, time.perf_counter() - started
+
+
+def bench_logger(work_dir, cassette, events):
+    log_dir = os.path.join(work_dir, "logger_logs")
+    page_sources = recorded_values(cassette, "/source")
+    screenshots = recorded_values(cassette, "/screenshot")
+    log_file, log_time, save_time = log_run(log_dir, "bench", events, page_sources, screenshots)
+    peak = peak_memory(lambda: log_run(log_dir, "bench_memory", events, page_sources, screenshots))
+    return log_file, {
+        "logger_events_per_second": metric(round(events / log_time, 1), "events/s", "higher"),
+        "logger_save_seconds": metric(round(save_time, 4), "s", "lower"),
+        "logger_peak_memory": metric(peak, "MB", "lower")
+    }
+
+
+def bench_report(work_dir, log_file):
+    html_file = os.path.join(work_dir, "report.html")
+    started = time.perf_counter()
+    write_html_report(log_file, html_file, "bench")
+    report_time = time.perf_counter() - started
+    peak = peak_memory(lambda: write_html_report(log_file, html_file, "bench"))
+    return {
+        "report_seconds": metric(round(report_time, 4), "s", "lower"),
+        "report_kb": metric(round(os.path.getsize(html_file) / 1024, 1), "KB", "lower"),
+        "report_peak_memory": metric(peak, "MB", "lower")
+    }
+
+
+def bench_log_server(work_dir, runs, viewers, duration):
+    server_dir = os.path.join(work_dir, "log_server")
+    os.makedirs(server_dir)
+    report_name = prepare_log_dir(server_dir, runs)
+    # appium_server serves the appium_logs folder in current directory
+    os.chdir(server_dir)
+    try:
+        result = run_benchmark(True, viewers, 0, duration, f"/{report_name}")
+    finally:
+        os.chdir(REPO_DIR)
+    return {
+        "log_server_requests_per_second": metric(result["requests_per_second"], "requests/s", "higher"),
+        "log_server_p95_ms": metric(result["p95_ms"], "ms", "lower"),
+        "log_server_errors": metric(result["errors"], "count", "lower")
+    }
+
+
+def compare(results, baseline, tolerance):
+    # Metrics worse than the baseline by more than tolerance (relative)
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None or base["value"] is None or result["value"] is None:
+            continue
+        if result["better"] == "lower":
+            worse = result["value"] > base["value"] * (1 + tolerance)
+        else:
+            worse = result["value"] < base["value"] * (1 - tolerance)
+        if worse:
+            regressions.append(f"{name}: {result['value']} {result['unit']} (baseline {base['value']})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks of runner, logger, report and log server")
+    parser.add_argument("--cassette", default=CASSETTE, help="Recorded run replayed by the fake Appium server")
+    parser.add_argument("--runs", type=int, default=5, help="Replayed test runs")
+    parser.add_argument("--latency", type=float, default=0.0, help="Delay added to every replayed command in seconds")
+    parser.add_argument("--timing", type=float, default=0.0, help="Multiplier of recorded command durations")
+    parser.add_argument("--events", type=int, default=20000, help="Events logged by the logger benchmark")
+    parser.add_argument("--server-runs", type=int, default=50, help="Runs in the log folder of the log server")
+    parser.add_argument("--viewers", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=3.0, help="Duration of the log server benchmark")
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--baseline", help="Results of a previous run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative regression")
+    args = parser.parse_args()
+
+    cassette = read_cassette(args.cassette)
+    work_dir = tempfile.mkdtemp(prefix="bench_suite_")
+    try:
+        results = {}
+        results.update(bench_runner(work_dir, cassette, args.runs, args.latency, args.timing))
+        log_file, logger_results = bench_logger(work_dir, cassette, args.events)
+        results.update(logger_results)
+        results.update(bench_report(work_dir, log_file))
+        results.update(bench_log_server(work_dir, args.server_runs, args.viewers, args.duration))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    for name, result in results.items():
+        print(f"{name}: {result['value']} {result['unit']}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regression against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
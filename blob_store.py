@@ -0,0 +1,91 @@
+import base64
+import hashlib
+import io
+import os
+import threading
+
+# Pillow is optional, without it reports show full size screenshots
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Content-addressed storage for screenshots and other large artifacts.
+# Every blob is stored once under blobs/<first two hex chars>/<sha256>.<ext>,
+# so identical captures (e.g. repeated screens) share a single file.
+BLOB_DIR_NAME = "blobs"
+
+
+class BlobStore:
+    def __init__(self, log_dir):
+        self.log_dir = log_dir
+        self.root = os.path.join(log_dir, BLOB_DIR_NAME)
+        os.makedirs(self.root, exist_ok=True)
+        self.written = 0
+        self.deduplicated = 0
+        # Counters are updated from screenshot worker threads
+        self.lock = threading.Lock()
+
+    def ref_for(self, digest, ext):
+        # Reference is relative to the log directory, so it can be used
+        # directly as an image source in HTML reports stored next to it
+        return f"{BLOB_DIR_NAME}/{digest[:2]}/{digest}.{ext}"
+
+    def path_for(self, ref):
+        return os.path.join(self.log_dir, *ref.split("/"))
+
+    def put_bytes(self, data, ext="bin"):
+        digest = hashlib.sha256(data).hexdigest()
+        ref = self.ref_for(digest, ext)
+        path = self.path_for(ref)
+
+        if os.path.exists(path):
+            with self.lock:
+                self.deduplicated += 1
+            return ref
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to temporary file first, so readers never see partial blobs
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self.lock:
+            self.written += 1
+        return ref
+
+    def put_base64(self, data, ext="png"):
+        return self.put_bytes(base64.b64decode(data), ext)
+
+    def get_bytes(self, ref):
+        with open(self.path_for(ref), 'rb') as f:
+            return f.read()
+
+    def thumbnail(self, ref, width=320):
+        # Returns reference to downscaled JPEG copy of the image, created on first use
+        if Image is None:
+            return ref
+        digest, _ = os.path.splitext(os.path.basename(ref))
+        thumb_ref = f"{BLOB_DIR_NAME}/{digest[:2]}/{digest}.w{width}.jpg"
+        if os.path.exists(self.path_for(thumb_ref)):
+            return thumb_ref
+
+        with Image.open(self.path_for(ref)) as image:
+            image = image.convert("RGB")
+            image.thumbnail((width, width * 4))
+            buffer = io.BytesIO()
+            image.save(buffer, "JPEG", quality=80)
+
+        path = self.path_for(thumb_ref)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(buffer.getvalue())
+        os.replace(tmp_path, path)
+        return thumb_ref
+
+    def stats(self):
+        return {"written": self.written, "deduplicated": self.deduplicated}
+
+
+def is_blob_ref(value):
+    return isinstance(value, str) and value.startswith(BLOB_DIR_NAME + "/")
@@ -0,0 +1,173 @@
+import argparse
+import gzip
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+# Record and replay of the WebDriver HTTP traffic of a test run. The recorder wraps
+# the HTTP pool of the driver's command executor (like instrumentation.py) and keeps
+# every request with its response and duration. A cassette is a JSON file (gzip
+# compressed when its name ends with .gz), fake_appium_server.py --replay answers
+# the same requests from it, so the runner can be benchmarked without a phone.
+CASSETTE_VERSION = 1
+SESSION_PATH_PATTERN = re.compile(r"^(?:/wd/hub)?/session/([^/]+)")
+SESSION_PLACEHOLDER = "{session}"
+ELEMENT_PATH_PATTERN = re.compile(r"/element/[^/]+(?=/)")
+
+
+def normalize_path(path, session_id=None):
+    # Session id is replaced, every replayed session gets its own id
+    path = urlsplit(path).path
+    match = SESSION_PATH_PATTERN.match(path)
+    if match and (session_id is None or match.group(1) == session_id):
+        path = f"/session/{SESSION_PLACEHOLDER}{path[match.end():]}"
+    return path
+
+
+def canonical_body(body):
+    if not body:
+        return ""
+    if isinstance(body, bytes):
+        body = body.decode()
+    try:
+        return json.dumps(json.loads(body), sort_keys=True, separators=(',', ':'))
+    except ValueError:
+        return body
+
+
+def request_key(method, path, body):
+    # Element ids are left out: when locators race (locators.py) another one can win
+    # than during recording, element commands are answered in the recorded order
+    path = ELEMENT_PATH_PATTERN.sub("/element/*", path)
+    return f"{method} {path} {canonical_body(body)}"
+
+
+def read_cassette(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        cassette = json.load(f)
+    if cassette.get("version") != CASSETTE_VERSION:
+        raise ValueError(f"Unsupported cassette version {cassette.get('version')} in {path}")
+    return cassette
+
+
+def write_cassette(path, cassette):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(tmp_path, 'wt', encoding='utf-8') as f:
+        json.dump(cassette, f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+def record_cassette(driver, path):
+    # Returns the recorder, None when the driver has no keep-alive HTTP pool
+    recorder = CassetteRecorder(path)
+    return recorder if recorder.attach(driver) else None
+
+
+class CassetteRecorder:
+    def __init__(self, path):
+        self.path = path
+        self.session_id = None
+        self.capabilities = None
+        self.interactions = []
+        self.started = time.time()
+        # Screenshot workers send commands from other threads
+        self.lock = threading.Lock()
+
+    def attach(self, driver):
+        connection = getattr(getattr(driver, "command_executor", None), "_conn", None)
+        if connection is None:
+            return False
+        self.session_id = driver.session_id
+        self.capabilities = driver.capabilities
+        original_request = connection.request
+
+        def request(method, url, *args, **kwargs):
+            started = time.perf_counter()
+            response = original_request(method, url, *args, **kwargs)
+            duration = time.perf_counter() - started
+            body = kwargs.get("body")
+            with self.lock:
+                self.interactions.append({
+                    "method": method,
+                    "path": normalize_path(url, self.session_id),
+                    "body": canonical_body(body),
+                    "status": response.status,
+                    "response": (response.data or b"").decode("utf-8", errors="replace"),
+                    "offset": round(time.time() - self.started, 4),
+                    "duration": round(duration, 4)
+                })
+            return response
+
+        connection.request = request
+        return True
+
+    def save(self):
+        with self.lock:
+            cassette = {
+                "version": CASSETTE_VERSION,
+                "recorded": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "capabilities": self.capabilities,
+                "interactions": list(self.interactions)
+            }
+        write_cassette(self.path, cassette)
+        return len(cassette["interactions"])
+
+
+class CassettePlayer:
+    # Replay state of one session: recorded responses of every request in order,
+    # the last one is repeated when the test asks more often than during recording
+    def __init__(self, cassette):
+        self.responses = cassette["responses"] if "responses" in cassette else index_cassette(cassette)
+        self.positions = Counter()
+        self.lock = threading.Lock()
+
+    def next_response(self, method, path, body):
+        key = request_key(method, path, body)
+        responses = self.responses.get(key)
+        if not responses:
+            return None
+        with self.lock:
+            position = min(self.positions[key], len(responses) - 1)
+            self.positions[key] += 1
+        return responses[position]
+
+
+def index_cassette(cassette):
+    # {request key: [interactions]}, shared by all sessions replaying the cassette
+    responses = {}
+    for interaction in cassette["interactions"]:
+        key = request_key(interaction["method"], interaction["path"], interaction["body"])
+        responses.setdefault(key, []).append(interaction)
+    return responses
+
+
+def describe(cassette):
+    commands = Counter(f"{interaction['method']} {ELEMENT_PATH_PATTERN.sub('/element/*', interaction['path'])}"
+                       for interaction in cassette["interactions"])
+    return {
+        "recorded": cassette.get("recorded"),
+        "device": (cassette.get("capabilities") or {}).get("deviceName"),
+        "requests": len(cassette["interactions"]),
+        "distinct_requests": len(index_cassette(cassette)),
+        "recorded_time": round(sum(interaction["duration"] for interaction in cassette["interactions"]), 3),
+        "response_bytes": sum(len(interaction["response"]) for interaction in cassette["interactions"]),
+        "commands": dict(commands.most_common())
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show the WebDriver requests recorded in a cassette")
+    parser.add_argument("path", help="Cassette file (APPIUM_RECORD=path python wifi_test.py records one)")
+    args = parser.parse_args()
+    print(json.dumps(describe(read_cassette(args.path)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
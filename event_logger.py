@@ -0,0 +1,160 @@
+import time
+import json
+import os
+import datetime
+import threading
+from collections import Counter
+from itertools import count
+
+from blob_store import BlobStore
+from event_stream import EventStreamWriter, iter_events
+from page_sources import PageSourceStore
+from run_archive import ARCHIVE_EXT, archive_path, write_archive
+from run_index import RunIndex, write_sidecar
+
+
+class EventLogger:
+    def __init__(self, log_dir="appium_logs", run_id=None):
+        self.start_time = time.time()
+        self.log_dir = log_dir
+        # Parallel runs need own run_id, timestamp alone is not unique
+        # (final run id gets a suffix when the run exists already, see _open_stream)
+        self.timestamp = run_id or datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.event_count = 0
+        # Small running summary, used as index of lazy reports
+        self.type_counts = Counter()
+        self.error_count = 0
+        self.screenshot_count = 0
+        # Set when the run is saved, reports of finished runs are not followed live
+        self.finished = False
+        self.started = datetime.datetime.now().isoformat()
+        self.device = None
+        self.platform_version = None
+        # Screenshots are written to the blob store right away,
+        # events keep only a small reference to the stored file
+        self.blob_store = BlobStore(log_dir)
+        # Page sources in event details are interned and stored as diffs (page_sources.py)
+        self.page_sources = PageSourceStore(self.blob_store)
+        # Events are appended to JSONL file as they happen instead of kept in memory.
+        # The stream stays after the JSON log is written: the log server pages and
+        # follows runs by byte offsets in it, the JSON log is the complete file for
+        # the inline report and other tools. APPIUM_LOG_FORMAT=archive keeps one copy.
+        self.stream = self._open_stream(log_dir)
+        self.stream_file = self.stream.path
+        # Screenshot workers log events from their own threads
+        self.lock = threading.Lock()
+
+    def _open_stream(self, log_dir):
+        # Runs started in the same second (or given the same id) would write into one
+        # stream, the stream is created exclusively and the run id gets a suffix
+        base_id = self.timestamp
+        for attempt in count(1):
+            run_id = base_id if attempt == 1 else f"{base_id}_{attempt}"
+            if any(os.path.exists(os.path.join(log_dir, f"appium_events_{run_id}{ext}")) for ext in (".json", ARCHIVE_EXT)):
+                continue
+            try:
+                stream = EventStreamWriter(os.path.join(log_dir, f"appium_events_{run_id}.jsonl"), exclusive=True)
+            except FileExistsError:
+                continue
+            self.timestamp = run_id
+            return stream
+
+    def log_event(self, event_type, details, screenshot=None, screenshot_ref=None, screenshot_diff=None, at=None):
+        # screenshot is base64 PNG, screenshot_ref a blob already in the store (with
+        # screenshot_diff from image_diff.py), at is the time the event happened if it is logged later
+        at = at or time.time()
+        event = {
+            "type": event_type,
+            "timestamp": datetime.datetime.fromtimestamp(at).isoformat(),
+            "time_from_start": round(at - self.start_time, 2),
+            "details": details
+        }
+        if screenshot:
+            screenshot_ref = self.blob_store.put_base64(screenshot, "png")
+        if isinstance(details, dict) and isinstance(details.get("page_source"), str):
+            ref, summary = self.page_sources.put(details["page_source"])
+            details = {key: value for key, value in details.items() if key != "page_source"}
+            details.update(page_source_ref=ref, page_source_diff=summary)
+            event["details"] = details
+        with self.lock:
+            if screenshot_ref:
+                event["screenshot"] = screenshot_ref
+                self.screenshot_count += 1
+            if screenshot_diff:
+                event["screenshot_diff"] = screenshot_diff
+            # Errors are synced to disk immediately, they often precede a crash
+            self.stream.write(event, durable="error" in event_type)
+            self.event_count += 1
+            self.type_counts[event_type] += 1
+            if "error" in event_type:
+                self.error_count += 1
+            if event_type == "device_info":
+                capabilities = details.get("capabilities", {})
+                self.device = capabilities.get("deviceUDID") or capabilities.get("deviceName")
+                self.platform_version = details.get("platform_version")
+        return event
+
+    def summary(self):
+        return {
+            "run_id": self.timestamp,
+            "event_count": self.event_count,
+            "total_duration": round(time.time() - self.start_time, 2),
+            "error_count": self.error_count,
+            "screenshot_count": self.screenshot_count,
+            "type_counts": dict(self.type_counts),
+            "finished": self.finished
+        }
+
+    def metadata(self):
+        # Run metadata for the run index, stored in sidecar file next to the log
+        return {
+            "run_id": self.timestamp,
+            "started": self.started,
+            "duration": round(time.time() - self.start_time, 2),
+            "event_count": self.event_count,
+            "error_count": self.error_count,
+            "screenshot_count": self.screenshot_count,
+            "status": "failed" if self.error_count else "passed",
+            "device": self.device,
+            "platform_version": self.platform_version
+        }
+
+    def save_to_file(self, log_dir=None):
+        log_dir = log_dir or self.log_dir
+        log_file = os.path.join(log_dir, f"appium_events_{self.timestamp}.json")
+        self.stream.close()
+        self.finished = True
+
+        # Convert JSONL stream to the JSON format event by event,
+        # so the whole run never has to be loaded into memory
+        with open(log_file, 'w') as f:
+            f.write('{\n  "events": [')
+            for index, (_, event) in enumerate(iter_events(self.stream_file)):
+                f.write(",\n" if index else "\n")
+                f.write("\n".join("    " + line for line in json.dumps(event, indent=2).splitlines()))
+            f.write("\n  ],\n")
+            f.write(f'  "total_duration": {round(time.time() - self.start_time, 2)},\n')
+            f.write(f'  "screenshots": {json.dumps(self.blob_store.stats())}\n')
+            f.write("}\n")
+
+        self._record_run(log_dir, self.metadata())
+        return log_file, self.timestamp
+
+    def save_archive(self, log_dir=None):
+        # Compressed run archive (run_archive.py) instead of the JSON log,
+        # the JSONL stream is removed when the archive is complete
+        log_dir = log_dir or self.log_dir
+        archive_file = archive_path(log_dir, self.timestamp)
+        self.stream.close()
+        self.finished = True
+
+        metadata = self.metadata()
+        write_archive(archive_file, (event for _, event in iter_events(self.stream_file)), self.blob_store,
+                      round(time.time() - self.start_time, 2), metadata)
+        os.remove(self.stream_file)
+        self._record_run(log_dir, metadata)
+        return archive_file, self.timestamp
+
+    def _record_run(self, log_dir, metadata):
+        write_sidecar(log_dir, metadata)
+        RunIndex(log_dir).record_run(metadata)
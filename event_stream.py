@@ -0,0 +1,132 @@
+import argparse
+import json
+import os
+import re
+import time
+
+# Append-only JSONL event log. Each event is one line, written as it happens,
+# so a crashed or killed run still leaves everything logged up to that point.
+# The JSON log ({"events": [...], "total_duration": ...}) written from it at the
+# end of the run can be read without loading it as a whole, see iter_log_events.
+EVENTS_START_PATTERN = re.compile(r'"events"\s*:\s*\[')
+TOTAL_DURATION_PATTERN = re.compile(r'"total_duration":\s*([0-9.]+)')
+
+
+class EventStreamWriter:
+    def __init__(self, path, flush_every=20, flush_interval=1.0, fsync_interval=5.0, exclusive=False):
+        # exclusive raises FileExistsError when the stream already exists
+        self.path = path
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.file = open(path, 'x' if exclusive else 'a', encoding='utf-8', buffering=64 * 1024)
+        self.pending = 0
+        self.last_flush = time.monotonic()
+        self.last_fsync = self.last_flush
+
+    def write(self, event, durable=False):
+        self.file.write(json.dumps(event, ensure_ascii=False, separators=(',', ':')) + "\n")
+        self.pending += 1
+
+        now = time.monotonic()
+        if durable or self.pending >= self.flush_every or now - self.last_flush >= self.flush_interval:
+            self.flush(fsync=durable or now - self.last_fsync >= self.fsync_interval)
+
+    def flush(self, fsync=False):
+        if self.file.closed:
+            return
+        self.file.flush()
+        self.pending = 0
+        self.last_flush = time.monotonic()
+        if fsync:
+            os.fsync(self.file.fileno())
+            self.last_fsync = self.last_flush
+
+    def close(self):
+        if not self.file.closed:
+            self.flush(fsync=True)
+            self.file.close()
+
+
+def iter_events(path, offset=0):
+    # Read complete events from a JSONL log, yields (next_offset, event).
+    # A trailing line without newline is an event still being written, skip it
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            offset += len(line)
+            if line.strip():
+                yield offset, json.loads(line)
+
+
+def iter_log_events(json_file, chunk_size=1024 * 1024):
+    # Events of a JSON log one by one, old logs have base64 screenshots inline
+    decoder = json.JSONDecoder()
+    with open(json_file, encoding='utf-8') as f:
+        buffer = f.read(chunk_size)
+        match = EVENTS_START_PATTERN.search(buffer)
+        if match is None:
+            # "events" is the first key of every JSON log, this is something else
+            f.seek(0)
+            yield from json.load(f).get("events", [])
+            return
+        index = match.end()
+        while True:
+            while index < len(buffer) and buffer[index] in " \t\r\n,":
+                index += 1
+            if index < len(buffer) and buffer[index] == "]":
+                return
+            try:
+                if index == len(buffer):
+                    raise ValueError("Buffer ends between events")
+                event, index = decoder.raw_decode(buffer, index)
+            except ValueError:
+                # Event continues in the next chunk
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    raise ValueError(f"Events of {json_file} are not complete")
+                buffer = buffer[index:] + chunk
+                index = 0
+                continue
+            yield event
+
+
+def read_total_duration(json_file):
+    # total_duration is written at the end of the JSON log, read only the tail
+    with open(json_file, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(f.tell() - 4096, 0))
+        tail = f.read().decode(errors="ignore")
+    match = TOTAL_DURATION_PATTERN.search(tail)
+    return float(match.group(1)) if match else None
+
+
+def tail_events(path, offset=0, poll_interval=0.5, stop=None):
+    # Follow a live run like `tail -f`, yields (next_offset, event)
+    while True:
+        if os.path.exists(path):
+            for offset, event in iter_events(path, offset):
+                yield offset, event
+        if stop is not None and stop():
+            return
+        time.sleep(poll_interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print events from JSONL event log")
+    parser.add_argument("path", help="Path to appium_events_*.jsonl file")
+    parser.add_argument("-f", "--follow", action="store_true", help="Keep waiting for new events")
+    args = parser.parse_args()
+
+    events = tail_events(args.path) if args.follow else iter_events(args.path)
+    try:
+        for _, event in events:
+            print(f"[{event['time_from_start']:>8}s] {event['type']}: {json.dumps(event['details'])[:200]}")
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
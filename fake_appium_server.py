@@ -0,0 +1,607 @@
+import argparse
+import base64
+import datetime
+import http.server
+import json
+import re
+import struct
+import threading
+import time
+import uuid
+import zlib
+import xml.etree.ElementTree as ET
+
+from cassette import CassettePlayer, index_cassette, normalize_path, read_cassette
+
+from selenium.common.exceptions import InvalidSelectorException, NoSuchElementException, StaleElementReferenceException
+
+# Local stand-in for Appium server with UiAutomator2 driver, so the runner and the
+# WiFi test can be run without a phone. It implements the W3C WebDriver commands
+# used by the tests against a small model of the Android Settings app.
+PORT = 4723
+ELEMENT_KEY = "element-6066-11e4-a52e-4f735466cecf"
+SCREEN_WIDTH = 1080
+SCREEN_HEIGHT = 2424
+XPATH_PATTERN = re.compile(r"^(\.?)//([\w.*]+)(?:\[(.+)\])?$")
+UI_SELECTOR_PATTERN = re.compile(r'\.(\w+)\("((?:[^"\\]|\\.)*)"\)')
+UI_SELECTOR_ATTRIBUTES = {"text": "text", "resourceId": "resource-id", "className": "class",
+                          "description": "content-desc", "descriptionContains": "content-desc"}
+CONDITION_PATTERN = re.compile(r"^(?:@([\w-]+)\s*=\s*'([^']*)'|contains\(@([\w-]+),\s*'([^']*)'\))$")
+DEFAULT_NETWORKS = [
+    {"name": "Manor", "status": "Connected", "signal": "full"},
+    {"name": "HomeTop", "status": None, "signal": "three bars"},
+    {"name": "Guests", "status": None, "signal": "two bars"},
+]
+
+
+class NoSuchElement(Exception):
+    pass
+
+
+class InvalidSelector(Exception):
+    pass
+
+
+class StaleElement(Exception):
+    pass
+
+
+def make_png(color, width=108, height=242, boxes=()):
+    # Small PNG with solid background (each screen gets its own color)
+    # and filled boxes (left, top, right, bottom, color)
+    rows = [bytearray(bytes(color) * width) for _ in range(height)]
+    for left, top, right, bottom, box_color in boxes:
+        left, right = max(left, 0), min(right, width)
+        for y in range(max(top, 0), min(bottom, height)):
+            rows[y][left * 3:right * 3] = bytes(box_color) * (right - left)
+    raw = b"".join(b"\x00" + bytes(row) for row in rows)
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw))
+            + chunk(b"IEND", b""))
+
+
+class SettingsModel:
+    # Screens of the Settings app, rendered as UiAutomator2 page source
+    SCREEN_COLORS = {"main": (240, 240, 255), "network": (240, 255, 240), "internet": (255, 250, 235)}
+
+    def __init__(self, wifi_on=False, networks=None):
+        self.screens = ["main"]
+        self.wifi_on = wifi_on
+        self.networks = networks if networks is not None else DEFAULT_NETWORKS
+
+    @property
+    def screen(self):
+        return self.screens[-1]
+
+    def render(self):
+        hierarchy = ET.Element("hierarchy", {"index": "0", "class": "hierarchy", "rotation": "0",
+                                             "width": str(SCREEN_WIDTH), "height": str(SCREEN_HEIGHT)})
+        root = self.node(hierarchy, "android.widget.FrameLayout", bounds=(0, 0, SCREEN_WIDTH, SCREEN_HEIGHT))
+        items = self.node(root, "androidx.recyclerview.widget.RecyclerView", resource_id="com.android.settings:id/recycler_view",
+                          bounds=(0, 300, SCREEN_WIDTH, SCREEN_HEIGHT), scrollable=True)
+
+        if self.screen == "main":
+            for index, title in enumerate(["Network and Internet", "Connected devices", "Apps", "Battery"]):
+                self.list_item(items, index, title)
+        elif self.screen == "network":
+            for index, title in enumerate(["Internet", "Calls and SMS", "Airplane mode", "Hotspot and tethering"]):
+                self.list_item(items, index, title)
+        elif self.screen == "internet":
+            row = self.node(items, "android.widget.LinearLayout", bounds=(0, 300, SCREEN_WIDTH, 500), clickable=True)
+            self.node(row, "android.widget.TextView", text="Wi-Fi", resource_id="android:id/title", bounds=(50, 350, 700, 450))
+            self.node(row, "android.widget.Switch", resource_id="android:id/switch_widget", bounds=(850, 350, 1030, 450),
+                      checkable=True, checked=self.wifi_on, clickable=True)
+            if self.wifi_on:
+                for index, network in enumerate(self.networks):
+                    top = 500 + index * 200
+                    content_desc = ",".join(filter(None, [network["name"], network["status"],
+                                                          f"Wi-Fi signal {network['signal']}.", "Secure network"]))
+                    item = self.node(items, "android.widget.LinearLayout", content_desc=content_desc,
+                                     bounds=(0, top, SCREEN_WIDTH, top + 200), clickable=True)
+                    self.node(item, "android.widget.TextView", text=network["name"], resource_id="android:id/title",
+                              bounds=(200, top + 30, 900, top + 100))
+                    if network["status"]:
+                        self.node(item, "android.widget.TextView", text=network["status"], resource_id="android:id/summary",
+                                  bounds=(200, top + 100, 900, top + 170))
+            self.list_item(items, 10, "Add network")
+        return hierarchy
+
+    def list_item(self, parent, index, title):
+        top = 300 + index * 200
+        item = self.node(parent, "android.widget.LinearLayout", bounds=(0, top, SCREEN_WIDTH, top + 200), clickable=True)
+        self.node(item, "android.widget.TextView", text=title, resource_id="android:id/title", bounds=(200, top + 50, 900, top + 150))
+
+    def node(self, parent, class_name, text="", resource_id="", content_desc="", bounds=(0, 0, 0, 0),
+             checkable=False, checked=False, clickable=False, scrollable=False):
+        left, top, right, bottom = bounds
+        attributes = {
+            "index": str(len(parent)), "package": "com.android.settings", "class": class_name, "text": text,
+            "resource-id": resource_id, "content-desc": content_desc, "checkable": str(checkable).lower(),
+            "checked": str(checked).lower(), "clickable": str(clickable).lower(), "enabled": "true",
+            "focusable": str(clickable).lower(), "focused": "false", "long-clickable": "false", "password": "false",
+            "scrollable": str(scrollable).lower(), "selected": "false", "displayed": "true",
+            "bounds": f"[{left},{top}][{right},{bottom}]"
+        }
+        return ET.SubElement(parent, class_name, attributes)
+
+    def click(self, node):
+        title = node.get("text") or "".join(child.get("text", "") for child in node.iter() if child.get("resource-id") == "android:id/title")
+        if node.get("class") == "android.widget.Switch":
+            self.wifi_on = not self.wifi_on
+        elif self.screen == "main" and title == "Network and Internet":
+            self.screens.append("network")
+        elif self.screen == "network" and title == "Internet":
+            self.screens.append("internet")
+
+    def back(self):
+        if len(self.screens) > 1:
+            self.screens.pop()
+
+    def screenshot(self):
+        # Texts and switches are drawn as boxes, at 1/10 of the screen size
+        boxes = []
+        for node in self.render().iter():
+            if node.get("class") not in ("android.widget.TextView", "android.widget.Switch"):
+                continue
+            left, top, right, bottom = (int(value) // 10 for value in re.findall(r"\d+", node.get("bounds")))
+            if node.get("class") == "android.widget.Switch":
+                color = (40, 160, 70) if node.get("checked") == "true" else (150, 150, 150)
+            else:
+                color = (60, 60, 60)
+            boxes.append((left, top, right, bottom, color))
+        return make_png(self.SCREEN_COLORS[self.screen], SCREEN_WIDTH // 10, SCREEN_HEIGHT // 10, boxes)
+
+
+def node_path(root, target):
+    # Position of node in the tree, used as element identity between renders
+    parents = {child: parent for parent in root.iter() for child in parent}
+    path = []
+    while target is not root:
+        parent = parents[target]
+        path.append(list(parent).index(target))
+        target = parent
+    return tuple(reversed(path))
+
+
+def node_at(root, path):
+    node = root
+    for index in path:
+        node = node[index]
+    return node
+
+
+def matches_condition(node, condition):
+    match = CONDITION_PATTERN.match(condition.strip())
+    if not match:
+        raise InvalidSelector(f"Unsupported XPath condition: {condition}")
+    if match.group(1):
+        return node.get(match.group(1)) == match.group(2)
+    return match.group(4) in node.get(match.group(3), "")
+
+
+def find_nodes(context, using, value):
+    candidates = [node for node in context.iter() if node is not context and node.tag != "hierarchy"]
+    if using == "xpath":
+        match = XPATH_PATTERN.match(value.strip())
+        if not match:
+            raise InvalidSelector(f"Unsupported XPath: {value}")
+        _, tag, predicate = match.groups()
+        conditions = re.split(r"\s+or\s+", predicate) if predicate else []
+        return [node for node in candidates
+                if (tag == "*" or node.tag == tag)
+                and (not conditions or any(matches_condition(node, condition) for condition in conditions))]
+    if using == "id":
+        return [node for node in candidates if node.get("resource-id") == value]
+    if using == "accessibility id":
+        return [node for node in candidates if node.get("content-desc") == value]
+    if using == "class name":
+        return [node for node in candidates if node.get("class") == value]
+    if using == "-android uiautomator":
+        # Subset of UiSelector: new UiSelector().text("...").className("...")
+        selectors = UI_SELECTOR_PATTERN.findall(value)
+        if not value.startswith("new UiSelector()") or not selectors:
+            raise InvalidSelector(f"Unsupported UiSelector: {value}")
+        for method, _ in selectors:
+            if method not in UI_SELECTOR_ATTRIBUTES:
+                raise InvalidSelector(f"Unsupported UiSelector method: {method}")
+        return [node for node in candidates
+                if all(argument in node.get(UI_SELECTOR_ATTRIBUTES[method], "") if method.endswith("Contains")
+                       else node.get(UI_SELECTOR_ATTRIBUTES[method]) == argument
+                       for method, argument in selectors)]
+    raise InvalidSelector(f"Unsupported locator strategy: {using}")
+
+
+def node_attribute(node, name):
+    if name == "attributes":
+        return dict(node.attrib)
+    name = {"contentDescription": "content-desc", "resourceId": "resource-id", "className": "class"}.get(name, name)
+    return node.get(name)
+
+
+class FakeSession:
+    def __init__(self, capabilities, wifi_on):
+        self.id = uuid.uuid4().hex
+        self.capabilities = capabilities
+        self.model = SettingsModel(wifi_on=wifi_on)
+        self.elements = {}
+        self.commands = []
+        self.lock = threading.Lock()
+        self.last_command = time.time()
+
+    def expired(self):
+        # Appium deletes sessions without commands for newCommandTimeout seconds
+        timeout = self.capabilities.get("newCommandTimeout", 60)
+        return bool(timeout) and time.time() - self.last_command > timeout
+
+    def add_element(self, root, node):
+        element_id = uuid.uuid4().hex
+        self.elements[element_id] = (self.model.screen, node_path(root, node))
+        return {ELEMENT_KEY: element_id, "ELEMENT": element_id}
+
+    def resolve(self, element_id):
+        if element_id not in self.elements:
+            raise StaleElement(element_id)
+        screen, path = self.elements[element_id]
+        if screen != self.model.screen:
+            raise StaleElement(element_id)
+        root = self.model.render()
+        try:
+            return root, node_at(root, path)
+        except IndexError:
+            raise StaleElement(element_id)
+
+
+class FakeAppiumHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    sessions = {}
+    sessions_lock = threading.Lock()
+    # Added to every command, to simulate a real device
+    latency = 0.0
+    # Added to XPath lookups, on devices they need a full hierarchy dump
+    xpath_delay = 0.0
+    initial_wifi_on = False
+    # Added to session creation, real UiAutomator2 sessions need seconds to start
+    session_delay = 0.0
+    quiet = True
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            super().log_message(format, *args)
+
+    def send_value(self, value, status=200):
+        body = json.dumps({"value": value}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_webdriver_error(self, status, error, message):
+        self.send_value({"error": error, "message": message, "stacktrace": ""}, status)
+
+    def read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}") if length else {}
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def do_DELETE(self):
+        self.dispatch("DELETE")
+
+    def dispatch(self, method):
+        body = self.read_body() if method == "POST" else {}
+        if self.latency:
+            time.sleep(self.latency)
+        parts = [part for part in self.path.split("?")[0].split("/") if part]
+        if parts[:1] == ["wd"]:
+            parts = parts[2:]
+
+        try:
+            if parts == ["status"]:
+                return self.send_value({"ready": True, "message": "Fake Appium server"})
+            if parts == ["session"] and method == "POST":
+                return self.create_session(body)
+            if len(parts) < 2 or parts[0] != "session" or parts[1] not in self.sessions:
+                return self.send_webdriver_error(404, "invalid session id", "Session does not exist")
+            session = self.sessions[parts[1]]
+            if session.expired():
+                with self.sessions_lock:
+                    self.sessions.pop(session.id, None)
+                return self.send_webdriver_error(404, "invalid session id", "Session was terminated after newCommandTimeout")
+            session.last_command = time.time()
+            started = int(time.time() * 1000)
+            with session.lock:
+                result = self.session_command(session, method, parts[2:], body)
+            session.commands.append({"cmd": "/".join([method] + parts[2:3]), "startTime": started,
+                                     "endTime": int(time.time() * 1000)})
+            return self.send_value(result)
+        except NoSuchElement as e:
+            self.send_webdriver_error(404, "no such element", str(e))
+        except StaleElement as e:
+            self.send_webdriver_error(404, "stale element reference", f"Element {e} is no longer attached")
+        except InvalidSelector as e:
+            self.send_webdriver_error(400, "invalid selector", str(e))
+        except KeyError as e:
+            self.send_webdriver_error(404, "unknown command", f"Unknown command: {method} {self.path} ({e})")
+
+    def create_session(self, body):
+        capabilities = dict(body.get("capabilities", {}).get("alwaysMatch", {}))
+        capabilities = {key.replace("appium:", ""): value for key, value in capabilities.items()}
+        capabilities.setdefault("deviceUDID", capabilities.get("udid", "fake-device"))
+        capabilities.setdefault("platformVersion", "15")
+        capabilities.setdefault("deviceName", capabilities["deviceUDID"])
+        if self.session_delay:
+            time.sleep(self.session_delay)
+        session = FakeSession(capabilities, self.initial_wifi_on)
+        with self.sessions_lock:
+            self.sessions[session.id] = session
+        self.send_value({"sessionId": session.id, "capabilities": capabilities})
+
+    def session_command(self, session, method, parts, body):
+        model = session.model
+        command = tuple(parts)
+
+        if method == "DELETE" and not command:
+            with self.sessions_lock:
+                self.sessions.pop(session.id, None)
+            return None
+        if method == "GET" and not command:
+            return session.capabilities
+        if command == ("appium", "device", "current_package"):
+            return "com.android.settings"
+        if command == ("source",):
+            return ET.tostring(model.render(), encoding="unicode")
+        if command == ("screenshot",):
+            return base64.b64encode(model.screenshot()).decode()
+        if command == ("back",):
+            model.back()
+            return None
+        if command == ("orientation",):
+            return "PORTRAIT"
+        if command == ("window", "rect"):
+            return {"x": 0, "y": 0, "width": SCREEN_WIDTH, "height": SCREEN_HEIGHT}
+        if command == ("appium", "device", "system_time"):
+            return datetime.datetime.now().astimezone().isoformat()
+        if command == ("appium", "events"):
+            return {"commands": session.commands}
+        if command in (("execute", "sync"), ("execute",)):
+            return self.execute_script(session, body)
+        if command in (("element",), ("elements",)):
+            root = model.render()
+            return self.find(session, root, root, command[0] == "elements", body)
+
+        if command[0] == "element" and len(command) >= 3:
+            root, node = session.resolve(command[1])
+            action = command[2:]
+            if action in (("element",), ("elements",)):
+                return self.find(session, root, node, action[0] == "elements", body)
+            if action == ("click",):
+                model.click(node)
+                return None
+            if action == ("text",):
+                return node.get("text")
+            if action[0] in ("attribute", "property"):
+                return self.attribute(node, action[1])
+            if action == ("rect",):
+                left, top, right, bottom = map(int, re.findall(r"\d+", node.get("bounds")))
+                return {"x": left, "y": top, "width": right - left, "height": bottom - top}
+            if action == ("enabled",):
+                return node.get("enabled") == "true"
+            if action == ("displayed",):
+                return node.get("displayed") == "true"
+            if action == ("name",):
+                return node.get("class")
+        raise KeyError("/".join(parts))
+
+    def attribute(self, node, name):
+        return node_attribute(node, name)
+
+    def find(self, session, root, context, many, body):
+        if body.get("using") == "xpath" and self.xpath_delay:
+            time.sleep(self.xpath_delay)
+        nodes = find_nodes(context, body.get("using"), body.get("value"))
+        if many:
+            return [session.add_element(root, node) for node in nodes]
+        if not nodes:
+            raise NoSuchElement(f"An element could not be located using {body.get('using')}={body.get('value')}")
+        return session.add_element(root, nodes[0])
+
+    def execute_script(self, session, body):
+        script = body.get("script", "")
+        args = (body.get("args") or [{}])[0]
+        if script == "mobile: getDeviceTime":
+            return datetime.datetime.now().astimezone().isoformat()
+        if script == "mobile: activateApp":
+            session.model.screens = ["main"]
+            return None
+        if script in ("mobile: terminateApp", "mobile: queryAppState"):
+            return 4 if script.endswith("State") else True
+        raise KeyError(f"{script} {args}")
+
+
+class FakeElement:
+    def __init__(self, driver, screen, path):
+        self.driver = driver
+        self.screen = screen
+        self.path = path
+
+    def _node(self):
+        if self.screen != self.driver.model.screen:
+            raise StaleElementReferenceException(f"Element {self.path} is not on screen {self.driver.model.screen}")
+        try:
+            return node_at(self.driver.model.render(), self.path)
+        except IndexError:
+            raise StaleElementReferenceException(f"Element {self.path} is not on screen {self.driver.model.screen}")
+
+    def click(self):
+        self.driver.commands += 1
+        self.driver.model.click(self._node())
+
+    def get_attribute(self, name):
+        self.driver.commands += 1
+        return node_attribute(self._node(), name)
+
+    @property
+    def text(self):
+        return self.get_attribute("text")
+
+
+class FakeDriver:
+    # In-process driver over the same Settings model, without HTTP and JSON encoding.
+    # Commands cost microseconds, so benchmarks measure the code around the driver
+    def __init__(self, wifi_on=False, capabilities=None):
+        self.model = SettingsModel(wifi_on=wifi_on)
+        self.session_id = uuid.uuid4().hex
+        self.capabilities = dict({"platformName": "Android", "platformVersion": "14", "deviceName": "fake",
+                                  "udid": "fake-in-process"}, **(capabilities or {}))
+        self.commands = 0
+
+    def find_elements(self, by, value):
+        self.commands += 1
+        root = self.model.render()
+        try:
+            nodes = find_nodes(root, by, value)
+        except InvalidSelector as e:
+            raise InvalidSelectorException(str(e))
+        return [FakeElement(self, self.model.screen, node_path(root, node)) for node in nodes]
+
+    def find_element(self, by, value):
+        elements = self.find_elements(by, value)
+        if not elements:
+            raise NoSuchElementException(f"An element could not be located using {by}={value}")
+        return elements[0]
+
+    @property
+    def page_source(self):
+        self.commands += 1
+        return ET.tostring(self.model.render(), encoding="unicode")
+
+    def get_screenshot_as_png(self):
+        self.commands += 1
+        return self.model.screenshot()
+
+    def get_screenshot_as_base64(self):
+        return base64.b64encode(self.get_screenshot_as_png()).decode()
+
+    def back(self):
+        self.commands += 1
+        self.model.back()
+
+    def terminate_app(self, app_package):
+        self.commands += 1
+        return True
+
+    def activate_app(self, app_package):
+        self.commands += 1
+        self.model.screens = ["main"]
+
+    def quit(self):
+        pass
+
+
+class ReplayHandler(FakeAppiumHandler):
+    # Answers WebDriver requests with the responses recorded in a cassette (cassette.py),
+    # every session replays the cassette from its start
+    cassette = None
+    # Recorded duration of every command is multiplied by this (0 answers at once)
+    timing = 0.0
+
+    def dispatch(self, method):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        if self.latency:
+            time.sleep(self.latency)
+        path = self.path.split("?")[0]
+        if path.startswith("/wd/hub"):
+            path = path[len("/wd/hub"):]
+
+        if path == "/status":
+            return self.send_value({"ready": True, "message": "Fake Appium server (replay)"})
+        if path == "/session" and method == "POST":
+            if self.session_delay:
+                time.sleep(self.session_delay)
+            session_id = uuid.uuid4().hex
+            with self.sessions_lock:
+                self.sessions[session_id] = CassettePlayer(self.cassette)
+            return self.send_value({"sessionId": session_id, "capabilities": self.cassette["capabilities"]})
+        parts = path.split("/")
+        player = self.sessions.get(parts[2]) if len(parts) > 2 and parts[1] == "session" else None
+        if player is None:
+            return self.send_webdriver_error(404, "invalid session id", "Session does not exist")
+        command = normalize_path(path)
+        if method == "DELETE" and command == "/session/{session}":
+            with self.sessions_lock:
+                self.sessions.pop(parts[2], None)
+            return self.send_value(None)
+
+        interaction = player.next_response(method, command, body)
+        if interaction is None:
+            if method == "GET" and command == "/session/{session}":
+                return self.send_value(self.cassette["capabilities"])
+            if command.endswith("/elements"):
+                return self.send_value([])
+            if command.endswith("/element"):
+                # Locator tried in another order than during recording
+                return self.send_webdriver_error(404, "no such element", "Element was not found in the cassette")
+            return self.send_webdriver_error(404, "unknown command", f"Not recorded in the cassette: {method} {command}")
+        if self.timing:
+            time.sleep(interaction["duration"] * self.timing)
+        response = interaction["response"].encode()
+        self.send_response(interaction["status"])
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+
+def make_replay_server(cassette, port=PORT, latency=0.0, timing=0.0, session_delay=0.0):
+    # cassette is a path or a cassette read by cassette.read_cassette()
+    if isinstance(cassette, str):
+        cassette = read_cassette(cassette)
+    cassette = dict(cassette, responses=index_cassette(cassette))
+    handler = type("ConfiguredReplayHandler", (ReplayHandler,),
+                   {"cassette": cassette, "latency": latency, "timing": timing,
+                    "session_delay": session_delay, "sessions": {}})
+    return http.server.ThreadingHTTPServer(("localhost", port), handler)
+
+
+def make_fake_server(port=PORT, latency=0.0, wifi_on=False, xpath_delay=0.0, session_delay=0.0):
+    handler = type("ConfiguredFakeAppiumHandler", (FakeAppiumHandler,),
+                   {"latency": latency, "initial_wifi_on": wifi_on, "xpath_delay": xpath_delay,
+                    "session_delay": session_delay, "sessions": {}})
+    return http.server.ThreadingHTTPServer(("localhost", port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Appium server with Android Settings app model")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--latency", type=float, default=0.0, help="Delay added to every command in seconds")
+    parser.add_argument("--xpath-delay", type=float, default=0.0, help="Extra delay of XPath lookups in seconds")
+    parser.add_argument("--wifi-on", action="store_true", help="Start with WiFi turned on")
+    parser.add_argument("--session-delay", type=float, default=0.0, help="Delay of session creation in seconds")
+    parser.add_argument("--replay", metavar="CASSETTE", help="Answer with the responses recorded in a cassette")
+    parser.add_argument("--timing", type=float, default=0.0,
+                        help="With --replay, wait the recorded duration of every command times this")
+    args = parser.parse_args()
+
+    if args.replay:
+        server = make_replay_server(args.replay, args.port, args.latency, args.timing, args.session_delay)
+    else:
+        server = make_fake_server(args.port, args.latency, args.wifi_on, args.xpath_delay, args.session_delay)
+    with server:
+        print(f"Fake Appium server listening at http://localhost:{server.server_address[1]}")
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+import json
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+
+# Timing of every WebDriver command without changing the test code. driver.execute
+# (used by the driver and all its elements) and the HTTP pool of its command
+# executor are wrapped on the driver instance. For every command it records:
+# - client time: Selenium/Appium client code (encoding, JSON parsing, error handling)
+# - HTTP time: request to Appium until the whole response is read
+# - device time: HTTP time minus the /status round trip measured when the driver
+#   is instrumented, i.e. the time spent in the Appium server and on the device
+# - request and response bytes, and the outcome ("ok" or the exception name)
+# Counters of each run are logged as "command_stats" event, cumulative counters are
+# written to metrics/ in the log folder (one file per device, a new session continues
+# the counters of the last one), appium_server.py serves them on /metrics.
+# APPIUM_INSTRUMENTATION=0 leaves the driver untouched.
+ENABLED = os.environ.get("APPIUM_INSTRUMENTATION", "1") != "0"
+METRICS_DIR_NAME = "metrics"
+# Characters of device names not used in snapshot file names
+UNSAFE_NAME = re.compile(r"[^\w.-]")
+# Upper bounds (seconds) of the latency histogram
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Cumulative counters are written at most this often while commands are sent
+SNAPSHOT_INTERVAL = 5.0
+# /status requests used to measure the round trip to the Appium server
+RTT_SAMPLES = 3
+
+
+def device_name(driver):
+    capabilities = getattr(driver, "capabilities", None) or {}
+    return (capabilities.get("udid") or capabilities.get("appium:udid") or capabilities.get("deviceUDID")
+            or capabilities.get("deviceName") or capabilities.get("appium:deviceName") or "unknown")
+
+
+def new_counters():
+    return {"count": 0, "outcomes": {}, "total_time": 0.0, "client_time": 0.0, "http_time": 0.0,
+            "device_time": 0.0, "max_time": 0.0, "request_bytes": 0, "response_bytes": 0,
+            "buckets": [0] * (len(LATENCY_BUCKETS) + 1)}
+
+
+def instrument(driver, log_dir="appium_logs", enabled=ENABLED):
+    # Returns CommandMetrics of the driver, None when instrumentation is off
+    if not enabled or not hasattr(driver, "execute"):
+        return None
+    metrics = getattr(driver, "command_metrics", None)
+    if metrics is None:
+        metrics = CommandMetrics(log_dir, device_name(driver), getattr(driver, "session_id", None))
+        metrics.attach(driver)
+        driver.command_metrics = metrics
+    return metrics
+
+
+class CommandMetrics:
+    def __init__(self, log_dir, device, session_id=None, snapshot_interval=SNAPSHOT_INTERVAL):
+        self.device = device
+        self.session_id = session_id
+        self.snapshot_interval = snapshot_interval
+        self.snapshot_path = os.path.join(log_dir, METRICS_DIR_NAME, f"commands_{UNSAFE_NAME.sub('_', device)}.json")
+        self.network_rtt = 0.0
+        self.http_measured = False
+        # {command: counters} of the device (all its sessions) and since the last run_stats()
+        self.totals = self._load_totals()
+        self.run = {}
+        self.last_snapshot = 0.0
+        # HTTP time and bytes of the command being executed in this thread
+        self.local = threading.local()
+        # Screenshot workers send commands from other threads
+        self.lock = threading.Lock()
+
+    def _load_totals(self):
+        try:
+            with open(self.snapshot_path) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if tuple(snapshot.get("buckets", ())) != LATENCY_BUCKETS:
+            return {}
+        return snapshot["commands"]
+
+    def attach(self, driver):
+        local = self.local
+        original_execute = driver.execute
+
+        def execute(driver_command, params=None):
+            if getattr(local, "http_time", None) is not None:
+                # Command sent by another command, counted with the outer one
+                return original_execute(driver_command, params)
+            local.http_time = 0.0
+            local.request_bytes = 0
+            local.response_bytes = 0
+            outcome = "ok"
+            started = time.perf_counter()
+            try:
+                return original_execute(driver_command, params)
+            except Exception as e:
+                outcome = type(e).__name__
+                raise
+            finally:
+                total = time.perf_counter() - started
+                http_time = local.http_time
+                local.http_time = None
+                self.record(driver_command, outcome, total, http_time, local.request_bytes, local.response_bytes)
+
+        driver.execute = execute
+
+        executor = getattr(driver, "command_executor", None)
+        connection = getattr(executor, "_conn", None)
+        if connection is None:
+            # No keep-alive pool (or not a remote driver), only total time is known
+            return
+        original_request = connection.request
+        self.network_rtt = self.measure_rtt(original_request, getattr(executor, "_url", None))
+
+        def request(method, url, *args, **kwargs):
+            started = time.perf_counter()
+            response = original_request(method, url, *args, **kwargs)
+            if getattr(local, "http_time", None) is not None:
+                local.http_time += time.perf_counter() - started
+                local.request_bytes += len(kwargs.get("body") or b"")
+                local.response_bytes += len(response.data or b"")
+            return response
+
+        connection.request = request
+        self.http_measured = True
+
+    def measure_rtt(self, request, url):
+        # Fastest /status request, Appium answers it without the device
+        if not url:
+            return 0.0
+        samples = []
+        for _ in range(RTT_SAMPLES):
+            started = time.perf_counter()
+            try:
+                request("GET", f"{url.rstrip('/')}/status")
+            except Exception:
+                return 0.0
+            samples.append(time.perf_counter() - started)
+        return min(samples)
+
+    def record(self, command, outcome, total, http_time, request_bytes, response_bytes):
+        if self.http_measured:
+            client_time = max(total - http_time, 0.0)
+            device_time = max(http_time - self.network_rtt, 0.0)
+        else:
+            client_time = device_time = http_time = 0.0
+        bucket = bisect_left(LATENCY_BUCKETS, total)
+        with self.lock:
+            for table in (self.totals, self.run):
+                counters = table.get(command)
+                if counters is None:
+                    counters = table[command] = new_counters()
+                counters["count"] += 1
+                counters["outcomes"][outcome] = counters["outcomes"].get(outcome, 0) + 1
+                counters["total_time"] += total
+                counters["client_time"] += client_time
+                counters["http_time"] += http_time
+                counters["device_time"] += device_time
+                counters["max_time"] = max(counters["max_time"], total)
+                counters["request_bytes"] += request_bytes
+                counters["response_bytes"] += response_bytes
+                counters["buckets"][bucket] += 1
+            now = time.monotonic()
+            snapshot = None
+            if now - self.last_snapshot >= self.snapshot_interval:
+                self.last_snapshot = now
+                snapshot = self._snapshot()
+        if snapshot is not None:
+            self.write_snapshot(snapshot)
+
+    def _snapshot(self):
+        # Called with lock held
+        return {
+            "device": self.device,
+            "session_id": self.session_id,
+            "network_rtt": self.network_rtt,
+            "updated": time.time(),
+            "buckets": LATENCY_BUCKETS,
+            "commands": {command: dict(counters, outcomes=dict(counters["outcomes"]), buckets=list(counters["buckets"]))
+                         for command, counters in self.totals.items()}
+        }
+
+    def write_snapshot(self, snapshot=None):
+        if snapshot is None:
+            with self.lock:
+                snapshot = self._snapshot()
+        tmp_path = f"{self.snapshot_path}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.snapshot_path), exist_ok=True)
+            with open(tmp_path, 'w') as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, self.snapshot_path)
+        except OSError as e:
+            # Metrics must not fail the test
+            print(f"Could not write command metrics: {e}")
+
+    def run_stats(self):
+        # Counters since the last call, logged once per run as "command_stats"
+        with self.lock:
+            run, self.run = self.run, {}
+        commands = {}
+        for command, counters in sorted(run.items(), key=lambda item: -item[1]["total_time"]):
+            commands[command] = {
+                "count": counters["count"],
+                "errors": {outcome: count for outcome, count in counters["outcomes"].items() if outcome != "ok"},
+                "total_time": round(counters["total_time"], 3),
+                "mean_ms": round(counters["total_time"] / counters["count"] * 1000, 2),
+                "max_ms": round(counters["max_time"] * 1000, 2),
+                "client_time": round(counters["client_time"], 3),
+                "http_time": round(counters["http_time"], 3),
+                "device_time": round(counters["device_time"], 3),
+                "request_bytes": counters["request_bytes"],
+                "response_bytes": counters["response_bytes"]
+            }
+        return {
+            "device": self.device,
+            "http_measured": self.http_measured,
+            "network_rtt_ms": round(self.network_rtt * 1000, 2),
+            "commands_sent": sum(counters["count"] for counters in run.values()),
+            "command_time": round(sum(counters["total_time"] for counters in run.values()), 3),
+            "client_time": round(sum(counters["client_time"] for counters in run.values()), 3),
+            "http_time": round(sum(counters["http_time"] for counters in run.values()), 3),
+            "device_time": round(sum(counters["device_time"] for counters in run.values()), 3),
+            "commands": commands
+        }
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def read_snapshots(metrics_dir, cache=None):
+    # Snapshots of all instrumented devices, cache ({path: (mtime, snapshot)}) skips unchanged files
+    snapshots = []
+    try:
+        names = sorted(name for name in os.listdir(metrics_dir) if name.endswith(".json"))
+    except FileNotFoundError:
+        return snapshots
+    for name in names:
+        path = os.path.join(metrics_dir, name)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+            if cache is not None and path in cache and cache[path][0] == mtime:
+                snapshots.append(cache[path][1])
+                continue
+            with open(path) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if cache is not None:
+            cache[path] = (mtime, snapshot)
+        snapshots.append(snapshot)
+    return snapshots
+
+
+def render_openmetrics(snapshots):
+    # OpenMetrics text exposition, counters summed per device and command
+    merged = {}
+    for snapshot in snapshots:
+        if tuple(snapshot.get("buckets", ())) != LATENCY_BUCKETS:
+            continue
+        for command, counters in snapshot["commands"].items():
+            key = (snapshot["device"], command)
+            total = merged.get(key)
+            if total is None:
+                total = merged[key] = new_counters()
+            for field in ("count", "total_time", "client_time", "http_time", "device_time",
+                          "request_bytes", "response_bytes"):
+                total[field] += counters[field]
+            for outcome, count in counters["outcomes"].items():
+                total["outcomes"][outcome] = total["outcomes"].get(outcome, 0) + count
+            total["buckets"] = [a + b for a, b in zip(total["buckets"], counters["buckets"])]
+
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# TYPE {name} {kind}")
+        lines.append(f"# HELP {name} {help_text}")
+        for suffix, labels, value in samples:
+            label_text = ",".join(f'{label}="{escape_label(label_value)}"' for label, label_value in labels)
+            lines.append(f"{name}{suffix}{{{label_text}}} {value}")
+
+    keys = sorted(merged)
+    metric("appium_commands", "counter", "WebDriver commands sent to Appium by outcome",
+           [("_total", (("device", device), ("command", command), ("outcome", outcome)), count)
+            for device, command in keys for outcome, count in sorted(merged[(device, command)]["outcomes"].items())])
+
+    samples = []
+    for device, command in keys:
+        counters = merged[(device, command)]
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), counters["buckets"]):
+            cumulative += count
+            samples.append(("_bucket", (("device", device), ("command", command), ("le", bound)), cumulative))
+        samples.append(("_sum", (("device", device), ("command", command)), round(counters["total_time"], 6)))
+        samples.append(("_count", (("device", device), ("command", command)), counters["count"]))
+    metric("appium_command_duration_seconds", "histogram", "Latency of WebDriver commands", samples)
+
+    for part, help_text in (("client", "Time in the WebDriver client (encoding, parsing)"),
+                            ("http", "Time of HTTP requests to Appium"),
+                            ("device", "HTTP time minus network round trip (Appium server and device)")):
+        metric(f"appium_command_{part}_seconds", "counter", help_text,
+               [("_total", (("device", device), ("command", command)), round(merged[(device, command)][f"{part}_time"], 6))
+                for device, command in keys])
+    for direction in ("request", "response"):
+        metric(f"appium_command_{direction}_bytes", "counter", f"Size of WebDriver {direction} bodies",
+               [("_total", (("device", device), ("command", command)), merged[(device, command)][f"{direction}_bytes"])
+                for device, command in keys])
+    lines.append("# EOF")
+    return "\n".join(lines) + "\n"
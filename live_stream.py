@@ -0,0 +1,337 @@
+import bisect
+import json
+import os
+import queue
+import re
+import threading
+import time
+from collections import deque
+
+from event_stream import iter_events
+
+# Live updates of running tests for the log server, sent as Server-Sent Events.
+# One tailer thread per live run follows its JSONL stream and hands every new event
+# to all connected viewers, and one watcher thread follows the log folder for the
+# run list. Open dashboards only wait for frames, they do not poll the server.
+# Event ids of a run are byte offsets in its stream: a reconnecting EventSource
+# sends the last one in Last-Event-ID and gets only the events after it.
+POLL_INTERVAL = 0.5
+# Comment line sent to idle connections, so closed ones are noticed
+KEEPALIVE_INTERVAL = 15
+KEEPALIVE_FRAME = b": keepalive\n\n"
+# Browser reconnect delay, also how often single-threaded servers are asked again
+RETRY_MS = 5000
+# A viewer this many frames behind is disconnected, it reconnects with Last-Event-ID
+MAX_QUEUED_FRAMES = 1000
+# Threads without viewers stop after this many seconds
+IDLE_TIMEOUT = 30
+# Finished runs kept for run list viewers which reconnect
+RECENT_RUNS = 256
+# Running runs in the run list are updated at most this often, with these fields only
+PROGRESS_INTERVAL = 5.0
+PROGRESS_FIELDS = ("run_id", "duration", "event_count", "error_count")
+STREAM_FILE_PATTERN = re.compile(r"^appium_events_(.+)\.jsonl$")
+SIDECAR_FILE_PATTERN = re.compile(r"^appium_events_(.+)\.meta\.json$")
+
+
+def sse_frame(event_type, data, event_id=None):
+    # json.dumps escapes newlines, so the data always fits on one line
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines.append(f"event: {event_type}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return ("\n".join(lines) + "\n\n").encode()
+
+
+def run_finished(log_dir, run_id):
+    # The stream is complete once the JSON log, archive or sidecar of the run exists
+    return any(os.path.exists(os.path.join(log_dir, f"appium_events_{run_id}{ext}"))
+               for ext in (".meta.json", ".json", ".arun"))
+
+
+class Subscription:
+    def __init__(self):
+        self.frames = queue.Queue(MAX_QUEUED_FRAMES)
+        self.closed = False
+
+    def push(self, frame):
+        if self.closed:
+            return
+        try:
+            self.frames.put_nowait(frame)
+        except queue.Full:
+            # Queued frames are still sent, the viewer continues from the last one
+            self.closed = True
+
+    def close(self):
+        self.closed = True
+
+    def get(self, timeout=KEEPALIVE_INTERVAL):
+        # Next frame, keep-alive comment after timeout, None when closed and drained
+        try:
+            return self.frames.get(timeout=0 if self.closed else timeout)
+        except queue.Empty:
+            return None if self.closed else KEEPALIVE_FRAME
+
+
+class Broadcaster:
+    # Background thread calling poll() while somebody listens
+    def __init__(self, poll_interval=POLL_INTERVAL, idle_timeout=IDLE_TIMEOUT):
+        self.poll_interval = poll_interval
+        self.idle_timeout = idle_timeout
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stopped = False
+        self.idle_since = time.monotonic()
+        self.on_stop = None
+
+    def add_subscriber(self):
+        # Called with lock held
+        subscription = Subscription()
+        self.subscribers.add(subscription)
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscription.close()
+        with self.lock:
+            self.subscribers.discard(subscription)
+            if not self.subscribers:
+                self.idle_since = time.monotonic()
+
+    def publish(self, frame):
+        # Called with lock held
+        for subscription in list(self.subscribers):
+            subscription.push(frame)
+            if subscription.closed:
+                self.subscribers.discard(subscription)
+
+    def _run(self):
+        while True:
+            try:
+                done = self.poll()
+            except (OSError, ValueError):
+                # Viewers are disconnected and reconnect to a new thread
+                done = True
+            with self.lock:
+                self.subscribers = {subscription for subscription in self.subscribers if not subscription.closed}
+                if done or (not self.subscribers and time.monotonic() - self.idle_since > self.idle_timeout):
+                    for subscription in self.subscribers:
+                        subscription.close()
+                    self.stopped = True
+                    break
+            time.sleep(self.poll_interval)
+        if self.on_stop is not None:
+            self.on_stop(self)
+
+    def poll(self):
+        raise NotImplementedError
+
+
+class RunTailer(Broadcaster):
+    # Follows the JSONL stream of one run, "event" frames carry the event with its index
+    def __init__(self, log_dir, run_id, **kwargs):
+        super().__init__(**kwargs)
+        self.log_dir = log_dir
+        self.run_id = run_id
+        self.path = os.path.join(log_dir, f"appium_events_{run_id}.jsonl")
+        # Offset after each event read so far, event ids and index lookup
+        self.ends = []
+        self.offset = 0
+        self.finished = False
+
+    def _read(self):
+        # Called with lock held
+        try:
+            for next_offset, event in iter_events(self.path, self.offset):
+                event["index"] = len(self.ends)
+                self.ends.append(next_offset)
+                self.offset = next_offset
+                self.publish(sse_frame("event", event, next_offset))
+        except FileNotFoundError:
+            # Archived runs have no stream anymore, viewers page through the archive
+            pass
+
+    def subscribe(self, since=0):
+        # Returns (subscription, frames before it) or None when the tailer stopped.
+        # Frames up to the current offset are read from the file for this viewer,
+        # later ones come through the subscription
+        finished = self.finished or run_finished(self.log_dir, self.run_id)
+        forget = False
+        with self.lock:
+            if self.stopped:
+                return None
+            self._read()
+            index = bisect.bisect_right(self.ends, since)
+            start = self.ends[index - 1] if index else 0
+            if finished:
+                # Nothing more will come, no thread is needed for this viewer
+                subscription = Subscription()
+                subscription.close()
+                end = sse_frame("end", {"run_id": self.run_id, "event_count": len(self.ends)})
+                self.stopped = True
+                forget = self.thread is None
+            else:
+                subscription = self.add_subscriber()
+                end = None
+            upto = self.offset
+        if forget and self.on_stop is not None:
+            self.on_stop(self)
+        return subscription, self._backlog(start, index, upto, end)
+
+    def _backlog(self, offset, index, upto, end=None):
+        yield from self._read_frames(offset, index, upto)
+        if end is not None:
+            yield end
+
+    def _read_frames(self, offset, index, upto):
+        if offset >= upto:
+            return
+        try:
+            for next_offset, event in iter_events(self.path, offset):
+                if next_offset > upto:
+                    break
+                event["index"] = index
+                index += 1
+                yield sse_frame("event", event, next_offset)
+        except FileNotFoundError:
+            return
+
+    def poll(self):
+        # Finished state is checked before the last read, so no event is missed
+        finished = run_finished(self.log_dir, self.run_id)
+        with self.lock:
+            self._read()
+            if finished:
+                self.finished = True
+                self.publish(sse_frame("end", {"run_id": self.run_id, "event_count": len(self.ends)}))
+        return finished
+
+
+class RunsWatcher(Broadcaster):
+    # Follows the log folder. "run" frames carry the whole run list entry of started
+    # and finished runs, "progress" frames a few counters of running ones.
+    # describe(run_id) returns the run list entry of a run
+    def __init__(self, log_dir, describe, progress_interval=PROGRESS_INTERVAL, **kwargs):
+        super().__init__(**kwargs)
+        self.log_dir = log_dir
+        self.describe = describe
+        self.progress_interval = progress_interval
+        self.dir_mtime = None
+        self.sidecars = None
+        # {run_id: (stream size, last update)} of running runs, {run_id: frame} with their last state
+        self.running = {}
+        self.current = {}
+        self.sequence = 0
+        self.recent = deque(maxlen=RECENT_RUNS)
+
+    def subscribe(self, last_id=0):
+        # Running runs are sent to every new viewer, finished ones since last_id
+        with self.lock:
+            if self.stopped:
+                return None
+            if self.sidecars is None:
+                self._scan()
+            if last_id > self.sequence:
+                # Id from before a server restart
+                last_id = 0
+            frames = list(self.current.values()) + [frame for sequence, frame in self.recent if sequence > last_id]
+            return self.add_subscriber(), frames
+
+    def _frame(self, run_id):
+        self.sequence += 1
+        return self.sequence, sse_frame("run", self.describe(run_id), self.sequence)
+
+    def _scan(self):
+        # Called with lock held
+        dir_mtime = os.stat(self.log_dir).st_mtime_ns
+        if dir_mtime != self.dir_mtime:
+            self.dir_mtime = dir_mtime
+            names = os.listdir(self.log_dir)
+            sidecars = {match.group(1) for match in map(SIDECAR_FILE_PATTERN.match, names) if match}
+            for name in names:
+                match = STREAM_FILE_PATTERN.match(name)
+                if match and match.group(1) not in sidecars:
+                    self.running.setdefault(match.group(1), (None, 0))
+            if self.sidecars is not None:
+                for run_id in sorted(sidecars - self.sidecars):
+                    self.running.pop(run_id, None)
+                    self.current.pop(run_id, None)
+                    sequence, frame = self._frame(run_id)
+                    self.recent.append((sequence, frame))
+                    self.publish(frame)
+            self.sidecars = sidecars
+
+        now = time.monotonic()
+        for run_id, (size, updated) in list(self.running.items()):
+            try:
+                new_size = os.path.getsize(os.path.join(self.log_dir, f"appium_events_{run_id}.jsonl"))
+            except OSError:
+                # Stream removed without a sidecar (e.g. deleted run)
+                del self.running[run_id]
+                self.current.pop(run_id, None)
+                continue
+            if not new_size or new_size == size or (size is not None and now - updated < self.progress_interval):
+                continue
+            run = self.describe(run_id)
+            # Whole entry is kept for viewers which connect later
+            self.current[run_id] = sse_frame("run", run)
+            self.running[run_id] = (new_size, now)
+            self.publish(self.current[run_id] if size is None
+                         else sse_frame("progress", {field: run.get(field) for field in PROGRESS_FIELDS}))
+
+    def poll(self):
+        with self.lock:
+            self._scan()
+        return False
+
+
+class LiveHub:
+    # Shared tailers and run list watcher of one log folder
+    def __init__(self, log_dir, describe_run):
+        self.log_dir = log_dir
+        self.describe_run = describe_run
+        self.tailers = {}
+        self.watcher = None
+        self.lock = threading.Lock()
+
+    def _forget(self, broadcaster):
+        with self.lock:
+            if self.tailers.get(getattr(broadcaster, "run_id", None)) is broadcaster:
+                del self.tailers[broadcaster.run_id]
+            if self.watcher is broadcaster:
+                self.watcher = None
+
+    def subscribe_run(self, run_id, since=0):
+        while True:
+            with self.lock:
+                tailer = self.tailers.get(run_id)
+                if tailer is None or tailer.stopped:
+                    tailer = self.tailers[run_id] = RunTailer(self.log_dir, run_id)
+                    tailer.on_stop = self._forget
+            subscribed = tailer.subscribe(since)
+            if subscribed is not None:
+                return (tailer,) + subscribed
+
+    def subscribe_runs(self, last_id=0):
+        while True:
+            with self.lock:
+                if self.watcher is None or self.watcher.stopped:
+                    self.watcher = RunsWatcher(self.log_dir, self.describe_run)
+                    self.watcher.on_stop = self._forget
+                watcher = self.watcher
+            subscribed = watcher.subscribe(last_id)
+            if subscribed is not None:
+                return (watcher,) + subscribed
+
+    def stats(self):
+        with self.lock:
+            tailers = list(self.tailers.values())
+            watcher = self.watcher
+        return {
+            "live_runs": len(tailers),
+            "run_viewers": sum(len(tailer.subscribers) for tailer in tailers),
+            "list_viewers": len(watcher.subscribers) if watcher is not None else 0
+        }
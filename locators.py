@@ -0,0 +1,241 @@
+import json
+import os
+import re
+import threading
+import time
+
+from appium.webdriver.common.appiumby import AppiumBy
+from selenium.common.exceptions import NoSuchElementException, WebDriverException
+
+from waits import SESSION_ERRORS
+
+# Logical elements of the Settings app with candidate locators. Candidates are tried
+# from the fastest strategy (resource-id, accessibility id, UiSelector) to the slowest
+# (global XPath). The locator that worked fastest is remembered per element and
+# device/OS version in locator_cache.json and is tried first next time.
+LOCATORS = {
+    "network_and_internet": [
+        (AppiumBy.ANDROID_UIAUTOMATOR, 'new UiSelector().text("Network and Internet")'),
+        (AppiumBy.XPATH, "//*[@text='Network and Internet']"),
+    ],
+    "internet": [
+        (AppiumBy.ANDROID_UIAUTOMATOR, 'new UiSelector().text("Internet")'),
+        (AppiumBy.XPATH, "//*[@text='Internet']"),
+    ],
+    "wifi_text": [
+        (AppiumBy.ANDROID_UIAUTOMATOR, 'new UiSelector().text("Wi-Fi")'),
+        (AppiumBy.XPATH, "//*[@text='Wi-Fi']"),
+    ],
+    "wifi_switch": [
+        (AppiumBy.ID, "com.android.settings:id/switchWidget"),
+        (AppiumBy.ID, "android:id/switch_widget"),
+        (AppiumBy.ANDROID_UIAUTOMATOR, 'new UiSelector().className("android.widget.Switch")'),
+        (AppiumBy.CLASS_NAME, "android.widget.Switch"),
+        (AppiumBy.XPATH, "//android.widget.Switch"),
+    ],
+    "wifi_network_item": [
+        (AppiumBy.ANDROID_UIAUTOMATOR, 'new UiSelector().className("android.widget.LinearLayout").descriptionContains("Wi-Fi signal")'),
+        (AppiumBy.XPATH, "//android.widget.LinearLayout[contains(@content-desc, 'Wi-Fi signal') or contains(@content-desc, 'Secure network')]"),
+    ],
+}
+CACHE_FILE_NAME = "locator_cache.json"
+# Time saved is counted against the XPath baseline, measured once per element and
+# device when another locator was used and kept in the cache file. "0" turns it off.
+MEASURE_BASELINE = os.environ.get("APPIUM_LOCATOR_BASELINE", "1") == "1"
+
+# Several runner threads can share one cache file
+cache_file_lock = threading.Lock()
+# Locators with a PageSnapshot.find equivalent (snapshot_query), other XPaths have none
+UISELECTOR_METHODS = {"text": "text", "className": "class_name", "resourceId": "resource_id",
+                      "description": "content_desc", "descriptionContains": "content_desc_contains"}
+UISELECTOR_PATTERN = re.compile(r'\.(\w+)\("([^"]*)"\)')
+XPATH_PATTERN = re.compile(r"//([\w.]+|\*)(?:\[@(text|resource-id|content-desc)='([^']*)'\])?")
+XPATH_ATTRIBUTES = {"text": "text", "resource-id": "resource_id", "content-desc": "content_desc"}
+
+
+def locator_key(locator):
+    return f"{locator[0]}|{locator[1]}"
+
+
+def snapshot_query(locator):
+    # PageSnapshot.find arguments matching the same nodes as locator, None when unknown
+    by, value = locator
+    if by == AppiumBy.ID:
+        return {"resource_id": value}
+    if by == AppiumBy.ACCESSIBILITY_ID:
+        return {"content_desc": value}
+    if by == AppiumBy.CLASS_NAME:
+        return {"class_name": value}
+    if by == AppiumBy.ANDROID_UIAUTOMATOR and value.startswith("new UiSelector()"):
+        calls = value[len("new UiSelector()"):]
+        methods = UISELECTOR_PATTERN.findall(calls)
+        if not methods or "".join(f'.{name}("{argument}")' for name, argument in methods) != calls:
+            return None
+        if any(name not in UISELECTOR_METHODS for name, _ in methods):
+            return None
+        return {UISELECTOR_METHODS[name]: argument for name, argument in methods}
+    if by == AppiumBy.XPATH:
+        match = XPATH_PATTERN.fullmatch(value)
+        if not match:
+            return None
+        class_name, attribute, attribute_value = match.groups()
+        query = {} if class_name == "*" else {"class_name": class_name}
+        if attribute:
+            query[XPATH_ATTRIBUTES[attribute]] = attribute_value
+        return query or None
+    return None
+
+
+def device_key(driver):
+    capabilities = driver.capabilities
+    device = capabilities.get("deviceUDID") or capabilities.get("udid") or capabilities.get("deviceName", "unknown")
+    return f"{device}/Android {capabilities.get('platformVersion', '?')}"
+
+
+class LocatorCache:
+    def __init__(self, driver, log_dir="appium_logs", logger=None, locators=LOCATORS,
+                 measure_baseline=MEASURE_BASELINE):
+        self.driver = driver
+        self.measure_baseline = measure_baseline
+        self.logger = logger
+        self.locators = locators
+        self.cache_file = os.path.join(log_dir, CACHE_FILE_NAME)
+        self.device = device_key(driver)
+        # {element: {"best": locator_key, "timings": {locator_key: {"count", "total_time", "failures"}},
+        #  "baseline_measured": bool}}
+        self.elements = self._load().get(self.device, {})
+        self.lookups = 0
+        self.hits = 0
+        self.time_saved = 0.0
+
+    def _load(self):
+        try:
+            with open(self.cache_file) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        # Merge with the file, other devices may have written it meanwhile
+        with cache_file_lock:
+            data = self._load()
+            data[self.device] = self.elements
+            tmp_path = f"{self.cache_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp_path, self.cache_file)
+
+    def _record(self, element, locator, duration, found):
+        timings = self.elements.setdefault(element, {"best": None, "timings": {}})["timings"]
+        timing = timings.setdefault(locator_key(locator), {"count": 0, "total_time": 0.0, "failures": 0})
+        if found:
+            timing["count"] += 1
+            timing["total_time"] = round(timing["total_time"] + duration, 4)
+        else:
+            timing["failures"] += 1
+
+    def _average(self, element, locator):
+        timing = self.elements.get(element, {}).get("timings", {}).get(locator_key(locator))
+        if not timing or not timing["count"]:
+            return None
+        return timing["total_time"] / timing["count"]
+
+    def _try(self, locator, many):
+        start_time = time.time()
+        try:
+            if many:
+                result = self.driver.find_elements(by=locator[0], value=locator[1])
+            else:
+                result = self.driver.find_element(by=locator[0], value=locator[1])
+        except NoSuchElementException:
+            result = None
+        except SESSION_ERRORS:
+            raise
+        except WebDriverException:
+            # Strategy not supported by this driver or invalid selector
+            result = None
+        return result, time.time() - start_time
+
+    def _ordered_candidates(self, element):
+        candidates = list(self.locators[element])
+        best = self.elements.get(element, {}).get("best")
+        # Best known locator first, then untried ones in default order, failed ones last
+        return sorted(candidates, key=lambda locator: (
+            locator_key(locator) != best,
+            self.elements.get(element, {}).get("timings", {}).get(locator_key(locator), {}).get("failures", 0) > 0
+        ))
+
+    def find(self, element, many=False, required=True):
+        candidates = self._ordered_candidates(element)
+        best = self.elements.get(element, {}).get("best")
+        if best is not None and not best.startswith(f"{AppiumBy.XPATH}|"):
+            # Waits call find on every poll until the element is on screen, global XPath
+            # is not tried on every miss once a faster locator is known
+            candidates = [locator for locator in candidates if locator[0] != AppiumBy.XPATH]
+        attempts = []
+
+        for locator in candidates:
+            result, duration = self._try(locator, many)
+            if result:
+                attempts.append((locator, duration, True))
+                break
+            attempts.append((locator, duration, False))
+        else:
+            # Element is not on screen (yet), this says nothing about the locators
+            if required:
+                raise NoSuchElementException(f"Element {element} not found with any of {len(candidates)} locators")
+            return [] if many else None
+
+        found_locator, duration, _ = attempts[-1]
+        for locator, attempt_duration, found in attempts:
+            self._record(element, locator, attempt_duration, found)
+
+        # Only lookups which found the element count, misses are polls of waits
+        self.lookups += 1
+        if locator_key(found_locator) == best:
+            self.hits += 1
+        self.elements[element]["best"] = self._fastest(element, found_locator)
+
+        # Baseline is the slowest (XPath) candidate, its time is known from lookups where
+        # XPath was tried, or measured once per element and device (also when XPath
+        # does not find it) and reused by next runs from the cache file
+        baseline = self.locators[element][-1]
+        data = self.elements[element]
+        if baseline != found_locator:
+            if self._average(element, baseline) is None and self.measure_baseline and not data.get("baseline_measured"):
+                baseline_result, baseline_duration = self._try(baseline, many)
+                self._record(element, baseline, baseline_duration, bool(baseline_result))
+                data["baseline_measured"] = True
+            baseline_average = self._average(element, baseline)
+            if baseline_average is not None:
+                self.time_saved += max(baseline_average - duration, 0)
+
+        if self.logger is not None:
+            self.logger.log_event("element_located", {
+                "element": element,
+                "strategy": found_locator[0],
+                "value": found_locator[1],
+                "search_time": round(duration, 3),
+                "attempts": len(attempts),
+                "cache_hit": locator_key(found_locator) == best
+            })
+        return result
+
+    def _fastest(self, element, found_locator):
+        # Fastest locator by average time among those which never failed
+        timings = self.elements[element]["timings"]
+        working = [key for key, timing in timings.items() if timing["count"] and not timing["failures"]]
+        working = [key for key in working if key in {locator_key(locator) for locator in self.locators[element]}]
+        if not working:
+            return locator_key(found_locator)
+        return min(working, key=lambda key: timings[key]["total_time"] / timings[key]["count"])
+
+    def stats(self):
+        return {
+            "device": self.device,
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": round(self.hits / self.lookups, 3) if self.lookups else None,
+            "time_saved": round(self.time_saved, 3),
+            "best_locators": {element: data["best"] for element, data in self.elements.items()}
+        }
@@ -0,0 +1,132 @@
+import bisect
+import re
+import time
+import xml.etree.ElementTree as ET
+from collections import defaultdict
+
+# Snapshot of the whole screen from one driver.page_source call.
+# Element queries (by resource-id, text, class, content-desc) and element details
+# are answered from the parsed tree, without further requests to the device.
+# Works with Appium page source and with `adb shell uiautomator dump` files.
+BOUNDS_PATTERN = re.compile(r"\[(-?\d+),(-?\d+)\]\[(-?\d+),(-?\d+)\]")
+
+
+class PageSnapshot:
+    def __init__(self, source):
+        if isinstance(source, str):
+            source = source.encode("utf-8")
+        self.root = ET.fromstring(source)
+        self.nodes = []
+        self.positions = {}
+        self.subtree_end = []
+        self.by_resource_id = defaultdict(list)
+        self.by_text = defaultdict(list)
+        self.by_class = defaultdict(list)
+        self.by_content_desc = defaultdict(list)
+        self._index(self.root)
+
+    def _index(self, root):
+        # Nodes are numbered in document order, descendants of node N
+        # are exactly the nodes N+1 .. subtree_end[N]
+        stack = [(child, False) for child in reversed(list(root))]
+        while stack:
+            node, done = stack.pop()
+            if done:
+                self.subtree_end[self.positions[node]] = len(self.nodes) - 1
+                continue
+            position = len(self.nodes)
+            self.positions[node] = position
+            self.nodes.append(node)
+            self.subtree_end.append(position)
+            for index, key in ((self.by_resource_id, node.get("resource-id")),
+                               (self.by_text, node.get("text")),
+                               (self.by_class, node.get("class") or node.tag),
+                               (self.by_content_desc, node.get("content-desc"))):
+                if key:
+                    index[key].append(position)
+            stack.append((node, True))
+            stack.extend((child, False) for child in reversed(list(node)))
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def find(self, resource_id=None, text=None, class_name=None, content_desc=None,
+             content_desc_contains=(), within=None):
+        # Exact matches use the indexes, the smallest one is filtered by the rest
+        candidates = None
+        for index, key in ((self.by_resource_id, resource_id), (self.by_text, text),
+                           (self.by_class, class_name), (self.by_content_desc, content_desc)):
+            if key is None:
+                continue
+            positions = index.get(key, [])
+            candidates = positions if candidates is None or len(positions) < len(candidates) else candidates
+        if candidates is None:
+            candidates = range(len(self.nodes))
+
+        if within is not None:
+            start = self.positions[within] + 1
+            end = self.subtree_end[self.positions[within]]
+            candidates = candidates[bisect.bisect_left(candidates, start):bisect.bisect_right(candidates, end)]
+
+        if isinstance(content_desc_contains, str):
+            content_desc_contains = (content_desc_contains,)
+        result = []
+        for position in candidates:
+            node = self.nodes[position]
+            if resource_id is not None and node.get("resource-id") != resource_id:
+                continue
+            if text is not None and node.get("text") != text:
+                continue
+            if class_name is not None and (node.get("class") or node.tag) != class_name:
+                continue
+            if content_desc is not None and node.get("content-desc") != content_desc:
+                continue
+            if content_desc_contains and not any(part in node.get("content-desc", "") for part in content_desc_contains):
+                continue
+            result.append(node)
+        return result
+
+    def find_one(self, **query):
+        nodes = self.find(**query)
+        return nodes[0] if nodes else None
+
+    def details(self, node):
+        # Same shape as details read from a WebElement
+        if node is None:
+            return {"error": "Element not found in page snapshot"}
+        left, top, right, bottom = bounds(node)
+        return {
+            "text": node.get("text"),
+            "location": {"x": left, "y": top},
+            "size": {"height": bottom - top, "width": right - left},
+            "enabled": node.get("enabled") == "true",
+            "displayed": node.get("displayed", "true") == "true",
+            "attributes": dict(node.attrib)
+        }
+
+
+def bounds(node):
+    match = BOUNDS_PATTERN.match(node.get("bounds", ""))
+    if not match:
+        return 0, 0, 0, 0
+    return tuple(int(value) for value in match.groups())
+
+
+def take_snapshot(driver, logger=None, name=None, source=None):
+    # source is a page source the caller already fetched in this step
+    start_time = time.time()
+    if source is None:
+        source = driver.page_source
+    fetched = time.time()
+    snapshot = PageSnapshot(source)
+    if logger is not None:
+        logger.log_event("page_snapshot", {
+            "name": name,
+            "nodes": len(snapshot),
+            "size": len(source),
+            "fetch_time": round(fetched - start_time, 3),
+            "parse_time": round(time.time() - fetched, 3),
+            # Interned by the logger, stored as diff against the previous page source
+            "page_source": source
+        })
+    return snapshot
@@ -0,0 +1,230 @@
+import copy
+import difflib
+import hashlib
+import json
+import threading
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+
+# Page sources (UI hierarchy dumps) stored in the blob store without repeating the
+# same XML in every event. Every source is interned by hash: a page seen before in
+# the run is only referenced. New pages are stored as a structural diff against the
+# previous one, as a JSON blob: the new tree where unchanged subtrees are references
+# to nodes of the base tree, with the paths of changed, added and removed nodes.
+# Every KEYFRAME_INTERVAL pages, or when the diff is not much smaller than the page,
+# the whole XML is stored instead. Events keep "page_source_ref" and a small
+# "page_source_diff" summary, load_page_source() rebuilds any page from its ref.
+KEYFRAME_INTERVAL = 20
+# Diffs bigger than this share of the page are stored as whole page
+MAX_DIFF_RATIO = 0.5
+# Parsed pages kept as possible diff base when the run returns to them
+TREE_CACHE_SIZE = 32
+# Attributes identifying a node when children of two versions are aligned
+NODE_KEY_ATTRIBUTES = ("class", "resource-id")
+
+
+def subtree_hashes(root):
+    # {node: hash of the node with its attributes and all descendants}
+    hashes = {}
+
+    def visit(node):
+        digest = hashlib.sha1(node.tag.encode())
+        for name, value in sorted(node.attrib.items()):
+            digest.update(f"\0{name}={value}".encode())
+        for child in node:
+            digest.update(visit(child))
+        hashes[node] = digest.digest()
+        return hashes[node]
+
+    visit(root)
+    return hashes
+
+
+def node_key(node):
+    return (node.tag,) + tuple(node.get(name) for name in NODE_KEY_ATTRIBUTES)
+
+
+def node_label(node):
+    # Short description of a node for removed node lists
+    label = node.get("class") or node.tag
+    for name in ("resource-id", "text", "content-desc"):
+        if node.get(name):
+            label += f' {name}="{node.get(name)}"'
+    return label
+
+
+def node_at(root, path):
+    node = root
+    for index in path:
+        node = node[index]
+    return node
+
+
+class TreeDiff:
+    def __init__(self, base, new):
+        self.base = base
+        self.base_hashes = subtree_hashes(base)
+        self.new_hashes = subtree_hashes(new)
+        # Any identical subtree of the base can be reused, also when it moved
+        self.base_paths = {}
+        self._index_paths(base, [])
+        self.changed = []
+        self.added = []
+        self.removed = []
+        self.tree = self.encode(new, base, [], [])
+
+    def _index_paths(self, node, path):
+        self.base_paths.setdefault(self.base_hashes[node], path)
+        for index, child in enumerate(node):
+            self._index_paths(child, path + [index])
+
+    def encode(self, node, base_node, base_path, path):
+        same = self.base_paths.get(self.new_hashes[node])
+        if same is not None:
+            return {"same": same}
+        if base_node is None:
+            self.added.append(path)
+            return {"tag": node.tag, "attrs": dict(node.attrib),
+                    "children": [self.encode(child, None, None, path + [index]) for index, child in enumerate(node)]}
+
+        attrs = {name: value for name, value in node.attrib.items() if base_node.get(name) != value}
+        attrs.update({name: None for name in base_node.attrib if name not in node.attrib})
+        if attrs:
+            self.changed.append(path)
+        children = []
+        base_children = list(base_node)
+        new_children = list(node)
+        matcher = difflib.SequenceMatcher(None, [node_key(child) for child in base_children],
+                                          [node_key(child) for child in new_children], autojunk=False)
+        for operation, base_start, base_end, new_start, new_end in matcher.get_opcodes():
+            # Replaced children are paired by position, the rest is added or removed
+            paired = min(base_end - base_start, new_end - new_start) if operation in ("equal", "replace") else 0
+            for offset in range(new_end - new_start):
+                base_index = base_start + offset if offset < paired else None
+                new_index = new_start + offset
+                children.append(self.encode(
+                    new_children[new_index],
+                    base_children[base_index] if base_index is not None else None,
+                    base_path + [base_index] if base_index is not None else None,
+                    path + [new_index]))
+            for base_index in range(base_start + paired, base_end):
+                self.removed.append({"path": base_path + [base_index], "node": node_label(base_children[base_index])})
+        return {"base": base_path, "attrs": attrs, "children": children}
+
+
+def apply_diff(base_root, encoded):
+    if "same" in encoded:
+        return copy.deepcopy(node_at(base_root, encoded["same"]))
+    if "base" in encoded:
+        base_node = node_at(base_root, encoded["base"])
+        attrs = dict(base_node.attrib)
+        for name, value in encoded["attrs"].items():
+            if value is None:
+                attrs.pop(name, None)
+            else:
+                attrs[name] = value
+        node = ET.Element(base_node.tag, attrs)
+    else:
+        node = ET.Element(encoded["tag"], encoded["attrs"])
+    node.extend(apply_diff(base_root, child) for child in encoded["children"])
+    return node
+
+
+class PageSourceStore:
+    def __init__(self, blob_store, keyframe_interval=KEYFRAME_INTERVAL, max_diff_ratio=MAX_DIFF_RATIO):
+        self.blob_store = blob_store
+        self.keyframe_interval = keyframe_interval
+        self.max_diff_ratio = max_diff_ratio
+        # (ref, diffs from the last whole page) of pages seen in this run by hash of their text
+        self.pages = {}
+        self.trees = OrderedDict()
+        # (ref, parsed tree, depth) of the last page, base of the next diff
+        self.previous = None
+        self.counters = {"sources": 0, "interned": 0, "keyframes": 0, "diffs": 0,
+                         "source_bytes": 0, "stored_bytes": 0}
+        # Events with page sources are logged from screenshot worker threads too
+        self.lock = threading.Lock()
+
+    def put(self, source):
+        # Returns (ref, summary) of the page source, summary is logged with the event
+        digest = hashlib.sha256(source.encode()).hexdigest()
+        with self.lock:
+            self.counters["sources"] += 1
+            self.counters["source_bytes"] += len(source)
+            known = self.pages.get(digest)
+            if known is not None:
+                self.counters["interned"] += 1
+                # Without the parsed tree the next page is stored whole
+                self.previous = (known[0], self.trees.get(digest), known[1])
+                if digest in self.trees:
+                    self.trees.move_to_end(digest)
+                return known[0], {"kind": "same", "size": len(source), "stored": 0}
+
+            try:
+                root = ET.fromstring(source.encode())
+            except ET.ParseError:
+                # Not a hierarchy dump (e.g. error message), stored as text
+                ref = self.blob_store.put_bytes(source.encode(), "txt")
+                self.counters["stored_bytes"] += len(source)
+                return ref, {"kind": "text", "size": len(source), "stored": len(source)}
+
+            summary = None
+            depth = 0
+            if self.previous is not None and self.previous[1] is not None and self.previous[2] < self.keyframe_interval:
+                base_ref, base_root, base_depth = self.previous
+                diff = TreeDiff(base_root, root)
+                data = json.dumps({"base": base_ref, "tree": diff.tree, "changed": diff.changed,
+                                   "added": diff.added, "removed": diff.removed}, separators=(',', ':')).encode()
+                if len(data) <= len(source) * self.max_diff_ratio:
+                    ref = self.blob_store.put_bytes(data, "json")
+                    depth = base_depth + 1
+                    self.counters["diffs"] += 1
+                    summary = {"kind": "diff", "base": base_ref, "changed": len(diff.changed),
+                               "added": len(diff.added), "removed": len(diff.removed)}
+            if summary is None:
+                data = source.encode()
+                ref = self.blob_store.put_bytes(data, "xml")
+                self.counters["keyframes"] += 1
+                summary = {"kind": "full"}
+
+            summary.update(size=len(source), stored=len(data))
+            self.counters["stored_bytes"] += len(data)
+            self.pages[digest] = (ref, depth)
+            self.trees[digest] = root
+            while len(self.trees) > TREE_CACHE_SIZE:
+                self.trees.popitem(last=False)
+            self.previous = (ref, root, depth)
+            return ref, summary
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+        stats["saved_bytes"] = stats["source_bytes"] - stats["stored_bytes"]
+        return stats
+
+
+def load_page_source(load_bytes, ref, cache=None):
+    # Returns (xml text, diff) of a stored page, diff is None for whole pages.
+    # load_bytes(ref) returns blob content, cache (dict) keeps rebuilt base pages
+    if cache is not None and ref in cache:
+        return cache[ref]
+    data = load_bytes(ref)
+    if not ref.endswith(".json"):
+        result = (data.decode(), None)
+    else:
+        diff = json.loads(data)
+        base_source, _ = load_page_source(load_bytes, diff["base"], cache)
+        root = apply_diff(ET.fromstring(base_source.encode()), diff["tree"])
+        result = (ET.tostring(root, encoding="unicode"), diff)
+    if cache is not None:
+        cache[ref] = result
+    return result
+
+
+def page_source_chain(load_bytes, ref):
+    # Refs needed to rebuild the page: the page itself and all its bases
+    refs = []
+    while ref and ref not in refs:
+        refs.append(ref)
+        ref = json.loads(load_bytes(ref))["base"] if ref.endswith(".json") else None
+    return refs
@@ -0,0 +1,262 @@
+import argparse
+import datetime
+import json
+import os
+import queue
+import re
+import threading
+import time
+
+from appium import webdriver
+
+from event_logger import EventLogger
+from instrumentation import instrument
+from session_broker import SessionBroker, reset_app
+from scenario_engine import load_scenarios
+from waits import SESSION_ERRORS
+from wifi_test import APPIUM_URL, LOG_DIR, build_options, log_device_info, log_startup_metrics, run_scenario, save_results
+
+# Runs test scenarios on a pool of devices in parallel. Every device gets one worker
+# thread with its own Appium session, workers take scenarios from a shared queue,
+# so faster devices run more of them. Each scenario run has its own EventLogger
+# output, results of all devices are merged into appium_run_<run_id>.json.
+# Scenarios are the declarative files in scenarios/ (scenario_engine.py).
+# When the session dies during a scenario, the scenario goes back to the queue and
+# the worker creates a new session once; a device losing that one too leaves the pool.
+SCENARIOS = load_scenarios()
+
+
+def load_device_pool(path):
+    # Device pool file: list of {"udid": ..., "appium_url": ..., "capabilities": {...}}
+    with open(path) as f:
+        devices = json.load(f)
+    for device in devices:
+        device.setdefault("appium_url", APPIUM_URL)
+        device.setdefault("capabilities", {})
+        device["capabilities"].setdefault("appium:udid", device["udid"])
+    return devices
+
+
+def safe_name(value):
+    return re.sub(r"[^A-Za-z0-9.-]+", "-", value)
+
+
+class DeviceWorker(threading.Thread):
+    def __init__(self, device, jobs, run_id, log_dir, results, reuse_sessions=False):
+        super().__init__(name=f"device-{device['udid']}", daemon=True)
+        self.device = device
+        self.jobs = jobs
+        self.run_id = run_id
+        self.log_dir = log_dir
+        self.results = results
+        self.broker = SessionBroker(log_dir) if reuse_sessions else None
+        self.session_time = None
+        self.error = None
+        # Runs aborted because the session died, their scenarios were queued again
+        self.lost_runs = []
+
+    def start_session(self):
+        udid = self.device["udid"]
+        try:
+            session_start = time.time()
+            options = build_options(self.device["capabilities"])
+            if self.broker is not None:
+                driver = self.broker.acquire(self.device["appium_url"], options)
+            else:
+                driver = webdriver.Remote(self.device["appium_url"], options=options)
+            self.session_time = time.time() - session_start
+            instrument(driver, self.log_dir)
+            return driver
+        except Exception as e:
+            # Remaining scenarios are picked up by other devices
+            self.error = str(e)
+            print(f"[{udid}] Could not create session: {e}")
+            return None
+
+    def close_session(self, driver, broken=False):
+        if self.broker is not None:
+            if broken:
+                self.broker.discard(driver)
+            else:
+                self.broker.release(driver)
+            return
+        try:
+            driver.quit()
+        except Exception as e:
+            print(f"[{self.device['udid']}] Could not close session: {e}")
+
+    def session_alive(self, driver):
+        try:
+            driver.current_package
+        except SESSION_ERRORS:
+            return False
+        except Exception:
+            # Command failed, but the session answered
+            pass
+        return True
+
+    def run(self):
+        udid = self.device["udid"]
+        driver = self.start_session()
+        if driver is None:
+            return
+
+        restarted = False
+        try:
+            first = True
+            while True:
+                try:
+                    index, scenario, attempt = self.jobs.get_nowait()
+                except queue.Empty:
+                    break
+                if not first:
+                    reset_app(driver)
+                result = self.run_scenario(driver, index, scenario, first, attempt)
+                first = False
+                if result["status"] == "passed" or self.session_alive(driver):
+                    self.results.append(result)
+                    continue
+
+                # Session is gone, the scenario is run again by a healthy device
+                self.jobs.put((index, scenario, attempt + 1))
+                self.lost_runs.append(result["run_id"])
+                self.close_session(driver, broken=True)
+                driver = None
+                if restarted:
+                    self.error = f"Session lost again during {scenario} ({result['error']})"
+                    print(f"[{udid}] {self.error}, device leaves the pool")
+                    return
+                print(f"[{udid}] Session lost during {scenario}, creating a new one")
+                restarted = True
+                driver = self.start_session()
+                if driver is None:
+                    return
+                first = True
+        finally:
+            if driver is not None:
+                self.close_session(driver)
+
+    def run_scenario(self, driver, index, scenario, first=False, attempt=0):
+        udid = self.device["udid"]
+        # Scenario run again after a lost session gets its own log files
+        suffix = f"_retry{attempt}" if attempt else ""
+        logger = EventLogger(self.log_dir, f"{self.run_id}_{safe_name(udid)}_{index:03d}{suffix}")
+        print(f"[{udid}] Running scenario {scenario} ({logger.timestamp})")
+        started = time.time()
+        error = None
+        try:
+            log_device_info(driver, logger)
+            if first:
+                log_startup_metrics(logger, self.session_time, self.broker)
+            result = run_scenario(driver, logger, SCENARIOS[scenario])
+            if result["status"] != "passed":
+                raise Exception(result["error"])
+        except Exception as e:
+            error = str(e)
+            logger.log_event("critical_error", {"message": error})
+        save_results(driver, logger)
+
+        status = "failed" if error or logger.error_count else "passed"
+        print(f"[{udid}] Scenario {scenario} {status} in {time.time() - started:.2f}s")
+        return {
+            "index": index,
+            "scenario": scenario,
+            "device": udid,
+            "run_id": logger.timestamp,
+            "status": status,
+            "duration": round(time.time() - started, 2),
+            "event_count": logger.event_count,
+            "error": error
+        }
+
+
+def run_parallel(devices, scenarios, log_dir=LOG_DIR, run_id=None, reuse_sessions=False):
+    run_id = run_id or datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    os.makedirs(log_dir, exist_ok=True)
+    jobs = queue.Queue()
+    for index, scenario in enumerate(scenarios):
+        jobs.put((index, scenario, 0))
+
+    results = []
+    started = time.time()
+    workers = [DeviceWorker(device, jobs, run_id, log_dir, results, reuse_sessions) for device in devices]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    wall_time = round(time.time() - started, 2)
+
+    not_run = []
+    while not jobs.empty():
+        index, scenario, _ = jobs.get_nowait()
+        not_run.append({"index": index, "scenario": scenario})
+
+    results.sort(key=lambda result: result["index"])
+    serial_time = round(sum(result["duration"] for result in results), 2)
+    summary = {
+        "run_id": run_id,
+        "started": datetime.datetime.fromtimestamp(started).isoformat(),
+        "wall_time": wall_time,
+        "serial_time": serial_time,
+        "speedup": round(serial_time / wall_time, 2) if wall_time else None,
+        "devices": [{
+            "udid": worker.device["udid"],
+            "appium_url": worker.device["appium_url"],
+            "scenarios": sum(1 for result in results if result["device"] == worker.device["udid"]),
+            "session_time": round(worker.session_time, 3) if worker.session_time is not None else None,
+            "session_reused": bool(worker.broker and worker.broker.last_acquire and worker.broker.last_acquire["session_reused"]),
+            "error": worker.error,
+            "lost_runs": worker.lost_runs
+        } for worker in workers],
+        "passed": sum(1 for result in results if result["status"] == "passed"),
+        "failed": sum(1 for result in results if result["status"] == "failed"),
+        "not_run": not_run,
+        "results": results
+    }
+
+    summary_file = os.path.join(log_dir, f"appium_run_{run_id}.json")
+    with open(summary_file, 'w') as f:
+        json.dump(summary, f, indent=2)
+    return summary, summary_file
+
+
+def start_fake_devices(count):
+    # Local fake Appium servers, one per device, for trying the runner without phones
+    from fake_appium_server import make_fake_server
+
+    devices = []
+    for index in range(count):
+        server = make_fake_server(port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        devices.append({
+            "udid": f"fake-{index + 1}",
+            "appium_url": f"http://localhost:{server.server_address[1]}",
+            "capabilities": {"appium:udid": f"fake-{index + 1}"}
+        })
+    return devices
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run test scenarios on multiple devices in parallel")
+    parser.add_argument("--devices", default="devices.json", help="Device pool JSON file")
+    parser.add_argument("--fake-devices", type=int, default=0, help="Use N local fake Appium servers instead of device pool")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="Scenario to run (can be repeated)")
+    parser.add_argument("--repeat", type=int, default=1, help="Run every scenario N times")
+    parser.add_argument("--log-dir", default=LOG_DIR)
+    parser.add_argument("--reuse-sessions", action="store_true", help="Keep device sessions open for next runs")
+    args = parser.parse_args()
+
+    devices = start_fake_devices(args.fake_devices) if args.fake_devices else load_device_pool(args.devices)
+    scenarios = (args.scenario or sorted(SCENARIOS)) * args.repeat
+    print(f"Running {len(scenarios)} scenarios on {len(devices)} devices...")
+
+    summary, summary_file = run_parallel(devices, scenarios, args.log_dir, reuse_sessions=args.reuse_sessions)
+    for result in summary["results"]:
+        print(f"{result['scenario']:<20} {result['device']:<20} {result['status']:<8} {result['duration']:>8}s  {result['run_id']}")
+    print(f"Passed: {summary['passed']}, failed: {summary['failed']}, not run: {len(summary['not_run'])}")
+    print(f"Wall time: {summary['wall_time']}s, serial time: {summary['serial_time']}s, speedup: {summary['speedup']}x")
+    print(f"Run summary was saved to file: {summary_file}")
+
+
+if __name__ == "__main__":
+    main()
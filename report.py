@@ -0,0 +1,362 @@
+import json
+
+# HTML reports for test runs.
+# Inline report embeds all event data into the page and works without a server.
+# Lazy report embeds only the run summary and loads events page by page
+# (with screenshot thumbnails) from the log server API in appium_server.py.
+EVENTS_PAGE_SIZE = 50
+
+
+def write_html_report(log_file, html_file, timestamp):
+    # Load JSON data
+    with open(log_file, 'r') as f:
+        json_data = f.read()
+
+    with open(html_file, 'w') as f:
+        f.write(f"""
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <title>Appium Test Report - {timestamp}</title>
+            <style>
+                body {{ font-family: Arial, sans-serif; margin: 20px; background-color: #f5f5f5; }}
+                .container {{ max-width: 1200px; margin: 0 auto; background-color: white; padding: 20px; border-radius: 8px; box-shadow: 0 2px 4px rgba(0,0,0,0.1); }}
+                h1 {{ color: #333; text-align: center; }}
+                .event {{ margin-bottom: 20px; padding: 15px; border: 1px solid #ddd; border-radius: 5px; background-color: white; }}
+                .event-header {{ display: flex; justify-content: space-between; margin-bottom: 10px; }}
+                .event-type {{ font-weight: bold; color: #0066cc; }}
+                .event-time {{ color: #666; }}
+                .event-details {{ background-color: #f9f9f9; padding: 10px; border-radius: 5px; overflow-x: auto; }}
+                .screenshot {{ max-width: 100%; height: auto; margin-top: 10px; border: 1px solid #ddd; border-radius: 5px; }}
+                .frame {{ position: relative; display: inline-block; }}
+                .frame img {{ display: block; max-width: 100%; }}
+                .frame .patch, .frame .changed {{ position: absolute; margin: 0; }}
+                .frame .changed {{ outline: 3px solid #dc3545; }}
+                .frame-info, .page-source {{ color: #666; font-size: 0.9em; }}
+                .error {{ color: #dc3545; }}
+                .success {{ color: #28a745; }}
+                .navigation {{ color: #17a2b8; }}
+            </style>
+        </head>
+        <body>
+            <div class="container">
+                <h1>Appium Test Report - {timestamp}</h1>
+                <div id="summary"></div>
+                <div id="events"></div>
+            </div>
+
+            <script>
+                const data = {json_data};  // JSON data is now embedded directly
+
+                function formatTime(isoString) {{
+                    const date = new Date(isoString);
+                    return date.toLocaleTimeString();
+                }}
+
+                function getEventClass(type) {{
+                    if (type.includes('error')) return 'error';
+                    if (type.includes('navigation')) return 'navigation';
+                    if (type === 'test_completed') return 'success';
+                    return '';
+                }}
+
+                function boxStyle(box, size) {{
+                    return `left: ${{box[0] / size[0] * 100}}%; top: ${{box[1] / size[1] * 100}}%; ` +
+                        `width: ${{box[2] / size[0] * 100}}%; height: ${{box[3] / size[1] * 100}}%;`;
+                }}
+
+                function pageSourceHtml(details) {{
+                    // Page sources are stored as diffs, the server rebuilds them with changed nodes highlighted
+                    if (!details || !details.page_source_ref) return '';
+                    const diff = details.page_source_diff || {{}};
+                    const info = diff.kind === 'diff' ? ` (${{diff.changed}} changed, ${{diff.added}} added, ${{diff.removed}} removed nodes)`
+                        : diff.kind === 'same' ? ' (same as an earlier page)' : '';
+                    return `<div class="page-source"><a href="/page_source?ref=${{encodeURIComponent(details.page_source_ref)}}" target="_blank">Page source</a>${{info}}</div>`;
+                }}
+
+                function frameHtml(src, diff, patchSrc) {{
+                    // Changed tiles are stored as a patch over the last full screenshot,
+                    // the region changed against the previous screenshot is outlined
+                    const patch = diff.patch
+                        ? `<img src="${{patchSrc}}" class="patch" style="${{boxStyle(diff.patch_box, diff.size)}}" />` : '';
+                    const changed = diff.changed_region
+                        ? `<div class="changed" style="${{boxStyle(diff.changed_region, diff.size)}}"></div>` : '';
+                    const info = diff.kind === 'same' ? 'Same as previous screenshot'
+                        : diff.changed_region ? `Changed region: ${{diff.changed_region.join(', ')}} (hash distance ${{diff.distance}})` : '';
+                    return `<div class="screenshot frame"><img src="${{src}}" loading="lazy" />${{patch}}${{changed}}</div>` +
+                        `<div class="frame-info">${{info}}</div>`;
+                }}
+
+                // Summary
+                const summaryDiv = document.getElementById('summary');
+                summaryDiv.innerHTML = `
+                    <h2>Test Summary</h2>
+                    <p>Total Duration: ${{data.total_duration}} seconds</p>
+                    <p>Total Events: ${{data.events.length}}</p>
+                `;
+
+                // Events
+                const eventsDiv = document.getElementById('events');
+                eventsDiv.innerHTML = '<h2>Detailed Events</h2>';
+
+                data.events.forEach(event => {{
+                    const eventDiv = document.createElement('div');
+                    eventDiv.className = `event ${{getEventClass(event.type)}}`;
+
+                    let screenshotHtml = '';
+                    if (event.screenshot) {{
+                        // New logs reference screenshot files in blobs/, old logs embed base64
+                        const src = event.screenshot.startsWith('blobs/')
+                            ? event.screenshot
+                            : `data:image/png;base64,${{event.screenshot}}`;
+                        screenshotHtml = event.screenshot_diff
+                            ? frameHtml(src, event.screenshot_diff, event.screenshot_diff.patch)
+                            : `<img src="${{src}}" class="screenshot" loading="lazy" />`;
+                    }}
+
+                    eventDiv.innerHTML = `
+                        <div class="event-header">
+                            <span class="event-type">${{event.type}}</span>
+                            <span class="event-time">
+                                Time: ${{formatTime(event.timestamp)}}
+                                (${{event.time_from_start}}s from start)
+                            </span>
+                        </div>
+                        <div class="event-details">
+                            <pre>${{JSON.stringify(event.details, null, 2)}}</pre>
+                            ${{pageSourceHtml(event.details)}}
+                        </div>
+                        ${{screenshotHtml}}
+                    `;
+                    eventsDiv.appendChild(eventDiv);
+                }});
+            </script>
+        </body>
+        </html>
+        """)
+
+
+def render_lazy_report(run_id, summary):
+    summary_json = json.dumps(summary).replace("</", "<\\/")
+    return f"""
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <title>Appium Test Report - {run_id}</title>
+        <style>
+            body {{ font-family: Arial, sans-serif; margin: 20px; background-color: #f5f5f5; }}
+            .container {{ max-width: 1200px; margin: 0 auto; background-color: white; padding: 20px; border-radius: 8px; box-shadow: 0 2px 4px rgba(0,0,0,0.1); }}
+            h1 {{ color: #333; text-align: center; }}
+            .event {{ margin-bottom: 20px; padding: 15px; border: 1px solid #ddd; border-radius: 5px; background-color: white; }}
+            .event-header {{ display: flex; justify-content: space-between; margin-bottom: 10px; }}
+            .event-type {{ font-weight: bold; color: #0066cc; }}
+            .event-time {{ color: #666; }}
+            .event-details {{ background-color: #f9f9f9; padding: 10px; border-radius: 5px; overflow-x: auto; }}
+            .screenshot {{ max-width: 320px; height: auto; margin-top: 10px; border: 1px solid #ddd; border-radius: 5px; }}
+            .frame {{ position: relative; display: inline-block; }}
+            .frame img {{ display: block; max-width: 320px; }}
+            .frame .patch, .frame .changed {{ position: absolute; margin: 0; }}
+            .frame .changed {{ outline: 3px solid #dc3545; }}
+            .frame-info, .page-source {{ color: #666; font-size: 0.9em; }}
+            .error {{ color: #dc3545; }}
+            .success {{ color: #28a745; }}
+            .navigation {{ color: #17a2b8; }}
+            .type-counts span {{ display: inline-block; margin: 0 10px 5px 0; padding: 2px 8px; background-color: #eef; border-radius: 10px; }}
+            #status {{ text-align: center; color: #666; padding: 10px; }}
+        </style>
+    </head>
+    <body>
+        <div class="container">
+            <h1>Appium Test Report - {run_id}</h1>
+            <div id="summary"></div>
+            <h2>Detailed Events</h2>
+            <div id="events"></div>
+            <div id="status"></div>
+        </div>
+
+        <script>
+            const summary = {summary_json};
+            const pageSize = {EVENTS_PAGE_SIZE};
+            let nextOffset = 0;
+            let loading = false;
+
+            function formatTime(isoString) {{
+                const date = new Date(isoString);
+                return date.toLocaleTimeString();
+            }}
+
+            function getEventClass(type) {{
+                if (type.includes('error')) return 'error';
+                if (type.includes('navigation')) return 'navigation';
+                if (type === 'test_completed') return 'success';
+                return '';
+            }}
+
+            function pageSourceHtml(details) {{
+                // Page sources are stored as diffs, the server rebuilds them with changed nodes highlighted
+                if (!details || !details.page_source_ref) return '';
+                const diff = details.page_source_diff || {{}};
+                const info = diff.kind === 'diff' ? ` (${{diff.changed}} changed, ${{diff.added}} added, ${{diff.removed}} removed nodes)`
+                    : diff.kind === 'same' ? ' (same as an earlier page)' : '';
+                return `<div class="page-source"><a href="/page_source?ref=${{encodeURIComponent(details.page_source_ref)}}" target="_blank">Page source</a>${{info}}</div>`;
+            }}
+
+            function thumbnailSrc(screenshot) {{
+                return screenshot.startsWith('blobs/')
+                    ? `/api/thumbnail?ref=${{encodeURIComponent(screenshot)}}`
+                    : `/${{screenshot}}`;
+            }}
+
+            function boxStyle(box, size) {{
+                return `left: ${{box[0] / size[0] * 100}}%; top: ${{box[1] / size[1] * 100}}%; ` +
+                    `width: ${{box[2] / size[0] * 100}}%; height: ${{box[3] / size[1] * 100}}%;`;
+            }}
+
+            function screenshotHtml(screenshot, diff) {{
+                if (!screenshot) return '';
+                // Thumbnails are created on demand, full image opens on click
+                if (!diff) {{
+                    return `<a href="/${{screenshot}}" target="_blank"><img src="${{thumbnailSrc(screenshot)}}" class="screenshot" loading="lazy" /></a>`;
+                }}
+                // Changed tiles are stored as a patch over the last full screenshot,
+                // the region changed against the previous screenshot is outlined
+                const patch = diff.patch
+                    ? `<img src="${{thumbnailSrc(diff.patch)}}" class="patch" style="${{boxStyle(diff.patch_box, diff.size)}}" />` : '';
+                const changed = diff.changed_region
+                    ? `<div class="changed" style="${{boxStyle(diff.changed_region, diff.size)}}"></div>` : '';
+                const info = diff.kind === 'same' ? 'Same as previous screenshot'
+                    : diff.changed_region ? `Changed region: ${{diff.changed_region.join(', ')}} (hash distance ${{diff.distance}})` : '';
+                return `<a href="/${{screenshot}}" target="_blank" class="screenshot frame">` +
+                    `<img src="${{thumbnailSrc(screenshot)}}" loading="lazy" />${{patch}}${{changed}}</a>` +
+                    `<div class="frame-info">${{info}}</div>`;
+            }}
+
+            // Only a summary from the log server of an unfinished run has a stream offset,
+            // summaries written into static reports belong to finished runs
+            function isRunning() {{
+                return !summary.finished && summary.stream_offset != null;
+            }}
+
+            // Summary, updated while a live run is followed
+            function renderSummary() {{
+                const typeCounts = Object.entries(summary.type_counts)
+                    .map(([type, count]) => `<span>${{type}}: ${{count}}</span>`).join('');
+                document.getElementById('summary').innerHTML = `
+                    <h2>Test Summary</h2>
+                    <p>Total Duration: ${{summary.total_duration}} seconds${{isRunning() ? ' (running)' : ''}}</p>
+                    <p>Total Events: ${{summary.event_count}} (errors: ${{summary.error_count}}, screenshots: ${{summary.screenshot_count}})</p>
+                    <div class="type-counts">${{typeCounts}}</div>
+                `;
+            }}
+            renderSummary();
+
+            // Events logged before the page was opened are fetched page by page while scrolling.
+            // Events of a live run after them come from the live stream and wait in pending
+            // until the list reaches them, so no event is fetched twice
+            const eventsDiv = document.getElementById('events');
+            const statusDiv = document.getElementById('status');
+            const liveStart = summary.event_count;
+            const isLive = isRunning();
+            const pending = new Map();
+
+            function renderEvent(event) {{
+                const eventDiv = document.createElement('div');
+                eventDiv.className = `event ${{getEventClass(event.type)}}`;
+                eventDiv.innerHTML = `
+                    <div class="event-header">
+                        <span class="event-type"></span>
+                        <span class="event-time">
+                            Time: ${{formatTime(event.timestamp)}}
+                            (${{event.time_from_start}}s from start)
+                        </span>
+                    </div>
+                    <div class="event-details"><pre></pre>${{pageSourceHtml(event.details)}}</div>
+                    ${{screenshotHtml(event.screenshot, event.screenshot_diff)}}
+                `;
+                eventDiv.querySelector('.event-type').textContent = event.type;
+                eventDiv.querySelector('pre').textContent = JSON.stringify(event.details, null, 2);
+                eventsDiv.appendChild(eventDiv);
+            }}
+
+            function showPending() {{
+                while (!loading && pending.has(nextOffset)) {{
+                    renderEvent(pending.get(nextOffset));
+                    pending.delete(nextOffset);
+                    nextOffset++;
+                }}
+            }}
+
+            function showStatus() {{
+                statusDiv.textContent = nextOffset < summary.event_count
+                    ? `Showing ${{nextOffset}} of ${{summary.event_count}} events`
+                    : !isLive || summary.finished ? `All ${{nextOffset}} events loaded` : `${{nextOffset}} events, waiting for new events...`;
+            }}
+
+            async function loadPage() {{
+                if (loading || nextOffset >= liveStart) return;
+                loading = true;
+                statusDiv.textContent = 'Loading events...';
+                let loaded = 0;
+                try {{
+                    const limit = Math.min(pageSize, liveStart - nextOffset);
+                    const response = await fetch(`/api/runs/{run_id}/events?offset=${{nextOffset}}&limit=${{limit}}`);
+                    const page = await response.json();
+                    page.events.forEach(renderEvent);
+                    nextOffset += page.events.length;
+                    loaded = page.events.length;
+                    if (!loaded) statusDiv.textContent = `Showing ${{nextOffset}} events`;
+                }} catch (error) {{
+                    statusDiv.textContent = 'Events could not be loaded, open this report through appium_server.py';
+                }} finally {{
+                    // Scrolling and live events load again also after an empty page or an error
+                    loading = false;
+                }}
+                showPending();
+                if (!loaded) return;
+                showStatus();
+                // Keep loading while the end of the list is still visible
+                if (statusDiv.getBoundingClientRect().top < window.innerHeight) loadPage();
+            }}
+
+            if (isLive) {{
+                // Live run: the server pushes new events (Server-Sent Events), a reconnecting
+                // EventSource continues after the last received event
+                const live = new EventSource(`/api/runs/{run_id}/live?offset=${{summary.stream_offset}}`);
+                live.addEventListener('event', message => {{
+                    const event = JSON.parse(message.data);
+                    if (event.index < nextOffset || pending.has(event.index)) return;
+                    pending.set(event.index, event);
+                    if (event.index >= summary.event_count) {{
+                        summary.event_count = event.index + 1;
+                        summary.type_counts[event.type] = (summary.type_counts[event.type] || 0) + 1;
+                        if (event.type.includes('error')) summary.error_count++;
+                        if (event.screenshot) summary.screenshot_count++;
+                        summary.total_duration = event.time_from_start;
+                    }}
+                    showPending();
+                    renderSummary();
+                    showStatus();
+                }});
+                live.addEventListener('end', async () => {{
+                    live.close();
+                    const response = await fetch(`/api/runs/{run_id}/summary`);
+                    Object.assign(summary, await response.json(), {{finished: true}});
+                    renderSummary();
+                    showStatus();
+                }});
+            }}
+
+            new IntersectionObserver(entries => {{
+                if (entries.some(entry => entry.isIntersecting)) loadPage();
+            }}).observe(statusDiv);
+            if (nextOffset >= liveStart) showStatus();
+            loadPage();
+        </script>
+    </body>
+    </html>
+    """
+
+
+def write_lazy_report(html_file, run_id, summary):
+    with open(html_file, 'w') as f:
+        f.write(render_lazy_report(run_id, summary))
@@ -0,0 +1,407 @@
+import argparse
+import base64
+import bisect
+import hashlib
+import json
+import os
+import shutil
+import struct
+import threading
+import zlib
+from collections import Counter, OrderedDict
+
+from blob_store import BlobStore, is_blob_ref
+from event_stream import iter_events, iter_log_events, read_total_duration
+from page_sources import PageSourceStore, page_source_chain
+
+# zstandard is optional, without it archives are compressed with zlib
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Compact per-run archive (appium_events_<run_id>.arun) instead of the pretty-printed
+# JSON log and its HTML copy. Layout:
+#   header    MAGIC
+#   chunks    compressed JSONL, about CHUNK_SIZE bytes of events each
+#   blobs     screenshots and page sources referenced by the events
+#   index     zlib compressed JSON: chunk offsets with the number of their first
+#             event, blob offsets by reference, run summary and metadata
+#   footer    index offset and length, FOOTER_MAGIC
+# Event N is read by decompressing only the chunk which contains it.
+# Screenshots keep their blobs/ references, inline base64 screenshots and page
+# sources of old logs are moved to the blob section (page sources as diffs, page_sources.py).
+ARCHIVE_EXT = ".arun"
+MAGIC = b"APPIUMRUN1\n"
+FOOTER_MAGIC = b"ARUNEND1"
+FOOTER = struct.Struct(">QI8s")
+CHUNK_SIZE = 64 * 1024
+# Already compressed formats are stored as they are
+STORED_EXTENSIONS = ("png", "jpg", "jpeg", "webp", "gz")
+# Decompressed chunks kept in memory per archive
+CHUNK_CACHE_SIZE = 8
+DEFAULT_CODEC = "zstd" if zstandard is not None else "zlib"
+
+
+def compress(data, codec):
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=10).compress(data)
+    if codec == "zlib":
+        return zlib.compress(data, 6)
+    return data
+
+
+def decompress(data, codec):
+    if codec == "zstd":
+        if zstandard is None:
+            raise ValueError("Archive is compressed with zstd, install zstandard (pip install zstandard)")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == "zlib":
+        return zlib.decompress(data)
+    return data
+
+
+def archive_path(log_dir, run_id):
+    return os.path.join(log_dir, f"appium_events_{run_id}{ARCHIVE_EXT}")
+
+
+class ArchiveWriter:
+    def __init__(self, path, codec=DEFAULT_CODEC, chunk_size=CHUNK_SIZE):
+        if codec not in ("zlib", "zstd"):
+            raise ValueError(f"Unsupported archive codec: {codec}")
+        if codec == "zstd" and zstandard is None:
+            raise ValueError("zstd needs zstandard (pip install zstandard)")
+        self.path = path
+        self.codec = codec
+        self.chunk_size = chunk_size
+        # Written to temporary file, readers never see a partial archive
+        self.tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        self.file = open(self.tmp_path, 'wb')
+        self.file.write(MAGIC)
+        self.buffer = []
+        self.buffer_size = 0
+        self.event_count = 0
+        self.chunks = []
+        # Blobs are written after all chunks. Until then they are compressed into a spool
+        # file, only {ref: [spool offset, length, codec]} is kept in memory
+        self.spool_path = f"{self.tmp_path}.blobs"
+        self.spool = open(self.spool_path, 'w+b')
+        self.blobs = {}
+        self.type_counts = Counter()
+        self.error_count = 0
+        self.screenshot_count = 0
+        self.first_timestamp = None
+        self.last_event_time = 0
+
+    def add_event(self, event):
+        line = json.dumps(event, ensure_ascii=False, separators=(',', ':')).encode() + b"\n"
+        self.buffer.append(line)
+        self.buffer_size += len(line)
+        self.event_count += 1
+        self.type_counts[event["type"]] += 1
+        if "error" in event["type"]:
+            self.error_count += 1
+        if event.get("screenshot"):
+            self.screenshot_count += 1
+        if self.first_timestamp is None:
+            self.first_timestamp = event.get("timestamp")
+        self.last_event_time = event.get("time_from_start", self.last_event_time)
+        if self.buffer_size >= self.chunk_size:
+            self._flush_chunk()
+
+    def _flush_chunk(self):
+        if not self.buffer:
+            return
+        data = compress(b"".join(self.buffer), self.codec)
+        self.chunks.append([self.file.tell(), len(data), self.event_count - len(self.buffer)])
+        self.file.write(data)
+        self.buffer = []
+        self.buffer_size = 0
+
+    def add_blob(self, ref, data):
+        if ref in self.blobs:
+            return
+        codec = "raw" if ref.rsplit(".", 1)[-1] in STORED_EXTENSIONS else self.codec
+        stored = compress(data, codec)
+        self.blobs[ref] = [self.spool.tell(), len(stored), codec]
+        self.spool.write(stored)
+
+    def close(self, total_duration=None, metadata=None):
+        self._flush_chunk()
+        blob_offset = self.file.tell()
+        self.spool.seek(0)
+        shutil.copyfileobj(self.spool, self.file, 1024 * 1024)
+        self._close_spool()
+        blobs = {ref: [blob_offset + offset, length, codec] for ref, (offset, length, codec) in self.blobs.items()}
+        index = {
+            "version": 1,
+            "codec": self.codec,
+            "event_count": self.event_count,
+            "chunks": self.chunks,
+            "blobs": blobs,
+            "summary": {
+                "total_duration": total_duration if total_duration is not None else self.last_event_time,
+                "started": self.first_timestamp,
+                "error_count": self.error_count,
+                "screenshot_count": self.screenshot_count,
+                "type_counts": dict(self.type_counts)
+            },
+            "metadata": metadata
+        }
+        data = zlib.compress(json.dumps(index, separators=(',', ':')).encode(), 6)
+        index_offset = self.file.tell()
+        self.file.write(data)
+        self.file.write(FOOTER.pack(index_offset, len(data), FOOTER_MAGIC))
+        self.file.close()
+        os.replace(self.tmp_path, self.path)
+        return self.path
+
+    def _close_spool(self):
+        self.spool.close()
+        os.remove(self.spool_path)
+
+    def abort(self):
+        self.file.close()
+        os.remove(self.tmp_path)
+        self._close_spool()
+
+
+class ArchiveReader:
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a run archive")
+            f.seek(-FOOTER.size, os.SEEK_END)
+            index_offset, index_length, footer_magic = FOOTER.unpack(f.read(FOOTER.size))
+            if footer_magic != FOOTER_MAGIC:
+                raise ValueError(f"{path} is incomplete (no archive footer)")
+            f.seek(index_offset)
+            index = json.loads(zlib.decompress(f.read(index_length)))
+        self.codec = index["codec"]
+        self.event_count = index["event_count"]
+        self.chunks = index["chunks"]
+        self.chunk_starts = [chunk[2] for chunk in self.chunks]
+        self.blobs = index["blobs"]
+        self.summary = index["summary"]
+        self.metadata = index.get("metadata")
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.event_count
+
+    def _chunk(self, number):
+        with self.lock:
+            lines = self.cache.get(number)
+            if lines is not None:
+                self.cache.move_to_end(number)
+                return lines
+        offset, length, _ = self.chunks[number]
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            lines = decompress(f.read(length), self.codec).splitlines()
+        with self.lock:
+            self.cache[number] = lines
+            while len(self.cache) > CHUNK_CACHE_SIZE:
+                self.cache.popitem(last=False)
+        return lines
+
+    def events(self, offset=0, limit=50):
+        # Events offset .. offset + limit, only chunks containing them are decompressed
+        offset = max(offset, 0)
+        end = min(offset + limit, self.event_count)
+        page = []
+        index = offset
+        while index < end:
+            number = bisect.bisect_right(self.chunk_starts, index) - 1
+            lines = self._chunk(number)
+            first = self.chunk_starts[number]
+            for line in lines[index - first:end - first]:
+                page.append(json.loads(line))
+            index = first + len(lines)
+        return page
+
+    def event(self, index):
+        page = self.events(index, 1)
+        return page[0] if page else None
+
+    def iter_events(self):
+        for number in range(len(self.chunks)):
+            offset, length, _ = self.chunks[number]
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                lines = decompress(f.read(length), self.codec).splitlines()
+            for line in lines:
+                yield json.loads(line)
+
+    def has_blob(self, ref):
+        return ref in self.blobs
+
+    def blob(self, ref):
+        if ref not in self.blobs:
+            return None
+        offset, length, codec = self.blobs[ref]
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            return decompress(f.read(length), codec)
+
+
+class ArchiveBlobs:
+    # Finds blobs of archived runs, so screenshots can be restored to blobs/
+    # after the blob folder was cleaned or the archive was copied to another machine.
+    # Only archive indexes are read, again when the log folder changes
+    def __init__(self, log_dir):
+        self.log_dir = log_dir
+        self.state = None
+        self.refs = {}
+        self.lock = threading.Lock()
+
+    def find(self, ref):
+        with self.lock:
+            state = os.stat(self.log_dir).st_mtime_ns
+            if state != self.state:
+                self.refs = {}
+                for name in sorted(os.listdir(self.log_dir)):
+                    if name.endswith(ARCHIVE_EXT):
+                        try:
+                            for blob in ArchiveReader(os.path.join(self.log_dir, name)).blobs:
+                                self.refs[blob] = name
+                        except (OSError, ValueError):
+                            continue
+                self.state = state
+            name = self.refs.get(ref)
+        if name is None:
+            return None
+        return ArchiveReader(os.path.join(self.log_dir, name)).blob(ref)
+
+    def restore(self, blob_store, ref):
+        # Writes the blob back to the blob store, returns False when no archive has it
+        data = self.find(ref)
+        if data is None:
+            return False
+        blob_store.put_bytes(data, ref.rsplit(".", 1)[-1])
+        return True
+
+
+def archive_event(event, writer, blob_store, page_sources, missing):
+    # Blobs referenced by the event go to the archive, inline data becomes a blob reference
+    event = dict(event)
+    screenshot = event.get("screenshot")
+    if screenshot and not is_blob_ref(screenshot):
+        data = base64.b64decode(screenshot)
+        event["screenshot"] = screenshot = blob_store.ref_for(hashlib.sha256(data).hexdigest(), "png")
+        writer.add_blob(screenshot, data)
+    details = event.get("details")
+    if isinstance(details, dict) and isinstance(details.get("page_source"), str):
+        # Page sources of old logs are interned like the ones of new runs
+        ref, summary = page_sources.put(details["page_source"])
+        event["details"] = details = {key: value for key, value in details.items() if key != "page_source"}
+        details.update(page_source_ref=ref, page_source_diff=summary)
+
+    refs = [event.get("screenshot"), (event.get("screenshot_diff") or {}).get("patch")]
+    if isinstance(details, dict) and is_blob_ref(details.get("page_source_ref")):
+        try:
+            # Page source diffs need all their base pages
+            refs.extend(page_source_chain(blob_store.get_bytes, details["page_source_ref"]))
+        except OSError:
+            missing.append(details["page_source_ref"])
+    for ref in refs:
+        if is_blob_ref(ref) and ref not in writer.blobs:
+            try:
+                writer.add_blob(ref, blob_store.get_bytes(ref))
+            except OSError:
+                missing.append(ref)
+    return event
+
+
+def write_archive(path, events, blob_store, total_duration=None, metadata=None, codec=DEFAULT_CODEC):
+    # Returns blob references which were not found in the blob store
+    writer = ArchiveWriter(path, codec)
+    page_sources = PageSourceStore(blob_store)
+    missing = []
+    try:
+        for event in events:
+            writer.add_event(archive_event(event, writer, blob_store, page_sources, missing))
+        writer.close(total_duration, metadata)
+    except BaseException:
+        writer.abort()
+        raise
+    return missing
+
+
+def convert_run(log_dir, run_id, codec=DEFAULT_CODEC, remove=False):
+    # Archive of a finished run from its JSONL stream (or JSON log of old runs)
+    json_file = os.path.join(log_dir, f"appium_events_{run_id}.json")
+    stream_file = f"{json_file}l"
+    meta_file = os.path.join(log_dir, f"appium_events_{run_id}.meta.json")
+    # The JSON log is not loaded as a whole, total_duration is read from its end
+    # and events of old runs without stream one by one
+    events = (event for _, event in iter_events(stream_file)) if os.path.exists(stream_file) else iter_log_events(json_file)
+    metadata = None
+    if os.path.exists(meta_file):
+        with open(meta_file) as f:
+            metadata = json.load(f)
+    total_duration = read_total_duration(json_file)
+    if total_duration is None and metadata is not None:
+        total_duration = metadata.get("duration")
+
+    path = archive_path(log_dir, run_id)
+    missing = write_archive(path, events, BlobStore(log_dir), total_duration, metadata, codec)
+    replaced = [file for file in (json_file, stream_file, json_file[:-len(".json")] + ".html") if os.path.exists(file)]
+    before = sum(os.path.getsize(file) for file in replaced)
+    if remove:
+        # Blob files stay, other runs can reference the same screenshots
+        for file in replaced:
+            os.remove(file)
+    return path, before, os.path.getsize(path), missing
+
+
+def finished_runs(log_dir):
+    # Runs with JSON log which were not archived yet
+    names = set(os.listdir(log_dir))
+    return sorted(name[len("appium_events_"):-len(".json")] for name in names
+                  if name.startswith("appium_events_") and name.endswith(".json") and not name.endswith(".meta.json")
+                  and f"{name[:-len('.json')]}{ARCHIVE_EXT}" not in names)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert run logs to compressed archives and read them")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    convert_parser = subparsers.add_parser("convert", help="Archive finished runs")
+    convert_parser.add_argument("run_ids", nargs="*", help="Runs to convert (default: all finished runs)")
+    convert_parser.add_argument("--log-dir", default="appium_logs")
+    convert_parser.add_argument("--codec", choices=["zlib", "zstd"], default=DEFAULT_CODEC)
+    convert_parser.add_argument("--remove", action="store_true", help="Delete JSON, JSONL and HTML files of converted runs")
+    info_parser = subparsers.add_parser("info", help="Print archive summary")
+    info_parser.add_argument("path")
+    events_parser = subparsers.add_parser("events", help="Print events of an archive")
+    events_parser.add_argument("path")
+    events_parser.add_argument("--offset", type=int, default=0)
+    events_parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        total_before = total_after = 0
+        for run_id in args.run_ids or finished_runs(args.log_dir):
+            try:
+                path, before, after, missing = convert_run(args.log_dir, run_id, args.codec, args.remove)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Could not convert run {run_id}: {e}")
+                continue
+            total_before += before
+            total_after += after
+            warning = f", {len(missing)} screenshots not found in blobs/" if missing else ""
+            print(f"{run_id}: {before / 1024:.0f} KB -> {after / 1024:.0f} KB ({os.path.basename(path)}{warning})")
+        print(f"Total: {total_before / 1024:.0f} KB -> {total_after / 1024:.0f} KB")
+    elif args.command == "info":
+        reader = ArchiveReader(args.path)
+        print(json.dumps(dict(reader.summary, event_count=len(reader), codec=reader.codec, chunks=len(reader.chunks),
+                              blobs=len(reader.blobs), metadata=reader.metadata), indent=2))
+    else:
+        for event in ArchiveReader(args.path).events(args.offset, args.limit):
+            print(f"[{event['time_from_start']:>8}s] {event['type']}: {json.dumps(event['details'])[:200]}")
+
+
+if __name__ == "__main__":
+    main()
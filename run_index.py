@@ -0,0 +1,190 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+
+from run_reader import RunReader, find_run_file
+
+# Persistent index of test runs with summary metadata, so the log server can list,
+# filter and sort runs without opening every log file. Each run also gets
+# a small appium_events_<id>.meta.json sidecar, used to rebuild the index.
+INDEX_FILE_NAME = "run_index.sqlite"
+RUN_FILE_PATTERN = re.compile(r"^appium_events_(.+?)\.(meta\.json|jsonl|json|arun)$")
+SORT_COLUMNS = ("started", "duration", "event_count", "error_count", "device", "status")
+META_FIELDS = ("run_id", "started", "duration", "event_count", "error_count",
+               "screenshot_count", "status", "device", "platform_version")
+
+
+def sidecar_path(log_dir, run_id):
+    return os.path.join(log_dir, f"appium_events_{run_id}.meta.json")
+
+
+def write_sidecar(log_dir, metadata):
+    path = sidecar_path(log_dir, metadata["run_id"])
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(metadata, f, indent=2)
+    os.replace(tmp_path, path)
+    return path
+
+
+def metadata_from_log(run_id, path):
+    # Fallback for runs without sidecar (e.g. logs created by older versions)
+    return metadata_from_reader(RunReader(run_id, path))
+
+
+def metadata_from_reader(reader):
+    # Also used for runs still being written, their status is "running"
+    summary = reader.summary
+    device = None
+    platform_version = None
+    for event in reader.events(0, 5):
+        if event["type"] == "device_info":
+            capabilities = event["details"].get("capabilities", {})
+            device = capabilities.get("deviceUDID") or capabilities.get("deviceName")
+            platform_version = event["details"].get("platform_version")
+            break
+    status = "failed" if summary["error_count"] else "passed"
+    return {
+        "run_id": reader.run_id,
+        "started": summary["started"],
+        "duration": summary["total_duration"],
+        "event_count": summary["event_count"],
+        "error_count": summary["error_count"],
+        "screenshot_count": summary["screenshot_count"],
+        "status": status if summary["finished"] else "running",
+        "device": device,
+        "platform_version": platform_version
+    }
+
+
+class RunIndex:
+    def __init__(self, log_dir):
+        self.log_dir = log_dir
+        self.path = os.path.join(log_dir, INDEX_FILE_NAME)
+        self.local = threading.local()
+        with self.connection() as db:
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS runs (
+                    run_id TEXT PRIMARY KEY,
+                    started TEXT,
+                    duration REAL,
+                    event_count INTEGER,
+                    error_count INTEGER,
+                    screenshot_count INTEGER,
+                    status TEXT,
+                    device TEXT,
+                    platform_version TEXT
+                )
+            """)
+            db.execute("CREATE INDEX IF NOT EXISTS runs_started ON runs (started)")
+            db.execute("CREATE INDEX IF NOT EXISTS runs_status ON runs (status, started)")
+            db.execute("CREATE INDEX IF NOT EXISTS runs_device ON runs (device, started)")
+
+    def connection(self):
+        # SQLite connections can not be shared between threads
+        if getattr(self.local, "db", None) is None:
+            self.local.db = sqlite3.connect(self.path, timeout=10)
+            self.local.db.row_factory = sqlite3.Row
+        return self.local.db
+
+    def record_run(self, metadata):
+        values = [metadata.get(field) for field in META_FIELDS]
+        with self.connection() as db:
+            db.execute(f"""
+                INSERT OR REPLACE INTO runs ({", ".join(META_FIELDS)})
+                VALUES ({", ".join("?" for _ in META_FIELDS)})
+            """, values)
+
+    def run_ids(self):
+        return {row[0] for row in self.connection().execute("SELECT run_id FROM runs")}
+
+    def sync(self):
+        # Add runs which are in the log folder but not in the index yet.
+        # Only file names are listed, files of already indexed runs are not opened
+        indexed = self.run_ids()
+        found = {}
+        for name in os.listdir(self.log_dir):
+            match = RUN_FILE_PATTERN.match(name)
+            if match and match.group(1) not in indexed:
+                found.setdefault(match.group(1), set()).add(match.group(2))
+
+        added = 0
+        for run_id, kinds in found.items():
+            try:
+                if "meta.json" in kinds:
+                    with open(sidecar_path(self.log_dir, run_id)) as f:
+                        metadata = json.load(f)
+                elif "json" in kinds or "arun" in kinds:
+                    metadata = metadata_from_log(run_id, find_run_file(self.log_dir, run_id))
+                else:
+                    # Runs still being written are indexed when they finish
+                    continue
+            except (OSError, ValueError, KeyError):
+                continue
+            self.record_run(metadata)
+            added += 1
+        return added
+
+    def list_runs(self, offset=0, limit=50, status=None, device=None, search=None,
+                  sort="started", descending=True):
+        conditions = []
+        params = []
+        if status:
+            conditions.append("status = ?")
+            params.append(status)
+        if device:
+            conditions.append("device = ?")
+            params.append(device)
+        if search:
+            conditions.append("run_id LIKE ?")
+            params.append(f"%{search}%")
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        if sort not in SORT_COLUMNS:
+            sort = "started"
+        order = "DESC" if descending else "ASC"
+
+        db = self.connection()
+        total = db.execute(f"SELECT COUNT(*) FROM runs {where}", params).fetchone()[0]
+        rows = db.execute(
+            f"SELECT * FROM runs {where} ORDER BY {sort} {order}, run_id {order} LIMIT ? OFFSET ?",
+            params + [limit, offset]
+        ).fetchall()
+        return [dict(row) for row in rows], total
+
+    def devices(self):
+        rows = self.connection().execute("SELECT DISTINCT device FROM runs WHERE device IS NOT NULL ORDER BY device")
+        return [row[0] for row in rows]
+
+
+class RunListingCache:
+    # In-process cache of listing queries. It is dropped when the log folder
+    # (new run files) or the index database changes, otherwise no file is touched
+    def __init__(self, run_index, max_entries=64):
+        self.run_index = run_index
+        self.max_entries = max_entries
+        self.state = None
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def current_state(self):
+        dir_mtime = os.stat(self.run_index.log_dir).st_mtime_ns
+        index_mtime = os.stat(self.run_index.path).st_mtime_ns
+        return dir_mtime, index_mtime
+
+    def list_runs(self, **query):
+        key = tuple(sorted(query.items()))
+        with self.lock:
+            state = self.current_state()
+            if state != self.state:
+                if self.state is None or state[0] != self.state[0]:
+                    self.run_index.sync()
+                    state = self.current_state()
+                self.state = state
+                self.entries = {}
+            if key not in self.entries:
+                if len(self.entries) >= self.max_entries:
+                    self.entries = {}
+                self.entries[key] = (self.run_index.list_runs(**query), self.run_index.devices())
+            return self.entries[key]
@@ -0,0 +1,188 @@
+import json
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+
+from blob_store import is_blob_ref
+from event_stream import iter_events, read_total_duration
+from run_archive import ARCHIVE_EXT, ArchiveReader
+
+# Random access to events of one run for paginated reports.
+# JSONL logs are scanned once to build a byte offset per event, pages are then
+# read by seeking. Archived runs (run_archive.py) are read chunk by chunk from the
+# archive. Old JSON logs (with inline screenshots) are loaded as a whole.
+RUN_ID_PATTERN = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+
+class RunReader:
+    def __init__(self, run_id, path):
+        self.run_id = run_id
+        self.path = path
+        self.is_stream = path.endswith(".jsonl")
+        self.archive = None
+        self.offsets = []
+        self.legacy_events = None
+        self.summary = {}
+        self.scanned_to = 0
+        self.type_counts = Counter()
+        self.error_count = 0
+        self.screenshot_count = 0
+        self.first_timestamp = None
+        self.last_event_time = 0
+        self.total_duration = None
+        self.lock = threading.Lock()
+        self.refresh()
+
+    def refresh(self):
+        with self.lock:
+            if self.path.endswith(ARCHIVE_EXT):
+                if self.archive is None:
+                    self._load_archive()
+            elif self.is_stream:
+                self._scan_stream()
+            elif self.legacy_events is None:
+                with open(self.path) as f:
+                    data = json.load(f)
+                self.legacy_events = data.get("events", [])
+                self.total_duration = data.get("total_duration")
+                for event in self.legacy_events:
+                    self._count(event)
+            self.summary = self._build_summary()
+
+    def _scan_stream(self):
+        # Only new lines are read, so refreshing a live run is cheap
+        offset = self.scanned_to
+        for next_offset, event in iter_events(self.path, offset):
+            self.offsets.append(offset)
+            self._count(event)
+            offset = next_offset
+        self.scanned_to = offset
+
+        json_file = self.path[:-1]
+        if self.total_duration is None and os.path.exists(json_file):
+            self.total_duration = read_total_duration(json_file)
+
+    def _load_archive(self):
+        # Summary is stored in the archive index, events are not read
+        self.archive = ArchiveReader(self.path)
+        summary = self.archive.summary
+        self.type_counts = Counter(summary["type_counts"])
+        self.error_count = summary["error_count"]
+        self.screenshot_count = summary["screenshot_count"]
+        self.first_timestamp = summary["started"]
+        self.total_duration = summary["total_duration"]
+
+    def _count(self, event):
+        self.type_counts[event["type"]] += 1
+        if "error" in event["type"]:
+            self.error_count += 1
+        if event.get("screenshot"):
+            self.screenshot_count += 1
+        if self.first_timestamp is None:
+            self.first_timestamp = event.get("timestamp")
+        self.last_event_time = event.get("time_from_start", self.last_event_time)
+
+    def _build_summary(self):
+        return {
+            "run_id": self.run_id,
+            "event_count": self.event_count(),
+            "total_duration": self.total_duration if self.total_duration is not None else self.last_event_time,
+            "finished": self.total_duration is not None,
+            "started": self.first_timestamp,
+            "error_count": self.error_count,
+            "screenshot_count": self.screenshot_count,
+            "type_counts": dict(self.type_counts),
+            # Live view continues from here (live_stream.py)
+            "stream_offset": self.scanned_to if self.is_stream else None
+        }
+
+    def event_count(self):
+        if self.legacy_events is not None:
+            return len(self.legacy_events)
+        if self.archive is not None:
+            return len(self.archive)
+        return len(self.offsets)
+
+    def events(self, offset=0, limit=50):
+        offset = max(offset, 0)
+        if self.legacy_events is not None:
+            page = self.legacy_events[offset:offset + limit]
+            return [self._legacy_event(offset + i, event) for i, event in enumerate(page)]
+        if self.archive is not None:
+            page = self.archive.events(offset, limit)
+            for index, event in enumerate(page):
+                event["index"] = offset + index
+            return page
+
+        offsets = self.offsets[offset:offset + limit]
+        if not offsets:
+            return []
+        page = []
+        with open(self.path, 'rb') as f:
+            f.seek(offsets[0])
+            for index in range(len(offsets)):
+                event = json.loads(f.readline())
+                event["index"] = offset + index
+                page.append(event)
+        return page
+
+    def _legacy_event(self, index, event):
+        # Do not send inline base64 screenshots with the page, only a link to them
+        event = dict(event, index=index)
+        if event.get("screenshot") and not is_blob_ref(event["screenshot"]):
+            event["screenshot"] = f"api/runs/{self.run_id}/events/{index}/screenshot"
+        return event
+
+    def legacy_screenshot(self, index):
+        if self.legacy_events is None or not 0 <= index < len(self.legacy_events):
+            return None
+        screenshot = self.legacy_events[index].get("screenshot")
+        if not screenshot or is_blob_ref(screenshot):
+            return None
+        return screenshot
+
+
+def find_run_file(log_dir, run_id):
+    for ext in (ARCHIVE_EXT, ".jsonl", ".json"):
+        path = os.path.join(log_dir, f"appium_events_{run_id}{ext}")
+        if os.path.exists(path):
+            return path
+    return None
+
+
+class RunReaderCache:
+    def __init__(self, log_dir, max_runs=16):
+        self.log_dir = log_dir
+        self.max_runs = max_runs
+        self.readers = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, run_id):
+        if not RUN_ID_PATTERN.match(run_id):
+            return None
+        path = find_run_file(self.log_dir, run_id)
+        if path is None:
+            return None
+
+        stat = os.stat(path)
+        key = (path, stat.st_size, stat.st_mtime)
+        with self.lock:
+            cached = self.readers.get(run_id)
+            if cached is not None:
+                reader, cached_key = cached
+                self.readers.move_to_end(run_id)
+                if cached_key == key:
+                    return reader
+                if reader.path == path and reader.is_stream:
+                    # Live run got new events, read only appended part
+                    reader.refresh()
+                    self.readers[run_id] = (reader, key)
+                    return reader
+
+        reader = RunReader(run_id, path)
+        with self.lock:
+            self.readers[run_id] = (reader, key)
+            while len(self.readers) > self.max_runs:
+                self.readers.popitem(last=False)
+        return reader
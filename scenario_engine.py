@@ -0,0 +1,521 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import time
+
+from locators import LocatorCache, snapshot_query
+from page_snapshot import take_snapshot
+from session_broker import APP_PACKAGE, reset_app
+from waits import (DEFAULT_TIMEOUT, SESSION_ERRORS, wait_for_attribute, wait_for_element, wait_for_locator,
+                   wait_for_page_source_change, wait_for_screen_stable, wait_for_visual_stable)
+
+# PyYAML is optional, without it scenarios are written in JSON
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+# Declarative test scenarios. A scenario is a dict (JSON / YAML file or Python code)
+# with "setup", "steps" and "teardown" lists of steps, every step names an action
+# from ACTIONS with its parameters:
+#   {"action": "click", "element": "internet", "wait_for": "wifi_text"}
+# Elements are logical names from locators.py (resolved by LocatorCache) or raw
+# locators ["id", "android:id/title"]. "${name}" in parameters is replaced with
+# a value remembered by an earlier step, steps using a value that was never set
+# (also in "when") are skipped. "when" is a value (empty / false skips the step) or a
+# condition: {"defined": name}, {"equals": [a, b]} or {"not_equals": [a, b]}. Note that
+# remembered attributes are strings, "false" is a true value, compare it with "equals".
+# Steps are timed and logged as "step"
+# events, failed ones are retried ("retries" of the step or scenario), teardown
+# always runs, so state like the original WiFi state is restored after failures.
+SCENARIO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scenarios")
+SCENARIO_EXTENSIONS = (".json", ".yaml", ".yml")
+PHASES = ("setup", "steps", "teardown")
+VARIABLE_PATTERN = re.compile(r"\$\{(\w+)\}")
+CONDITIONS = ("defined", "equals", "not_equals")
+DEFAULT_RETRY_DELAY = 0.5
+# Actions which call screen_changed() themselves when they change the screen, steps
+# between two changes share one page source; after waits (the screen may change
+# meanwhile) and custom actions it is fetched again
+SCREEN_AWARE_ACTIONS = ("click", "back", "reset_app", "ensure_attribute", "assert_attribute",
+                        "remember_attribute", "capture", "log", "collect_list")
+ACTIONS = {}
+
+
+class StepFailed(Exception):
+    pass
+
+
+class MissingVariable(Exception):
+    pass
+
+
+def action(name):
+    # Registers function(context, step) as action, also for actions outside this module
+    def register(function):
+        ACTIONS[name] = function
+        return function
+    return register
+
+
+def step(action_name, **params):
+    # Python DSL: step("click", element="internet") instead of the dict
+    return dict(params, action=action_name)
+
+
+def scenario(name, steps, setup=(), teardown=(), **options):
+    return dict(options, name=name, setup=list(setup), steps=list(steps), teardown=list(teardown))
+
+
+def validate_scenario(scenario):
+    if not scenario.get("name"):
+        raise ValueError("Scenario has no name")
+    for phase in PHASES:
+        for index, item in enumerate(scenario.get(phase, [])):
+            # Python scenarios can also use functions as steps
+            if callable(item):
+                continue
+            if not isinstance(item, dict) or item.get("action") not in ACTIONS:
+                raise ValueError(f"{scenario['name']} {phase}[{index}]: unknown action {item!r}")
+            when = item.get("when")
+            if isinstance(when, dict) and (len(when) != 1 or next(iter(when)) not in CONDITIONS):
+                raise ValueError(f"{scenario['name']} {phase}[{index}]: unknown condition {when!r}")
+    return scenario
+
+
+def load_scenario(path):
+    with open(path) as f:
+        if path.endswith((".yaml", ".yml")):
+            if yaml is None:
+                raise ValueError(f"{path}: YAML scenarios need PyYAML (pip install pyyaml)")
+            data = yaml.safe_load(f)
+        else:
+            data = json.load(f)
+    data.setdefault("name", os.path.splitext(os.path.basename(path))[0])
+    return validate_scenario(data)
+
+
+def load_scenarios(directory=SCENARIO_DIR):
+    scenarios = {}
+    for path in sorted(glob.glob(os.path.join(directory, "*"))):
+        if path.endswith(SCENARIO_EXTENSIONS) and (yaml is not None or path.endswith(".json")):
+            loaded = load_scenario(path)
+            scenarios[loaded["name"]] = loaded
+    return scenarios
+
+
+def describe(item):
+    if callable(item):
+        return getattr(item, "__name__", "function")
+    target = item.get("element") or item.get("locator") or item.get("event") or item.get("condition")
+    return f"{item['action']} {target}" if target else item["action"]
+
+
+class ScenarioContext:
+    # State shared by the steps of one scenario run
+    def __init__(self, driver, logger, locators=None, screenshots=None):
+        self.driver = driver
+        self.logger = logger
+        self.locators = locators
+        self.screenshots = screenshots
+        self.variables = {}
+        # UI hierarchy of the current step, fetched once for snapshots and error details
+        self.source = None
+        self.current_snapshot = None
+        # Set when the session died, the remaining steps are skipped
+        self.session_error = None
+
+    def resolve(self, value):
+        # Replaces ${name} with remembered values, "${name}" alone keeps the value type
+        if isinstance(value, str):
+            match = VARIABLE_PATTERN.fullmatch(value)
+            if match:
+                return self.variable(match.group(1))
+            return VARIABLE_PATTERN.sub(lambda m: str(self.variable(m.group(1))), value)
+        if isinstance(value, list):
+            return [self.resolve(item) for item in value]
+        if isinstance(value, dict):
+            return {key: self.resolve(item) for key, item in value.items()}
+        return value
+
+    def check(self, when):
+        # Condition of a step ("when"), MissingVariable when a compared value was never set
+        if isinstance(when, dict):
+            kind, value = next(iter(when.items()))
+            if kind == "defined":
+                return value in self.variables
+            first, second = self.resolve(value)
+            return (first == second) == (kind == "equals")
+        return bool(self.resolve(when))
+
+    def variable(self, name):
+        if name not in self.variables:
+            raise MissingVariable(f"Variable {name} was not set")
+        return self.variables[name]
+
+    def page_source(self):
+        if self.source is None:
+            self.source = self.driver.page_source
+        return self.source
+
+    def screen_changed(self):
+        self.source = None
+        self.current_snapshot = None
+
+    def snapshot(self, name=None):
+        # Parsed page source of the current step (page_snapshot.py), logged once per screen
+        if self.current_snapshot is None:
+            self.current_snapshot = take_snapshot(self.driver, self.logger, name, self.page_source())
+        return self.current_snapshot
+
+    def node(self, item):
+        # Snapshot node of the step's element: attributes and details are read from it
+        # instead of a request per attribute, the element is waited for when not on screen yet
+        snapshot, node = self._snapshot_node(item)
+        if node is None:
+            self.find(item)
+            self.screen_changed()
+            snapshot, node = self._snapshot_node(item)
+        if node is None:
+            raise StepFailed(f"{item.get('element') or item.get('locator')} not found in page snapshot")
+        return snapshot, node
+
+    def _snapshot_node(self, item):
+        snapshot = self.snapshot(item.get("name") or describe(item))
+        candidates = [item["locator"]] if "locator" in item else self.locators.locators[item["element"]]
+        for locator in candidates:
+            query = snapshot_query(locator)
+            node = snapshot.find_one(**query) if query else None
+            if node is not None:
+                return snapshot, node
+        return snapshot, None
+
+    def find(self, item, timeout=None):
+        # WebElement for "element" (logical name) or "locator" ([by, value]) of the step
+        timeout = item.get("timeout", DEFAULT_TIMEOUT) if timeout is None else timeout
+        if "locator" in item:
+            by, value = item["locator"]
+            return wait_for_element(self.driver, by, value, timeout, self.logger)
+        return wait_for_locator(self.locators, item["element"], timeout, self.logger)
+
+    def capture(self, event_type, details):
+        if self.screenshots is not None:
+            self.screenshots.capture(event_type, details)
+        else:
+            self.logger.log_event(event_type, details, self.driver.get_screenshot_as_base64())
+
+
+@action("find")
+def find_action(context, item):
+    element = context.find(item)
+    if item.get("event"):
+        context.logger.log_event(item["event"], {"element": item.get("element") or item.get("locator")})
+    return element
+
+
+@action("click")
+def click_action(context, item):
+    context.find(item).click()
+    context.screen_changed()
+    context.logger.log_event("element_clicked", {"element": item.get("element") or item.get("locator")})
+    if item.get("wait_for"):
+        wait_for_locator(context.locators, item["wait_for"], item.get("timeout", DEFAULT_TIMEOUT), context.logger)
+
+
+@action("wait")
+def wait_action(context, item):
+    timeout = item.get("timeout", DEFAULT_TIMEOUT)
+    required = not item.get("optional", False)
+    condition = item.get("condition", "element")
+    if condition == "element":
+        many = item.get("many", False)
+        if "locator" in item:
+            by, value = item["locator"]
+            return wait_for_element(context.driver, by, value, timeout, context.logger, required)
+        return wait_for_locator(context.locators, item["element"], timeout, context.logger, required, many)
+    if condition == "screen_stable":
+        return wait_for_screen_stable(context.driver, timeout, context.logger, required)
+    if condition == "visual_stable":
+        return wait_for_visual_stable(context.driver, timeout, context.logger, required,
+                                      max_distance=item.get("max_distance", 0))
+    if condition == "sleep":
+        time.sleep(item.get("seconds", 1))
+        return True
+    raise ValueError(f"Unknown wait condition: {condition}")
+
+
+@action("assert_attribute")
+def assert_attribute_action(context, item):
+    name, expected = item["attribute"], str(item["value"])
+    _, node = context.node(item)
+    if node.get(name) != expected and item.get("timeout"):
+        # State may still be changing, the element is polled until the timeout
+        wait_for_attribute(context.find(item), name, expected, item["timeout"], context.logger, required=False)
+        context.screen_changed()
+        _, node = context.node(item)
+    if node.get(name) != expected:
+        raise AssertionError(f"{name} of {item.get('element') or item.get('locator')} is "
+                             f"{node.get(name)!r}, expected {expected!r}")
+
+
+@action("remember_attribute")
+def remember_attribute_action(context, item):
+    snapshot, node = context.node(item)
+    value = node.get(item["attribute"])
+    context.variables[item["as"]] = value
+    if item.get("event"):
+        context.logger.log_event(item["event"], {"element": item.get("element"), "attribute": item["attribute"],
+                                                 "value": value, "details": snapshot.details(node)})
+    return value
+
+
+@action("ensure_attribute")
+def ensure_attribute_action(context, item):
+    # Clicks the element when the attribute differs (switches, checkboxes) and waits for the change,
+    # the WebElement is only looked up for that
+    name, expected = item["attribute"], str(item["value"])
+    snapshot, node = context.node(item)
+    previous = node.get(name)
+    if previous != expected:
+        element = context.find(item)
+        element.click()
+        context.screen_changed()
+        wait_for_attribute(element, name, expected, item.get("timeout", DEFAULT_TIMEOUT), context.logger)
+    if item.get("event"):
+        context.logger.log_event(item["event"], {"element": item.get("element"), "attribute": name,
+                                                 "previous": previous, "value": expected,
+                                                 "changed": previous != expected,
+                                                 "details": snapshot.details(node)})
+
+
+@action("capture")
+def capture_action(context, item):
+    context.capture(item.get("event", "capture"), item.get("details", {}))
+
+
+@action("back")
+def back_action(context, item):
+    # Page source of the step is fetched once, also for the hash before going back
+    previous_source = hashlib.sha1(context.page_source().encode()).hexdigest() if item.get("wait", True) else None
+    context.driver.back()
+    context.screen_changed()
+    context.logger.log_event("navigation", {"action": "back", "to": item.get("to")})
+    if previous_source is not None:
+        wait_for_page_source_change(context.driver, previous_source, item.get("timeout", 5), context.logger,
+                                    required=False)
+
+
+@action("reset_app")
+def reset_app_action(context, item):
+    context.screen_changed()
+    if not reset_app(context.driver, item.get("package", APP_PACKAGE)):
+        raise StepFailed(f"Could not restart {item.get('package', APP_PACKAGE)}")
+
+
+@action("log")
+def log_action(context, item):
+    context.logger.log_event(item["event"], item.get("details", {}))
+
+
+@action("collect_list")
+def collect_list_action(context, item):
+    # Reads a list (e.g. WiFi networks) from one page snapshot:
+    # "container" and "items" are PageSnapshot.find queries, "fields" maps
+    # field names to queries inside an item, the text of the match is the value
+    snapshot = context.snapshot(item.get("name", item.get("event")))
+    container = snapshot.find_one(**item["container"]) if item.get("container") else None
+    if item.get("container") and container is None:
+        raise StepFailed(f"List container {item['container']} not found")
+    exclude = [text.lower() for text in item.get("exclude", [])]
+    entries = []
+    for node in snapshot.find(within=container, **item["items"]):
+        entry = {}
+        for field, query in item.get("fields", {}).items():
+            field_node = snapshot.find_one(within=node, **query)
+            entry[field] = field_node.get("text") if field_node is not None else None
+        entry["content_desc"] = node.get("content-desc")
+        first = next(iter(entry.values()), None)
+        if not first or any(text in first.lower() for text in exclude):
+            continue
+        entries.append(entry)
+
+    if entries:
+        context.logger.log_event(item.get("event", "list_collected"), {"count": len(entries), "items": entries})
+    elif item.get("empty_event"):
+        context.logger.log_event(item["empty_event"], {"message": "No items found in the list"})
+    if item.get("as"):
+        context.variables[item["as"]] = len(entries)
+    if len(entries) < item.get("min_count", 0):
+        raise AssertionError(f"Found {len(entries)} list items, expected at least {item['min_count']}")
+    return entries
+
+
+class ScenarioEngine:
+    def __init__(self, driver, logger, locators=None, screenshots=None):
+        self.driver = driver
+        self.logger = logger
+        self.locators = locators if locators is not None else LocatorCache(driver, logger.log_dir, logger)
+        self.screenshots = screenshots
+        # Time spent in the engine itself (outside actions), shown by benchmarks
+        self.counters = {"scenarios": 0, "steps": 0, "retries": 0, "failed_steps": 0,
+                         "action_time": 0.0, "retry_time": 0.0, "engine_time": 0.0}
+
+    def run(self, scenario):
+        started = time.perf_counter()
+        action_time = self.counters["action_time"] + self.counters["retry_time"]
+        context = ScenarioContext(self.driver, self.logger, self.locators, self.screenshots)
+        name = scenario["name"]
+        self.logger.log_event("scenario_started", {
+            "scenario": name,
+            "steps": sum(len(scenario.get(phase, [])) for phase in PHASES)
+        })
+        print(f"Running scenario {name}...")
+        results = []
+        error = None
+        try:
+            for phase in ("setup", "steps"):
+                for index, item in enumerate(scenario.get(phase, [])):
+                    self.run_step(context, scenario, phase, index, item, results)
+        except StepFailed as e:
+            error = e
+            if context.session_error is not None:
+                # Nothing to capture from a dead session
+                self.logger.log_event("error", {"scenario": name, "message": str(e)})
+            else:
+                # Screen of the failure, the page source of the step is reused when the step fetched it
+                try:
+                    page_source = context.page_source()
+                except Exception as source_error:
+                    page_source = f"Page source not available: {source_error}"
+                context.capture("error", {"scenario": name, "message": str(e), "page_source": page_source})
+        finally:
+            # Teardown continues after failed steps, everything possible is restored
+            for index, item in enumerate(scenario.get("teardown", [])):
+                try:
+                    self.run_step(context, scenario, "teardown", index, item, results)
+                except StepFailed as e:
+                    error = error or e
+        # Also when only an optional step lost the session
+        error = error or context.session_error
+
+        duration = time.perf_counter() - started
+        engine_time = duration - (self.counters["action_time"] + self.counters["retry_time"] - action_time)
+        self.counters["scenarios"] += 1
+        self.counters["engine_time"] += engine_time
+        result = {
+            "scenario": name,
+            "status": "failed" if error else "passed",
+            "duration": round(duration, 3),
+            "engine_time": round(engine_time, 4),
+            "steps": len(results),
+            "error": str(error) if error else None
+        }
+        self.logger.log_event("scenario_finished", result)
+        print(f"Scenario {name} {result['status']} in {result['duration']}s")
+        return dict(result, results=results, variables=context.variables)
+
+    def run_all(self, scenarios, reset_between=True):
+        # Many scenarios in one session, the app is restarted between them
+        results = []
+        for index, item in enumerate(scenarios):
+            if index and reset_between:
+                reset_app(self.driver)
+            results.append(self.run(item))
+        return results
+
+    def run_step(self, context, scenario, phase, index, item, results):
+        started = time.perf_counter()
+        function = item if callable(item) else ACTIONS[item["action"]]
+        params = {} if callable(item) else item
+        retries = params.get("retries", scenario.get("retries", 0))
+        retry_delay = params.get("retry_delay", scenario.get("retry_delay", DEFAULT_RETRY_DELAY))
+        attempts = 0
+        error = None
+        status = "passed"
+        action_time = 0.0
+
+        try:
+            if context.session_error is not None:
+                resolved, status, error = None, "skipped", context.session_error
+            elif "when" in params and not context.check(params["when"]):
+                resolved, status = None, "skipped"
+            else:
+                resolved = params if callable(item) else context.resolve(params)
+        except MissingVariable as e:
+            # State was never remembered (e.g. setup failed earlier), nothing to restore
+            resolved, status, error = None, "skipped", e
+
+        while resolved is not None:
+            attempts += 1
+            if attempts > 1:
+                # The failed attempt may have left another screen
+                context.screen_changed()
+            action_start = time.perf_counter()
+            try:
+                function(context, resolved)
+                error = None
+            except Exception as e:
+                error = e
+            action_time += time.perf_counter() - action_start
+            if isinstance(error, SESSION_ERRORS):
+                # Retrying on a dead session only waits for the same error
+                context.session_error = error
+                break
+            if error is None or attempts > retries:
+                break
+            self.counters["retries"] += 1
+            self.counters["retry_time"] += retry_delay
+            time.sleep(retry_delay)
+
+        if callable(item) or item["action"] not in SCREEN_AWARE_ACTIONS:
+            context.screen_changed()
+        if error is not None and status != "skipped":
+            status = "optional_failed" if params.get("optional") else "failed"
+        self.counters["steps"] += 1
+        self.counters["action_time"] += action_time
+        details = {
+            "scenario": scenario["name"],
+            "phase": phase,
+            "index": index,
+            "step": params.get("name") or describe(item),
+            "status": status,
+            "attempts": attempts,
+            "duration": round(time.perf_counter() - started, 4)
+        }
+        if error is not None:
+            details["error"] = str(error)
+        self.logger.log_event("step_error" if status == "failed" else "step", details)
+        results.append(details)
+        if status == "failed":
+            self.counters["failed_steps"] += 1
+            raise StepFailed(f"{details['step']} ({phase}) failed: {error}") from error
+
+    def stats(self):
+        stats = dict(self.counters)
+        for name in ("action_time", "retry_time", "engine_time"):
+            stats[name] = round(stats[name], 4)
+        stats["engine_time_per_step"] = round(stats["engine_time"] / stats["steps"], 6) if stats["steps"] else None
+        return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check scenario files and list their steps")
+    parser.add_argument("paths", nargs="*", help="Scenario files (default: all in scenarios/)")
+    args = parser.parse_args()
+
+    try:
+        scenarios = [load_scenario(path) for path in args.paths] if args.paths else list(load_scenarios().values())
+    except (OSError, ValueError) as e:
+        parser.exit(1, f"Invalid scenario: {e}\n")
+    for item in scenarios:
+        print(f"{item['name']}: {item.get('description', '')}")
+        for phase in PHASES:
+            for index, entry in enumerate(item.get(phase, [])):
+                print(f"  {phase:<9} {index:>2}  {describe(entry)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+import io
+import threading
+import time
+
+import image_diff
+
+# Pillow is optional, without it screenshots are stored as PNG from the device
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Screenshots are captured by the test thread, so the image shows the screen of its
+# event. Decoding, optional downscaling / re-encoding and writing to the blob store
+# are done by background workers from a bounded queue. The event is logged by the
+# worker when the image is stored, with the time of the request. When the queue is
+# full, a screenshot identical to the newest pending one is coalesced with it, any
+# other waits for a free slot; with policy "drop" the event is logged without a
+# screenshot (and none is taken). Frames are diffed against the previous one
+# (image_diff.py) and logged in the order they were requested.
+FORMATS = {"png": ("PNG", "png"), "jpeg": ("JPEG", "jpg"), "jpg": ("JPEG", "jpg"), "webp": ("WEBP", "webp")}
+
+
+class ScreenshotPipeline:
+    def __init__(self, driver, logger, workers=2, max_queue=4, image_format="png", quality=80,
+                 max_width=None, policy="coalesce", diff=True):
+        if image_format not in FORMATS:
+            raise ValueError(f"Unsupported screenshot format: {image_format}")
+        self.driver = driver
+        self.logger = logger
+        self.max_queue = max_queue
+        # Re-encoding needs Pillow, without it the PNG from the device is kept
+        self.image_format = image_format if Image is not None else "png"
+        self.quality = quality
+        self.max_width = max_width if Image is not None else None
+        self.policy = policy
+        self.differ = image_diff.FrameDiffer() if diff and image_diff.available() else None
+        self.pending = []
+        self.condition = threading.Condition()
+        self.active = 0
+        self.closed = False
+        # Requests are numbered, workers store and log them in this order
+        self.next_sequence = 0
+        self.stored_sequence = 0
+        self.counters = {"requested": 0, "captured": 0, "coalesced": 0, "dropped": 0, "failed": 0,
+                         "png_bytes": 0, "stored_bytes": 0, "capture_time": 0.0, "encode_time": 0.0,
+                         "blocking_time": 0.0}
+        self.workers = [threading.Thread(target=self._work, name=f"screenshot-{index}", daemon=True)
+                        for index in range(workers)]
+        for worker in self.workers:
+            worker.start()
+
+    def capture(self, event_type, details):
+        # Takes the screenshot, the event with it is logged by a worker
+        start_time = time.time()
+        event = (event_type, details, start_time)
+        with self.condition:
+            self.counters["requested"] += 1
+            drop = self.policy == "drop" and len(self.pending) >= self.max_queue
+            if drop:
+                self.counters["dropped"] += 1
+        if drop:
+            self.logger.log_event(event_type, dict(details, screenshot_dropped=True), at=start_time)
+        else:
+            try:
+                png = self.driver.get_screenshot_as_png()
+                error = None
+            except Exception as e:
+                png, error = None, e
+            captured = time.time()
+            with self.condition:
+                self.counters["capture_time"] += captured - start_time
+                while True:
+                    if png is not None and self.pending and self.pending[-1]["png"] == png:
+                        # Same screen as the newest waiting screenshot, stored once
+                        self.pending[-1]["events"].append(event)
+                        self.counters["coalesced"] += 1
+                        break
+                    if len(self.pending) < self.max_queue:
+                        self.pending.append({"sequence": self.next_sequence, "events": [event],
+                                             "png": png, "error": error})
+                        self.next_sequence += 1
+                        self.condition.notify_all()
+                        break
+                    self.condition.wait()
+        with self.condition:
+            self.counters["blocking_time"] += time.time() - start_time
+
+    def _work(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.closed:
+                    self.condition.wait()
+                if not self.pending:
+                    return
+                job = self.pending.pop(0)
+                self.active += 1
+                # Test thread may wait for a free slot
+                self.condition.notify_all()
+            try:
+                self._process(job)
+            except Exception as e:
+                # Worker stays alive, later screenshots would wait forever otherwise
+                print(f"Screenshot could not be logged: {e}")
+            finally:
+                with self.condition:
+                    self.active -= 1
+                    self.condition.notify_all()
+
+    def _process(self, job):
+        events = job["events"]
+        png, error = job["png"], job["error"]
+        with self.condition:
+            while self.stored_sequence != job["sequence"]:
+                self.condition.wait()
+        try:
+            encode_start = time.time()
+            if error is None:
+                try:
+                    ref, diff, stored_bytes = self.store(png)
+                except Exception as e:
+                    # Image that cannot be decoded, full disk, ...: the events are kept without it
+                    error = e
+            if error is not None:
+                with self.condition:
+                    self.counters["failed"] += 1
+                for event_type, details, requested in events:
+                    self.logger.log_event(event_type, dict(details, screenshot_error=str(error)), at=requested)
+                return
+            with self.condition:
+                self.counters["captured"] += 1
+                self.counters["png_bytes"] += len(png)
+                self.counters["stored_bytes"] += stored_bytes
+                self.counters["encode_time"] += time.time() - encode_start
+            for event_type, details, requested in events:
+                self.logger.log_event(event_type, details, screenshot_ref=ref, screenshot_diff=diff, at=requested)
+        finally:
+            with self.condition:
+                self.stored_sequence += 1
+                self.condition.notify_all()
+
+    def store(self, png):
+        # Returns blob reference for the event, diff details (None without diff) and stored size
+        blob_store = self.logger.blob_store
+        if self.image_format == "png" and not self.max_width and self.differ is None:
+            return blob_store.put_bytes(png, "png"), None, len(png)
+
+        with Image.open(io.BytesIO(png)) as image:
+            resized = bool(self.max_width and image.width > self.max_width)
+            if resized:
+                image.thumbnail((self.max_width, image.height * self.max_width // image.width + 1))
+            if self.differ is None:
+                data, ext = self.encode(image)
+                return blob_store.put_bytes(data, ext), None, len(data)
+
+            diff = self.differ.compare(image)
+            data = b""
+            ref = None
+            if diff["kind"] == "keyframe":
+                # PNG from the device is kept as it is when it does not have to be converted
+                data, ext = (png, "png") if self.image_format == "png" and not resized else self.encode(image)
+                ref = blob_store.put_bytes(data, ext)
+            elif diff["kind"] == "patch":
+                data, ext = self.encode(diff["patch_image"])
+                ref = blob_store.put_bytes(data, ext)
+            screenshot_ref, details = self.differ.stored(diff, ref)
+            return screenshot_ref, details, len(data)
+
+    def encode(self, image):
+        pil_format, ext = FORMATS[self.image_format]
+        if pil_format == "JPEG":
+            image = image.convert("RGB")
+        buffer = io.BytesIO()
+        if pil_format == "PNG":
+            image.save(buffer, pil_format)
+        else:
+            image.save(buffer, pil_format, quality=self.quality)
+        return buffer.getvalue(), ext
+
+    def flush(self, timeout=30):
+        # Waits until all requested screenshots are stored
+        deadline = time.time() + timeout
+        with self.condition:
+            while self.pending or self.active:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+        return True
+
+    def close(self, timeout=30):
+        finished = self.flush(timeout)
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        for worker in self.workers:
+            worker.join(max(timeout, 0.1) if finished else 0.1)
+        return finished
+
+    def stats(self):
+        with self.condition:
+            stats = dict(self.counters)
+        for name in ("capture_time", "encode_time", "blocking_time"):
+            stats[name] = round(stats[name], 3)
+        stats["format"] = self.image_format
+        if self.differ is not None:
+            stats.update(self.differ.stats())
+        stats["saved_bytes"] = stats["png_bytes"] - stats["stored_bytes"]
+        return stats
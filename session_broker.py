@@ -0,0 +1,201 @@
+import argparse
+import json
+import os
+import threading
+import time
+
+from appium import webdriver
+from appium.options.android import UiAutomator2Options
+
+# Keeps Appium sessions alive between test runs. Session id and capabilities of every
+# device are stored in sessions.json in the log folder, the next run attaches to the
+# running session instead of creating a new one (UiAutomator2 server start and app
+# launch take several seconds on real devices). Before a session is handed out it is
+# health-checked, dead or too old sessions are replaced by a new one and the app is
+# restarted, so every run still starts from the main Settings screen.
+SESSIONS_FILE_NAME = "sessions.json"
+APP_PACKAGE = "com.android.settings"
+# Appium closes sessions without commands after newCommandTimeout seconds,
+# it has to cover the time between two runs
+NEW_COMMAND_TIMEOUT = 3600
+# Sessions older than this are recycled, long running UiAutomator2 sessions get slow
+MAX_SESSION_AGE = 4 * 3600
+
+# Several runner threads can share one sessions file
+sessions_file_lock = threading.Lock()
+MODULE_LOADED = time.time()
+
+
+def process_start_time():
+    # Wall clock time when this process was started, interpreter start and imports included
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - uptime + start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, AttributeError):
+        # No /proc (Windows, macOS), first import of this module is close enough
+        return MODULE_LOADED
+
+
+def reset_app(driver, app_package=APP_PACKAGE):
+    # Start from the main Settings screen, also after a failed run
+    try:
+        driver.terminate_app(app_package)
+        driver.activate_app(app_package)
+        return True
+    except Exception as e:
+        print(f"Could not restart {app_package}: {e}")
+        return False
+
+
+class AttachedRemote(webdriver.Remote):
+    # Remote driver for an existing session, start_session attaches instead of creating
+    def __init__(self, command_executor, session_id, capabilities, options):
+        self.attach_session_id = session_id
+        self.attach_capabilities = capabilities
+        super().__init__(command_executor, options=options)
+
+    def start_session(self, capabilities, browser_profile=None):
+        self.session_id = self.attach_session_id
+        self.caps = self.attach_capabilities
+
+
+class SessionBroker:
+    def __init__(self, log_dir="appium_logs", new_command_timeout=NEW_COMMAND_TIMEOUT,
+                 max_age=MAX_SESSION_AGE, app_package=APP_PACKAGE):
+        self.sessions_file = os.path.join(log_dir, SESSIONS_FILE_NAME)
+        self.new_command_timeout = new_command_timeout
+        self.max_age = max_age
+        self.app_package = app_package
+        # Information about the last acquire, logged as startup metrics
+        self.last_acquire = None
+
+    def _load(self):
+        try:
+            with open(self.sessions_file) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _update(self, key, entry):
+        # Merge with the file, other devices may have written it meanwhile
+        with sessions_file_lock:
+            data = self._load()
+            if entry is None:
+                data.pop(key, None)
+            else:
+                data[key] = entry
+            os.makedirs(os.path.dirname(self.sessions_file) or ".", exist_ok=True)
+            tmp_path = f"{self.sessions_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp_path, self.sessions_file)
+
+    def session_key(self, appium_url, options):
+        capabilities = options.to_capabilities()
+        device = (capabilities.get("appium:udid") or capabilities.get("udid")
+                  or capabilities.get("appium:deviceName") or capabilities.get("deviceName", "default"))
+        return f"{appium_url}|{device}"
+
+    def _attach(self, appium_url, stored, options):
+        # None when the session does not exist any more or the device does not respond
+        try:
+            driver = AttachedRemote(appium_url, stored["session_id"], stored["capabilities"], options)
+            driver.current_package
+            return driver
+        except Exception as e:
+            print(f"Stored session {stored['session_id']} is not usable: {e}")
+            return None
+
+    def acquire(self, appium_url, options):
+        if "appium:newCommandTimeout" not in options.to_capabilities():
+            options.set_capability("appium:newCommandTimeout", self.new_command_timeout)
+        key = self.session_key(appium_url, options)
+        started = time.time()
+        stored = self._load().get(key)
+        driver = None
+        recycle_reason = None
+
+        if stored is None:
+            recycle_reason = "no stored session"
+        elif time.time() - stored["created"] > self.max_age:
+            recycle_reason = "session too old"
+            old_driver = self._attach(appium_url, stored, options)
+            if old_driver is not None:
+                self._quit(old_driver)
+        else:
+            driver = self._attach(appium_url, stored, options)
+            if driver is None:
+                recycle_reason = "health check failed"
+            elif not reset_app(driver, self.app_package):
+                recycle_reason = "app reset failed"
+                self._quit(driver)
+                driver = None
+
+        reused = driver is not None
+        if driver is None:
+            driver = webdriver.Remote(appium_url, options=options)
+            stored = {"session_id": driver.session_id, "capabilities": driver.capabilities,
+                      "created": time.time(), "runs": 0}
+        stored["runs"] += 1
+        stored["last_used"] = time.time()
+        self._update(key, stored)
+
+        self.last_acquire = {
+            "session_id": driver.session_id,
+            "session_reused": reused,
+            "recycle_reason": recycle_reason,
+            "session_runs": stored["runs"],
+            "session_age": round(time.time() - stored["created"], 2),
+            "acquire_time": round(time.time() - started, 3)
+        }
+        return driver
+
+    def release(self, driver):
+        # Session stays open for the next run
+        for key, stored in self._load().items():
+            if stored["session_id"] == driver.session_id:
+                stored["last_used"] = time.time()
+                self._update(key, stored)
+
+    def discard(self, driver):
+        # Broken session, next acquire creates a new one
+        for key, stored in self._load().items():
+            if stored["session_id"] == driver.session_id:
+                self._update(key, None)
+        self._quit(driver)
+
+    def _quit(self, driver):
+        try:
+            driver.quit()
+        except Exception as e:
+            print(f"Could not close session {driver.session_id}: {e}")
+
+    def close_all(self):
+        for key, stored in self._load().items():
+            driver = self._attach(key.split("|", 1)[0], stored, UiAutomator2Options())
+            if driver is not None:
+                self._quit(driver)
+            self._update(key, None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List or close Appium sessions kept for reuse")
+    parser.add_argument("command", choices=["list", "close-all"])
+    parser.add_argument("--log-dir", default="appium_logs")
+    args = parser.parse_args()
+
+    broker = SessionBroker(args.log_dir)
+    if args.command == "close-all":
+        broker.close_all()
+        print("All stored sessions were closed")
+        return
+    for key, stored in broker._load().items():
+        print(f"{key:<50} {stored['session_id']}  runs: {stored['runs']}  "
+              f"age: {time.time() - stored['created']:.0f}s  idle: {time.time() - stored['last_used']:.0f}s")
+
+
+if __name__ == "__main__":
+    main()
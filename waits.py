@@ -0,0 +1,128 @@
+import hashlib
+import time
+
+from selenium.common.exceptions import InvalidSessionIdException
+from urllib3.exceptions import HTTPError
+
+from image_diff import hashes_match, screenshot_hash
+
+# Condition based waits used instead of fixed time.sleep calls.
+# Conditions are polled with growing interval (fast devices finish after the first
+# polls, slow ones are not flooded with requests) and every wait is logged
+# as "wait" event with the time it actually needed.
+DEFAULT_TIMEOUT = 10.0
+INITIAL_INTERVAL = 0.1
+MAX_INTERVAL = 1.0
+BACKOFF = 1.5
+# The session or the connection to Appium is gone, polling cannot succeed any more:
+# waits and step retries stop at once (parallel_runner.py starts a new session)
+SESSION_ERRORS = (InvalidSessionIdException, HTTPError, OSError)
+
+
+class WaitTimeout(Exception):
+    pass
+
+
+def wait_until(condition, description, timeout=DEFAULT_TIMEOUT, logger=None, required=True,
+               initial_interval=INITIAL_INTERVAL, max_interval=MAX_INTERVAL, backoff=BACKOFF):
+    # condition returns a truthy value when done, exceptions count as "not yet"
+    start_time = time.time()
+    interval = initial_interval
+    polls = 0
+    last_error = None
+    result = None
+
+    while True:
+        polls += 1
+        try:
+            result = condition()
+            last_error = None
+        except SESSION_ERRORS as e:
+            result = None
+            last_error = e
+            break
+        except Exception as e:
+            result = None
+            last_error = e
+        if result:
+            break
+        remaining = timeout - (time.time() - start_time)
+        if remaining <= 0:
+            break
+        time.sleep(min(interval, remaining))
+        interval = min(interval * backoff, max_interval)
+
+    duration = round(time.time() - start_time, 3)
+    if logger is not None:
+        details = {
+            "condition": description,
+            "success": bool(result),
+            "duration": duration,
+            "polls": polls,
+            "timeout": timeout
+        }
+        if last_error is not None and not result:
+            details["last_error"] = str(last_error)
+        logger.log_event("wait", details)
+
+    if isinstance(last_error, SESSION_ERRORS):
+        raise last_error
+    if not result and required:
+        raise WaitTimeout(f"Timed out after {timeout}s waiting for {description}")
+    return result
+
+
+def wait_for_element(driver, by, value, timeout=DEFAULT_TIMEOUT, logger=None, required=True):
+    def condition():
+        elements = driver.find_elements(by=by, value=value)
+        return elements[0] if elements else None
+
+    return wait_until(condition, f"element {value}", timeout, logger, required)
+
+
+def wait_for_attribute(element, name, expected, timeout=DEFAULT_TIMEOUT, logger=None, required=True):
+    return wait_until(lambda: element.get_attribute(name) == expected,
+                      f"attribute {name} == {expected!r}", timeout, logger, required)
+
+
+def page_source_hash(driver):
+    return hashlib.sha1(driver.page_source.encode()).hexdigest()
+
+
+def wait_for_page_source_change(driver, previous_hash, timeout=DEFAULT_TIMEOUT, logger=None, required=True):
+    # previous_hash is page_source_hash(driver) taken before the action
+    return wait_until(lambda: page_source_hash(driver) != previous_hash,
+                      "page source change", timeout, logger, required)
+
+
+def wait_for_screen_stable(driver, timeout=DEFAULT_TIMEOUT, logger=None, required=True, stable_polls=2):
+    # Screen is stable when the page source did not change for stable_polls polls in row
+    state = {"hash": None, "same": 0}
+
+    def condition():
+        current = page_source_hash(driver)
+        state["same"] = state["same"] + 1 if current == state["hash"] else 0
+        state["hash"] = current
+        return state["same"] >= stable_polls
+
+    return wait_until(condition, "stable screen", timeout, logger, required)
+
+
+def wait_for_visual_stable(driver, timeout=DEFAULT_TIMEOUT, logger=None, required=True, stable_polls=2, max_distance=0):
+    # Like wait_for_screen_stable, but compares perceptual hashes of screenshots,
+    # so it also waits for animations which do not change the page source
+    state = {"hash": None, "same": 0}
+
+    def condition():
+        current = screenshot_hash(driver.get_screenshot_as_png())
+        state["same"] = state["same"] + 1 if hashes_match(current, state["hash"], max_distance) else 0
+        state["hash"] = current
+        return state["same"] >= stable_polls
+
+    return wait_until(condition, "stable screenshot", timeout, logger, required)
+
+
+def wait_for_locator(locators, element, timeout=DEFAULT_TIMEOUT, logger=None, required=True, many=False):
+    # Same as wait_for_element, but with logical element from LocatorCache
+    return wait_until(lambda: locators.find(element, many=many, required=False),
+                      f"element {element}", timeout, logger, required)